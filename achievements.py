@@ -0,0 +1,263 @@
+"""Running collection counters and declarative achievement rules.
+
+``user["stats"]`` keeps aggregates of ``user["cards"]`` so achievement checks
+and the profile never rescan the whole collection::
+
+    {"v": 4, "total": 512, "distinct": 230, "rares": 41,
+     "dups": {"2": 30, "3": 12},     # distinct cards owned exactly n >= 2 times
+     "sets": {"sv1": 120, ...},      # distinct cards owned per set
+     "bits": {"sv1": 0b1011...},     # bit n set = card number n of the set owned
+                                     # (prefixed numbers like RC1 or TG05 are not in it)
+     "usd": 431.5,                   # collection value
+     "top": [[12.3, "sv1-5"], ...],  # min-heap of the most valuable card ids
+     "pv": "9f2c41aa:3"}             # catalog price version of usd/top
+
+Collection changes go through :func:`add_cards` / :func:`remove_cards`, which
+update the counters in O(1) per card id (O(log n) for the top heap). Missing
+or stale counters are rebuilt once from the collection by
+:func:`ensure_stats`. Price changes in the catalog are applied lazily, on
+the next access, from the catalog's change log (O(changes)); only when that
+log no longer covers them is the value recomputed over the collection.
+
+A rule is ``(code, metric, target)``: the achievement ``code`` is granted
+once ``values[metric] >= target``. ``target`` is a number or the name of
+another value (e.g. the number of all sets).
+"""
+
+import heapq
+
+from catalog import CardCatalog, add_card, card_number, card_set_id, remove_card
+
+STATS_VERSION = 4
+RARE = "Rare"
+# Cards kept in the top heap; it is refilled when fewer than requested remain
+TOP_KEEP = 20
+
+
+def rebuild_stats(user: dict, catalog: CardCatalog) -> dict:
+    """Recompute ``user["stats"]`` from the whole collection."""
+    stats = {
+        "v": STATS_VERSION,
+        "total": 0,
+        "distinct": 0,
+        "rares": 0,
+        "dups": {},
+        "sets": {},
+        "bits": {},
+        "usd": 0.0,
+        "top": [],
+        "pv": catalog.price_version,
+    }
+    for cid, n in user["cards"].items():
+        _move(stats, catalog, cid, 0, n)
+    user["stats"] = stats
+    return stats
+
+
+def rebuild_value(stats: dict, user: dict, catalog: CardCatalog):
+    """Recompute the collection value and top heap at the current prices."""
+    prices = {cid: catalog.price(cid) for cid in user["cards"]}
+    stats["usd"] = sum(prices[cid] * n for cid, n in user["cards"].items())
+    top = [[price, cid] for cid, price in prices.items()]
+    stats["top"] = heapq.nlargest(TOP_KEEP, top)
+    heapq.heapify(stats["top"])
+    stats["pv"] = catalog.price_version
+
+
+def ensure_stats(user: dict, catalog: CardCatalog) -> dict:
+    """Return the user's counters, rebuilding them when missing or out of date."""
+    stats = user.get("stats")
+    if not stats or stats.get("v") != STATS_VERSION or stats.get("distinct") != len(user["cards"]):
+        stats = rebuild_stats(user, catalog)
+    elif stats.get("pv") != catalog.price_version:
+        _sync_prices(stats, user, catalog)
+    return stats
+
+
+def _sync_prices(stats: dict, user: dict, catalog: CardCatalog):
+    """Apply the catalog price changes made since ``stats["pv"]``."""
+    changes = catalog.price_changes_since(stats.get("pv"))
+    if changes is None:
+        rebuild_value(stats, user, catalog)
+        return
+    cards = user["cards"]
+    for cid, old, new in changes:
+        n = cards.get(cid)
+        if not n:
+            continue
+        stats["usd"] += (new - old) * n
+        # Re-offer the card at its new price; the heap invariant is kept
+        _drop_top(stats, cid)
+        top = stats["top"]
+        if not top or new > top[0][0] or len(top) == stats["distinct"] - 1:
+            if len(top) < TOP_KEEP:
+                heapq.heappush(top, [new, cid])
+            elif new > top[0][0]:
+                heapq.heapreplace(top, [new, cid])
+    stats["pv"] = catalog.price_version
+
+
+def _bump(counter: dict, key: str, delta: int):
+    left = counter.get(key, 0) + delta
+    if left > 0:
+        counter[key] = left
+    else:
+        counter.pop(key, None)
+
+
+def _track_top(stats: dict, card_id: str, price: float):
+    """Offer a newly owned card to the top heap.
+
+    The heap always holds the ``len(top)`` most valuable cards, so a cheaper
+    card may only join when every other owned card is already in it.
+    """
+    top = stats["top"]
+    if len(top) < TOP_KEEP and (len(top) == stats["distinct"] - 1 or price > top[0][0]):
+        heapq.heappush(top, [price, card_id])
+    elif top and price > top[0][0]:
+        heapq.heapreplace(top, [price, card_id])
+
+
+def _drop_top(stats: dict, card_id: str):
+    top = stats["top"]
+    for i, (_, cid) in enumerate(top):
+        if cid == card_id:
+            top[i] = top[-1]
+            top.pop()
+            heapq.heapify(top)
+            return
+
+
+def _move(stats: dict, catalog: CardCatalog, card_id: str, before: int, after: int):
+    """Account for ``card_id`` going from ``before`` to ``after`` copies."""
+    if before == after:
+        return
+    price = catalog.price(card_id)
+    stats["total"] += after - before
+    stats["usd"] += price * (after - before)
+    if before >= 2:
+        _bump(stats["dups"], str(before), -1)
+    if after >= 2:
+        _bump(stats["dups"], str(after), 1)
+    if before and after:
+        return
+    delta = 1 if after else -1
+    stats["distinct"] += delta
+    if catalog.rarity(card_id) == RARE:
+        stats["rares"] += delta
+    set_id = card_set_id(card_id)
+    _bump(stats["sets"], set_id, delta)
+    number = card_number(card_id)
+    if number is not None:
+        bits = stats["bits"].get(set_id, 0)
+        bits = bits | (1 << number) if after else bits & ~(1 << number)
+        if bits:
+            stats["bits"][set_id] = bits
+        else:
+            stats["bits"].pop(set_id, None)
+    if after:
+        _track_top(stats, card_id, price)
+    else:
+        _drop_top(stats, card_id)
+
+
+def add_cards(user: dict, catalog: CardCatalog, card_id: str, count: int = 1):
+    """:func:`catalog.add_card` that keeps ``user["stats"]`` up to date."""
+    stats = ensure_stats(user, catalog)
+    before = user["cards"].get(card_id, 0)
+    add_card(user, card_id, count)
+    _move(stats, catalog, card_id, before, before + count)
+
+
+def remove_cards(user: dict, catalog: CardCatalog, card_id: str, count: int = 1) -> int:
+    """:func:`catalog.remove_card` that keeps ``user["stats"]`` up to date."""
+    stats = ensure_stats(user, catalog)
+    before = user["cards"].get(card_id, 0)
+    removed = remove_card(user, card_id, count)
+    _move(stats, catalog, card_id, before, before - removed)
+    return removed
+
+
+def _numbered(total: int) -> int:
+    """Mask of card numbers ``1..total``."""
+    return (1 << (total + 1)) - 2 if total > 0 else 0
+
+
+def set_owned(user: dict, catalog: CardCatalog, set_id: str) -> int:
+    """Distinct cards owned from a set, prefixed and secret numbers included.
+
+    This is the set's completion count; the bitmap only lists plain numbers.
+    """
+    return ensure_stats(user, catalog)["sets"].get(set_id, 0)
+
+
+def _numbers(bits: int) -> list[int]:
+    result = []
+    while bits:
+        low = bits & -bits
+        result.append(low.bit_length() - 1)
+        bits ^= low
+    return result
+
+
+def owned_numbers(user: dict, catalog: CardCatalog, set_id: str) -> list[int]:
+    """Sorted collector numbers owned from a set."""
+    return _numbers(ensure_stats(user, catalog)["bits"].get(set_id, 0))
+
+
+def missing_numbers(user: dict, catalog: CardCatalog, set_id: str, total: int) -> list[int]:
+    """Sorted numbers ``1..total`` of a set that the user does not own."""
+    bits = ensure_stats(user, catalog)["bits"].get(set_id, 0)
+    return _numbers(~bits & _numbered(total))
+
+
+def valuation(user: dict, catalog: CardCatalog, top: int = 5) -> dict:
+    """Counters with ``usd`` and at least ``top`` top cards valid at current prices."""
+    stats = ensure_stats(user, catalog)
+    if len(stats["top"]) < min(top, stats["distinct"]):
+        rebuild_value(stats, user, catalog)
+    return stats
+
+
+def top_cards(user: dict, catalog: CardCatalog, n: int = 5) -> list[tuple[str, float, int]]:
+    """The ``n`` most valuable owned cards as ``(card_id, price_usd, count)``."""
+    stats = valuation(user, catalog, n)
+    best = sorted(stats["top"], reverse=True)[:n]
+    return [(cid, price, user["cards"][cid]) for price, cid in best]
+
+
+def collection_metrics(stats: dict) -> dict:
+    """Achievement metrics derived from the counters."""
+    dups = stats["dups"]
+    if dups:
+        max_duplicate = max(map(int, dups))
+    else:
+        max_duplicate = 1 if stats["distinct"] else 0
+    return {
+        "cards": stats["total"],
+        "rares": stats["rares"],
+        "max_duplicate": max_duplicate,
+        "duplicated_cards": sum(dups.values()),
+        "sets": len(stats["sets"]),
+    }
+
+
+def rule_target(target, values: dict) -> int:
+    return values.get(target, 0) if isinstance(target, str) else target
+
+
+def evaluate(user: dict, rules, values: dict, grant) -> list:
+    """Grant every rule reached by ``values`` and return the new codes.
+
+    Rules whose metric is not in ``values`` are skipped, so callers only
+    check what they changed. ``grant(user, code)`` returns True when new.
+    """
+    owned = set(user.get("achievements", []))
+    new_codes = []
+    for code, metric, target in rules:
+        if code in owned or metric not in values:
+            continue
+        goal = rule_target(target, values)
+        if goal > 0 and values[metric] >= goal and grant(user, code):
+            new_codes.append(code)
+    return new_codes
@@ -0,0 +1,51 @@
+"""Walker's alias method for O(1) weighted sampling."""
+
+import random
+
+
+class AliasTable:
+    """Sample ``items`` proportionally to ``weights`` in constant time.
+
+    Building the table (Vose's variant) is O(n); every draw then costs one
+    index pick and one biased coin flip regardless of the number of items.
+    """
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        n = len(self.items)
+        if n != len(weights):
+            raise ValueError("items and weights differ in length")
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("alias table needs a positive total weight")
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # Leftovers are 1.0 up to rounding errors
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+    def sample_many(self, k: int, rng=random) -> list:
+        items, prob, alias = self.items, self.prob, self.alias
+        n = len(items)
+        result = []
+        for _ in range(k):
+            i = int(rng.random() * n)
+            result.append(items[i] if rng.random() < prob[i] else items[alias[i]])
+        return result
@@ -0,0 +1,236 @@
+"""Local booster pack generation.
+
+:class:`BoosterEngine` draws whole packs synchronously from the cards indexed
+in the :class:`~catalog.CardCatalog`; the open path never touches the
+network. The rarity of every slot comes from a cached alias table per set
+and boost mode, rebuilt only when the cards of the set change. Sets that are not cached yet are queued for a background refill and
+the caller waits for that refill instead of querying the API inline.
+"""
+
+import asyncio
+import random
+from collections import Counter
+
+from alias import AliasTable
+
+GOD_PACK_CHANCE = 0.005
+GOD_PACK_RARITIES = (
+    "Hyper Rare",
+    "Special Illustration Rare",
+    "Illustration Rare",
+    "Ultra Rare",
+    "Double Rare",
+)
+# (rarity, base probability) tried in order; the first hit fills the slot
+RARE_SLOTS = (
+    ("Ultra Rare", 0.12),
+    ("Double Rare", 0.25),
+    ("Rare", 0.75),
+)
+IR_SLOTS = (
+    ("Hyper Rare", 0.01),
+    ("Special Illustration Rare", 0.02),
+    ("Illustration Rare", 0.07),
+)
+BOOST_BEST_CHANCE = 0.30
+COMMON_RARITIES = ("Common", "Uncommon")
+
+
+def _binomial(n: int, p: float, rng) -> int:
+    """Number of successes in ``n`` trials with probability ``p``."""
+    if n <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    return rng.choices((1, 0), (p, 1 - p), k=n).count(1)
+
+
+class BoosterEngine:
+    """Draw booster packs from the local card catalog."""
+
+    def __init__(self, catalog, *, refill_timeout: float = 120.0):
+        self.catalog = catalog
+        self.refill_timeout = refill_timeout
+        self._queue = asyncio.Queue()
+        self._pending = {}
+        self._samplers = {}
+
+    def _pick(self, set_id: str, rarity: str, count: int, rng) -> list:
+        found = self.catalog.cards_of(set_id, rarity)
+        return rng.sample(found, min(count, len(found)))
+
+    def _slot(self, set_id: str, slots, boost: bool, rng) -> list:
+        table = self.sampler(set_id, slots, boost)
+        rarity = table.sample(rng) if table else None
+        if rarity is None:
+            return []
+        return [rng.choice(self.catalog.cards_of(set_id, rarity))]
+
+    def draw(self, set_id: str, *, boost: bool = False, rng=random) -> list | None:
+        """Draw one pack, or return ``None`` when the set is not cached."""
+        if not self.catalog.has_set(set_id):
+            return None
+
+        if rng.random() < GOD_PACK_CHANCE:
+            result = []
+            for _ in range(10):
+                for rarity in GOD_PACK_RARITIES:
+                    card = self._pick(set_id, rarity, 1, rng)
+                    if card:
+                        result += card
+                        break
+            return result
+
+        result = []
+        extra_best = 0
+        if boost and rng.random() < BOOST_BEST_CHANCE:
+            best = self.catalog.most_expensive(set_id)
+            if best:
+                result.append(best)
+                extra_best = 1
+
+        result += self._pick(set_id, "Common", 4, rng)
+        result += self._pick(set_id, "Uncommon", 3, rng)
+        rare_iterations = 2 + (1 if boost else 0)
+        for _ in range(rare_iterations):
+            result += self._slot(set_id, RARE_SLOTS, boost, rng)
+        ir_iterations = 1 + (1 if boost else 0)
+        for _ in range(ir_iterations):
+            result += self._slot(set_id, IR_SLOTS, boost, rng)
+
+        commons = [c for c in result if c.get("rarity") in COMMON_RARITIES]
+        rares = [c for c in result if c.get("rarity") not in COMMON_RARITIES]
+        rng.shuffle(commons)
+        extra_slots = (rare_iterations - 2) + (ir_iterations - 1) + extra_best
+        return (commons + rares)[: 10 + extra_slots]
+
+    def slot_outcomes(self, set_id: str, slots, boost: bool) -> tuple[list, list]:
+        """Exact distribution of one slot: ``(rarities, weights)``.
+
+        Rarities are tried in order and those with no cached cards are
+        skipped; the remaining probability falls back to ``"Common"``, or to
+        ``None`` (no card) when the set has no commons either.
+        """
+        rarities, weights = [], []
+        miss = 1.0
+        for rarity, base_prob in slots:
+            if not self.catalog.cards_of(set_id, rarity):
+                continue
+            prob = min(1.0, base_prob * 2) if boost else base_prob
+            rarities.append(rarity)
+            weights.append(miss * prob)
+            miss *= 1 - prob
+        if miss > 0:
+            rarities.append("Common" if self.catalog.cards_of(set_id, "Common") else None)
+            weights.append(miss)
+        return rarities, weights
+
+    def sampler(self, set_id: str, slots, boost: bool) -> AliasTable | None:
+        """Cached alias table over :meth:`slot_outcomes`."""
+        key = (set_id, slots, boost)
+        version = self.catalog.versions.get(set_id)
+        cached = self._samplers.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        rarities, weights = self.slot_outcomes(set_id, slots, boost)
+        table = AliasTable(rarities, weights) if rarities else None
+        self._samplers[key] = (version, table)
+        return table
+
+    def _bulk_slots(self, set_id: str, slots, boost: bool, n: int, counts: Counter, rng):
+        table = self.sampler(set_id, slots, boost)
+        if table is None or n <= 0:
+            return
+        for rarity, hits in Counter(table.sample_many(n, rng)).items():
+            if rarity is None:
+                continue
+            pool = self.catalog.cards_of(set_id, rarity)
+            counts.update(c["id"] for c in rng.choices(pool, k=hits))
+
+    def _bulk_pick(self, set_id: str, rarity: str, per_pack: int, packs: int, counts: Counter, rng):
+        pool = self.catalog.cards_of(set_id, rarity)
+        k = min(per_pack, len(pool))
+        if not k:
+            return
+        ids = [c["id"] for c in pool]
+        if k == len(ids):
+            # Every card of the rarity is in every pack
+            for cid in ids:
+                counts[cid] += packs
+            return
+        # Without replacement inside a pack, so this stays one sample per pack
+        for _ in range(packs):
+            counts.update(rng.sample(ids, k))
+
+    def draw_bulk(self, set_id: str, count: int, *, boosted: int = 0, rng=random) -> Counter | None:
+        """Draw ``count`` packs at once (the first ``boosted`` with a boost).
+
+        Returns ``{card_id: copies}`` over all packs, or ``None`` when the set
+        is not cached. The distribution of every slot matches :meth:`draw`, but
+        slots are sampled in batches instead of pack by pack.
+        """
+        if not self.catalog.has_set(set_id):
+            return None
+        counts = Counter()
+        for boost, packs in ((True, min(boosted, count)), (False, count - min(boosted, count))):
+            gods = _binomial(packs, GOD_PACK_CHANCE, rng)
+            if gods:
+                for rarity in GOD_PACK_RARITIES:
+                    pool = self.catalog.cards_of(set_id, rarity)
+                    if pool:
+                        counts.update(c["id"] for c in rng.choices(pool, k=10 * gods))
+                        break
+            packs -= gods
+            if packs <= 0:
+                continue
+            if boost:
+                best = self.catalog.most_expensive(set_id)
+                hits = _binomial(packs, BOOST_BEST_CHANCE, rng)
+                if best and hits:
+                    counts[best["id"]] += hits
+            self._bulk_pick(set_id, "Common", 4, packs, counts, rng)
+            self._bulk_pick(set_id, "Uncommon", 3, packs, counts, rng)
+            self._bulk_slots(set_id, RARE_SLOTS, boost, packs * (3 if boost else 2), counts, rng)
+            self._bulk_slots(set_id, IR_SLOTS, boost, packs * (2 if boost else 1), counts, rng)
+        return counts
+
+    def request(self, set_id: str) -> asyncio.Future:
+        """Queue a background refill of ``set_id``; repeated requests share one future."""
+        fut = self._pending.get(set_id)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[set_id] = fut
+            self._queue.put_nowait(set_id)
+        return fut
+
+    async def ensure(self, set_id: str) -> bool:
+        """Wait until ``set_id`` is cached, refilling it in the background if needed."""
+        if self.catalog.has_set(set_id):
+            return True
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.request(set_id)), self.refill_timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    async def open(self, set_id: str, *, boost: bool = False, rng=random) -> list:
+        """Draw a pack, waiting for a background refill if the set is missing."""
+        await self.ensure(set_id)
+        return self.draw(set_id, boost=boost, rng=rng) or []
+
+    async def open_bulk(self, set_id: str, count: int, *, boosted: int = 0, rng=random) -> Counter:
+        """:meth:`draw_bulk`, waiting for a background refill if the set is missing."""
+        await self.ensure(set_id)
+        return self.draw_bulk(set_id, count, boosted=boosted, rng=rng) or Counter()
+
+    async def run_refill(self, fetch_set):
+        """Worker loop: ``await fetch_set(set_id)`` for every queued set."""
+        while True:
+            set_id = await self._queue.get()
+            try:
+                await fetch_set(set_id)
+            except Exception as e:
+                print(f"❌ Nie udało się pobrać kart setu {set_id}: {e}")
+            finally:
+                fut = self._pending.pop(set_id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(self.catalog.has_set(set_id))
@@ -3,22 +3,72 @@ from discord import app_commands
 from discord.ui import View, Button, Modal, TextInput, select, Select
 from giveaway import GiveawayModal, GiveawayView, parse_time_string
 from poke_utils import (
-    load_users,
-    save_users,
-    get_all_sets,
+    aload_users,
+    aload_user,
+    afind_user_by_name,
+    edit_user,
+    edit_users,
+    update_user,
+    create_user,
+    flush_users,
+    abarrier_users,
+    run_user_flusher,
+    aget_all_sets,
+    asave_sets,
     ensure_user_fields,
-    load_prices,
-    load_data,
-    save_data,
-    load_events,
-    save_events,
-    active_event_types,
+    aload_prices,
+    aload_data,
+    asave_data,
+    aload_events,
+    asave_events,
+    aactive_event_types,
+    get_card_catalog,
+    asave_card_catalog,
+    get_weekly_board,
+    asave_weekly_board,
+    run_io_read,
+    run_io_write,
     EMBED_COLOR,
     create_embed,
     load_channels,
 )
+from storage import atomic_write_json, read_json
+from alias import AliasTable
+from booster import BoosterEngine
+from jobqueue import QueueFull, ShardedQueue
+from journal import JobJournal
+from leaderboard import Standings
+from history import PriceHistory, ValueHistory, sparkline
+from openlog import OpenLog
+from prefetch import (
+    API_URL,
+    ApiError,
+    CardPrefetcher,
+    TokenBucket,
+    fetch_set_cards,
+    get_json,
+    group_by_rarity,
+)
+from catalog import (
+    card_price_usd,
+    owned_cards,
+    read_card_cache,
+    set_cards,
+)
+from achievements import (
+    add_cards,
+    collection_metrics,
+    ensure_stats,
+    evaluate,
+    remove_cards,
+    missing_numbers,
+    owned_numbers,
+    rule_target,
+    set_owned,
+    top_cards,
+    valuation,
+)
 import os
-import json
 from pathlib import Path
 import aiohttp
 import random
@@ -33,11 +83,13 @@ import time
 # Nowy przelicznik 1 USD = 3 BC
 COINS_PER_USD = 3
 
-# Prosty cache kart pobranych z API {set_id: {rarity: [cards]}}
-CARD_CACHE = {}
 BASE_DIR = Path(__file__).resolve().parent
 GRAPHIC_DIR = BASE_DIR / "graphic"
 CARD_CACHE_FILE = BASE_DIR / "card_cache.json"
+CARD_CACHE_DIR = BASE_DIR / "card_cache"
+# {set_id: updatedAt z API} dla setów zapisanych w card_cache/
+CARD_CACHE_STATE_FILE = BASE_DIR / "card_cache_state.json"
+CARD_CACHE_STATE = read_json(CARD_CACHE_STATE_FILE, {})
 
 # Emoji i kolory rzadkości kart
 RARITY_EMOJIS = {
@@ -62,47 +114,109 @@ RARITY_COLORS = {
     "Special Illustration Rare": 0xFF0000,
 }
 
-GOD_PACK_CHANCE = 0.005
-
+# Cache kart pobranych z API {set_id: {rarity: [cards]}} trzyma katalog kart,
+# który indeksuje go po id karty, secie i rzadkości. Na dysku każdy set ma
+# osobny plik w card_cache/, więc pobrane sety przetrwają restart bota.
 def load_card_cache():
-    global CARD_CACHE
-    try:
-        with open(CARD_CACHE_FILE, "r") as f:
-            CARD_CACHE = json.load(f)
-    except FileNotFoundError:
-        CARD_CACHE = {}
-
-def save_card_cache():
-    with open(CARD_CACHE_FILE, "w") as f:
-        json.dump(CARD_CACHE, f)
+    cache = {}
+    if CARD_CACHE_DIR.is_dir():
+        cache = read_card_cache(CARD_CACHE_DIR)
+    elif CARD_CACHE_FILE.exists():
+        # Stary format - jeden plik ze wszystkimi setami
+        cache = read_json(CARD_CACHE_FILE, {}, backups=1)
+        for sid, rarities in cache.items():
+            save_card_set(sid, rarities)
+    get_card_catalog().load_cache(cache)
+
+def save_card_set(set_id, rarities):
+    CARD_CACHE_DIR.mkdir(exist_ok=True)
+    atomic_write_json(CARD_CACHE_DIR / f"{set_id}.json", rarities, indent=None)
+
+async def asave_card_set(set_id):
+    # Płytka kopia w pętli zdarzeń - wątek zapisu nie widzi późniejszych zmian
+    snapshot = dict(get_card_catalog().by_set.get(set_id, {}))
+    await run_io_write(save_card_set, set_id, snapshot)
+
+
+def api_session() -> aiohttp.ClientSession:
+    """Wspólna sesja HTTP do Pokémon TCG API (tworzona w MyClient.setup_hook)."""
+    return client.api_session
+
+
+async def store_card_set(set_id, rarities):
+    """Zindeksuj pobrany set, zapisz go i dopisz zmienione ceny kart do historii.
+
+    Zwraca liczbę posiadanych przez graczy kart, których cena się zmieniła.
+    Wartości kolekcji przeliczają się leniwie z dziennika zmian cen katalogu.
+    """
+    catalog = get_card_catalog()
+    cards = [card for group in rarities.values() for card in group]
+    catalog.index_set(set_id, rarities)
+    changed = catalog.update_prices(cards)
+    await asave_card_set(set_id)
+    await asave_card_catalog()
+    entry = PRICE_HISTORY.observe(cards)
+    if entry is not None:
+        await run_io_write(PRICE_HISTORY.append, entry)
+    set_obj = (await aget_all_sets()).get(set_id)
+    if set_obj and set_obj.get("updatedAt"):
+        CARD_CACHE_STATE[set_id] = set_obj["updatedAt"]
+        await run_io_write(atomic_write_json, CARD_CACHE_STATE_FILE, dict(CARD_CACHE_STATE))
+    return changed
 
 
 async def fetch_all_cards_for_set(session: aiohttp.ClientSession, set_id: str):
-    cards = []
-    page = 1
-    while True:
-        url = f"https://api.pokemontcg.io/v2/cards?q=set.id:{set_id}&page={page}&pageSize=250"
-        async with session.get(url) as resp:
-            data = await resp.json()
-            cards.extend(data.get("data", []))
-            if len(cards) >= data.get("totalCount", len(cards)):
-                break
-            page += 1
-    rarity_dict = {}
-    for card in cards:
-        rarity = card.get("rarity", "Unknown")
-        rarity_dict.setdefault(rarity, []).append(card)
-    CARD_CACHE[set_id] = rarity_dict
+    cards = await fetch_set_cards(session, set_id, limiter=API_LIMITER)
+    await store_card_set(set_id, group_by_rarity(cards))
+
+
+async def refill_card_set(set_id):
+    await fetch_all_cards_for_set(api_session(), set_id)
 
 
 async def prefetch_cards_for_sets(set_ids):
-    if not set_ids:
+    # Sety zapisane wcześniej są pomijane, więc restart wznawia pobieranie
+    catalog = get_card_catalog()
+    missing = [sid for sid in set_ids if not catalog.has_set(sid)]
+    if not missing:
+        return
+
+    prefetcher = CardPrefetcher(
+        api_session(),
+        limiter=API_LIMITER,
+        concurrency=PREFETCH_CONCURRENCY,
+        on_set=store_card_set,
+    )
+    failed = await prefetcher.run(missing)
+    if failed:
+        print(f"⚠️ Nie pobrano kart {len(failed)} setów - spróbuję przy następnym starcie")
+
+
+async def refresh_card_prices():
+    """Pobierz ponownie zapisane sety, których updatedAt w API się zmienił."""
+    await fetch_and_save_sets()
+    catalog = get_card_catalog()
+    stale = [
+        s["id"]
+        for s in await aget_all_sets()
+        if catalog.has_set(s["id"]) and CARD_CACHE_STATE.get(s["id"]) != s.get("updatedAt")
+    ]
+    if not stale:
         return
-    headers = {"X-Api-Key": POKETCG_API_KEY}
-    async with aiohttp.ClientSession(headers=headers) as session:
-        for sid in set_ids:
-            await fetch_all_cards_for_set(session, sid)
-    save_card_cache()
+    changed = 0
+
+    async def refresh_set(set_id, rarities):
+        nonlocal changed
+        changed += await store_card_set(set_id, rarities)
+
+    prefetcher = CardPrefetcher(
+        api_session(),
+        limiter=API_LIMITER,
+        concurrency=PREFETCH_CONCURRENCY,
+        on_set=refresh_set,
+    )
+    failed = await prefetcher.run(stale)
+    print(f"💱 Odświeżono ceny {len(stale) - len(failed)} setów, zmiany cen {changed} posiadanych kart")
 
 
 # Nazwy i ikonki odznak (osiągnięć)
@@ -177,72 +291,75 @@ ACHIEVEMENT_REWARDS = {
     "all_achievements": 1000,
 }
 
-# Grupowanie osiągnięć na potrzeby paginacji
+# Grupowanie osiągnięć na potrzeby paginacji: (kod, metryka, cel).
+# Cel może być nazwą innej wartości (np. liczby wszystkich setów),
+# a osiągnięcia bez metryki przyznawane są w innych miejscach.
 ACHIEVEMENT_GROUPS = [
     (
         "Otwieranie boosterów",
         [
-            ("first_booster", 1),
-            ("open_5_boosters", 5),
-            ("open_25_boosters", 25),
-            ("open_100_boosters", 100),
-            ("open_500_boosters", 500),
+            ("first_booster", "opened", 1),
+            ("open_5_boosters", "opened", 5),
+            ("open_25_boosters", "opened", 25),
+            ("open_100_boosters", "opened", 100),
+            ("open_500_boosters", "opened", 500),
         ],
     ),
     (
         "Rozmiar kolekcji",
         [
-            ("first_card", 1),
-            ("cards_50", 50),
-            ("cards_250", 250),
-            ("cards_1000", 1000),
+            ("first_card", "cards", 1),
+            ("cards_50", "cards", 50),
+            ("cards_250", "cards", 250),
+            ("cards_1000", "cards", 1000),
         ],
     ),
     (
         "Rzadkie karty",
         [
-            ("first_rare", 1),
-            ("rare_10", 10),
-            ("rare_50", 50),
+            ("first_rare", "rares", 1),
+            ("rare_10", "rares", 10),
+            ("rare_50", "rares", 50),
         ],
     ),
     (
         "Duplikaty kart",
         [
-            ("first_duplicate", 2),
-            ("duplicate_10", 10),
-            ("duplicates_20_cards", 20),
+            ("first_duplicate", "max_duplicate", 2),
+            ("duplicate_10", "max_duplicate", 10),
+            ("duplicates_20_cards", "duplicated_cards", 20),
         ],
     ),
     (
         "Zbiory setów",
         [
-            ("first_set", 1),
-            ("sets_5", 5),
-            ("sets_10", 10),
-            ("sets_all", 0),  # target uzupełniany później
+            ("first_set", "sets", 1),
+            ("sets_5", "sets", 5),
+            ("sets_10", "sets", 10),
+            ("sets_all", "sets", "sets_total"),
         ],
     ),
     (
         "Czas gry",
         [
-            ("new_player", 1),
-            ("veteran", 30),
-            ("legendary_player", 100),
+            ("new_player", "days", 1),
+            ("veteran", "days", 30),
+            ("legendary_player", "days", 100),
         ],
     ),
     (
         "Pozostałe",
         [
-            ("account_created", 1),
-            ("daily_10", 10),
-            ("daily_30", 30),
-            ("top3_week", 1),
-            ("community_week", 1),
-            ("all_achievements", 1),
+            ("account_created", None, 1),
+            ("daily_10", "daily_streak", 10),
+            ("daily_30", "daily_streak", 30),
+            ("top3_week", None, 1),
+            ("community_week", None, 1),
+            ("all_achievements", None, 1),
         ],
     ),
 ]
+ACHIEVEMENT_RULES = [rule for _, entries in ACHIEVEMENT_GROUPS for rule in entries if rule[1]]
 
 def usd_to_bc(usd: float) -> float:
     """Przelicz dolary na BoguckiCoiny z dokładnością do dwóch miejsc."""
@@ -256,13 +373,11 @@ def format_bc_plain(amount: float) -> str:
     """Sformatuj ilość BoguckiCoinów bez emoji."""
     return f"{amount:.2f} BC"
 
-def card_price_usd(card: dict) -> float | None:
-    """Zwróć cenę rynkową karty w USD, jeśli jest znana."""
-    if "tcgplayer" in card and "prices" in card["tcgplayer"]:
-        for ver in card["tcgplayer"]["prices"].values():
-            if "market" in ver and ver["market"]:
-                return ver["market"]
-    return None
+def credit_card(user: dict, card: dict, count: int = 1):
+    """Dopisz kartę z API do kolekcji gracza, a jej dane do katalogu kart."""
+    catalog = get_card_catalog()
+    catalog.register(card)
+    add_cards(user, catalog, card["id"], count)
 
 def progress_bar(value: int, target: int, length: int = 10) -> str:
     ratio = min(value / target, 1.0)
@@ -272,8 +387,7 @@ def progress_bar(value: int, target: int, length: int = 10) -> str:
 def achievement_description(code: str, all_sets) -> str:
     if code.startswith("master:"):
         sid = code.split(":", 1)[1]
-        name = next((s["name"] for s in all_sets if s["id"] == sid), sid)
-        return f"🏆 Master set {name}"
+        return f"🏆 Master set {all_sets.name(sid)}"
     info = BADGE_INFO.get(code)
     emoji = info["emoji"] if info else "🏅"
     name = info["name"] if info else ACHIEVEMENTS_INFO.get(code, code)
@@ -316,19 +430,11 @@ async def create_account_and_welcome(member_or_interaction):
     else:
         member = member_or_interaction
 
-    users = load_users()
     uid = str(member.id)
-    if uid in users:
-        if isinstance(member_or_interaction, discord.Interaction):
-            await member_or_interaction.response.send_message(
-                "Masz już konto!", ephemeral=True
-            )
-        return
-
-    users[uid] = {
+    user = {
         "username": member.name,
         "boosters": [],
-        "cards": [],
+        "cards": {},
         "rare_boost": 0,
         "double_daily_until": 0,
         "streak_freeze": 0,
@@ -344,11 +450,16 @@ async def create_account_and_welcome(member_or_interaction):
         "badges": [],
         "created_at": int(datetime.datetime.now(datetime.UTC).timestamp()),
     }
-    users[uid]["achievements"].append("account_created")
+    user["achievements"].append("account_created")
     reward = ACHIEVEMENT_REWARDS.get("account_created", 0)
-    users[uid]["money"] += reward
-    users[uid]["money_achievements"] += reward
-    save_users(users)
+    user["money"] += reward
+    user["money_achievements"] += reward
+    if not await create_user(uid, user):
+        if isinstance(member_or_interaction, discord.Interaction):
+            await member_or_interaction.response.send_message(
+                "Masz już konto!", ephemeral=True
+            )
+        return
 
     welcome = (
         "Zbieraj karty Pok\xe9mon, kupuj boostery w komendzie `/sklep` i odbieraj codzienne monety przy pomocy `/daily`.\n"
@@ -411,45 +522,32 @@ def check_for_all_achievements(user: dict) -> bool:
     return required.issubset(set(user.get("achievements", [])))
 
 
+def check_collection_achievements(user: dict, all_sets: dict) -> list:
+    """Przyznaj osiągnięcia za boostery i kolekcję na podstawie liczników gracza."""
+    values = {
+        **collection_metrics(ensure_stats(user, get_card_catalog())),
+        "opened": user.get("boosters_opened", 0),
+        "sets_total": len(all_sets),
+    }
+    return evaluate(user, ACHIEVEMENT_RULES, values, grant_achievement)
+
+
 def build_achievement_pages(user, all_sets):
     """Zbuduj listę embedów przedstawiających postępy w osiągnięciach."""
     ach = user.get("achievements", [])
-    opened = user.get("boosters_opened", 0)
-    total_cards = len(user["cards"])
-    rare_ids = {c["id"] for c in user["cards"] if c.get("rarity") == "Rare"}
-    rare_count = len(rare_ids)
-    counts = Counter(c["id"] for c in user["cards"])
-    max_dup = max(counts.values()) if counts else 0
-    dup20 = len([v for v in counts.values() if v >= 2])
-    set_ids = {c["id"].split("-")[0] for c in user["cards"]}
-    days = int((datetime.datetime.now(datetime.UTC).timestamp() - user.get("created_at", 0)) / 86400)
+    values = {
+        **collection_metrics(ensure_stats(user, get_card_catalog())),
+        "opened": user.get("boosters_opened", 0),
+        "sets_total": len(all_sets),
+        "days": int((datetime.datetime.now(datetime.UTC).timestamp() - user.get("created_at", 0)) / 86400),
+        "daily_streak": user.get("daily_streak", 0),
+    }
     pages = []
     for title, entries in ACHIEVEMENT_GROUPS:
         embed = create_embed(title=title, color=discord.Color.green())
-        for code, target in entries:
-            value = 0
-            tgt = target
-            if code in {"first_booster", "open_5_boosters", "open_25_boosters", "open_100_boosters", "open_500_boosters"}:
-                value = opened
-            elif code in {"first_card", "cards_50", "cards_250", "cards_1000"}:
-                value = total_cards
-            elif code in {"first_rare", "rare_10", "rare_50"}:
-                value = rare_count
-            elif code == "duplicates_20_cards":
-                value = dup20
-            elif code in {"first_duplicate", "duplicate_10"}:
-                value = max_dup
-            elif code in {"first_set", "sets_5", "sets_10", "sets_all"}:
-                value = len(set_ids)
-                if code == "sets_all":
-                    tgt = len(all_sets)
-            elif code in {"new_player", "veteran", "legendary_player"}:
-                value = days
-            elif code in {"daily_10", "daily_30"}:
-                value = user.get("daily_streak", 0)
-                tgt = target
-            elif code in {"account_created", "top3_week", "all_achievements"}:
-                value = 1 if code in ach else 0
+        for code, metric, target in entries:
+            tgt = rule_target(target, values)
+            value = values[metric] if metric else (1 if code in ach else 0)
             display_val = min(value, tgt)
             bar = progress_bar(display_val, tgt)
             status = "✅" if code in ach else ""
@@ -457,7 +555,7 @@ def build_achievement_pages(user, all_sets):
             name = f"{info['emoji']} {info['name']}" if info else ACHIEVEMENTS_INFO.get(code, code)
             embed.add_field(name=name, value=f"{bar} {display_val}/{tgt} {status}", inline=False)
         rewards = []
-        for code, _ in entries:
+        for code, _, _ in entries:
             reward = ACHIEVEMENT_REWARDS.get(code)
             if reward:
                 info = BADGE_INFO.get(code)
@@ -477,6 +575,16 @@ STREAK_BONUS = 200
 
 load_dotenv()
 load_card_cache()
+BOOSTER_ENGINE = BoosterEngine(get_card_catalog())
+# Każde otwarcie ma własny strumień losowy (seed serwera + numer otwarcia)
+# i wpis w opens.jsonl, więc paczkę można odtworzyć: python3 openlog.py replay <id>
+OPEN_LOG = OpenLog()
+# Historia cen kart (card_prices.jsonl) i migawki wartości kolekcji graczy
+PRICE_HISTORY = PriceHistory()
+VALUE_HISTORY = ValueHistory()
+VALUE_SNAPSHOT_INTERVAL = int(os.environ.get("VALUE_SNAPSHOT_HOURS", "24")) * 3600
+# Ile ostatnich migawek pokazuje trend w /profil
+VALUE_TREND_POINTS = 14
 
 CHANNELS = load_channels()
 
@@ -484,6 +592,16 @@ USERS_FILE = BASE_DIR / "users.json"
 SETS_FILE = BASE_DIR / "sets.json"
 DISCORD_TOKEN = os.environ["BOT_TOKEN"]
 POKETCG_API_KEY = os.environ["POKETCG_API_KEY"]
+# Pula połączeń do Pokémon TCG API
+API_MAX_CONNECTIONS = 20
+API_TIMEOUT = 60
+# Limit zapytań do API (na sekundę) wspólny dla wszystkich pobrań
+API_RATE_LIMIT = float(os.environ.get("POKETCG_RATE_LIMIT", "5"))
+API_LIMITER = TokenBucket(API_RATE_LIMIT)
+# Ile setów pobierać równolegle przy starcie
+PREFETCH_CONCURRENCY = int(os.environ.get("PREFETCH_CONCURRENCY", "4"))
+# Co ile godzin sprawdzać updatedAt setów i odświeżać ceny kart
+PRICE_REFRESH_INTERVAL = int(os.environ.get("PRICE_REFRESH_HOURS", "12")) * 3600
 DROP_CHANNEL_ID = int(CHANNELS.get("drop", 0)) or 1374695570182246440
 STARTIT_BOT_ID = 572906387382861835
 GIVEAWAY_CHANNEL_ID = int(CHANNELS.get("giveaway", 0))
@@ -536,49 +654,44 @@ EVENT_ROLE_ID = int(os.getenv("EVENT_ROLE_ID", 0))
 # Pamięć koszyków użytkowników {uid: {"boosters": {set_id: qty}, "items": {item: qty}}}
 carts = {}
 random_event_active = False
-# Kolejka do otwierania boosterów
-BOOSTER_QUEUE = asyncio.Queue()
+# Odczyt-modyfikacja-zapis plików events.json i data.json po kolei
+EVENTS_LOCK = asyncio.Lock()
+PURCHASES_LOCK = asyncio.Lock()
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
 async def fetch_and_save_sets():
-    url = "https://api.pokemontcg.io/v2/sets"
-    headers = {"X-Api-Key": POKETCG_API_KEY}
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                print(f"❌ Błąd pobierania zestawów: {response.status}")
-                return []
-            data = await response.json()
-            sets = data.get("data", [])
-            filtered_sets = sorted(
-                [s for s in sets if s.get("ptcgoCode")],
-                key=lambda s: s.get("releaseDate", "2000-01-01"),
-                reverse=True,
-            )
-            try:
-                with open(SETS_FILE, "r") as f:
-                    existing = json.load(f)
-            except FileNotFoundError:
-                existing = []
-            existing_ids = {s["id"] for s in existing}
-            new_sets = [s for s in filtered_sets if s["id"] not in existing_ids]
-            if new_sets:
-                with open(SETS_FILE, "w") as f:
-                    json.dump(filtered_sets, f, indent=4)
-                print(f"✅ Dodano {len(new_sets)} nowych setów")
-            return new_sets
+    try:
+        data = await get_json(api_session(), f"{API_URL}/sets", limiter=API_LIMITER)
+    except (ApiError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"❌ Błąd pobierania zestawów: {e}")
+        return []
+    sets = data.get("data", [])
+    filtered_sets = sorted(
+        [s for s in sets if s.get("ptcgoCode")],
+        key=lambda s: s.get("releaseDate", "2000-01-01"),
+        reverse=True,
+    )
+    existing = await aget_all_sets()
+    new_sets = [s for s in filtered_sets if s["id"] not in existing]
+    # updatedAt zmienia się przy aktualizacji kart setu (także cen)
+    updated = any(
+        s["id"] in existing and existing.get(s["id"]).get("updatedAt") != s.get("updatedAt")
+        for s in filtered_sets
+    )
+    if new_sets or updated:
+        await asave_sets(filtered_sets)
+    if new_sets:
+        print(f"✅ Dodano {len(new_sets)} nowych setów")
+    return new_sets
           
-def group_sets_by_language_and_series():
-    sets = get_all_sets()
-    result = {}
-    for s in sets:
-        lang = "Angielski"
-        # Prosta heurystyka - można rozbudować przy realnych danych
-        result.setdefault(lang, {}).setdefault(s["series"], []).append(s)
-    return result
+def group_sets_by_language_and_series(sets):
+    if not sets:
+        return {}
+    # Prosta heurystyka - wszystkie sety traktujemy jako angielskie
+    return {"Angielski": sets.series}
 
 def booster_price_usd_for_set(set_obj):
     """Wylicz umowną cenę boostera na podstawie roku wydania."""
@@ -590,40 +703,63 @@ def booster_price_usd_for_set(set_obj):
     return round(4.0 + age * 0.1, 2)
 
 
-def booster_price_coins(set_id):
-    prices = load_prices()
+async def load_pricing():
+    """Wczytaj cennik i listę setów (poza pętlą zdarzeń)."""
+    return await asyncio.gather(aload_prices(), aget_all_sets())
+
+
+async def record_purchases(bought):
+    """Dolicz kupione boostery do statystyk sklepu w data.json."""
+    if not bought:
+        return
+    async with PURCHASES_LOCK:
+        data = await aload_data()
+        for sid, q in bought.items():
+            data[sid] = data.get(sid, 0) + q
+        await asave_data(data)
+
+
+def booster_price_coins(set_id, prices, sets):
     if set_id in prices:
         return prices[set_id]
-    sets = get_all_sets()
-    set_obj = next((s for s in sets if s["id"] == set_id), None)
+    set_obj = sets.get(set_id)
     if not set_obj:
         return BOOSTER_PRICE
     usd = booster_price_usd_for_set(set_obj)
     return int(usd * COINS_PER_USD)
 
 
-def weighted_random_set(sets):
+# Tablica aliasów losowania setu do mystery boostera - przebudowywana tylko
+# gdy zmieni się cennik (nowy słownik z aload_prices) albo plik sets.json
+_mystery_sampler = (None, None, None)
+
+def weighted_random_set(sets, prices):
     """Choose a random set weighted by inverse price."""
+    global _mystery_sampler
     if not sets:
         return None
-    prices = [booster_price_coins(s["id"]) for s in sets]
-    weights = [1 / p if p else 1 for p in prices]
-    return random.choices(sets, weights=weights, k=1)[0]
+    cached_prices, cached_mtime, table = _mystery_sampler
+    if cached_prices is not prices or cached_mtime != sets.mtime:
+        costs = [booster_price_coins(s["id"], prices, sets) for s in sets]
+        weights = [1 / p if p else 1 for p in costs]
+        table = AliasTable(list(sets), weights)
+        _mystery_sampler = (prices, sets.mtime, table)
+    return table.sample()
 
 
-def compute_cart_total(cart):
+def compute_cart_total(cart, prices, sets):
     total = 0
     for sid, q in cart.get("boosters", {}).items():
-        total += q * booster_price_coins(sid)
+        total += q * booster_price_coins(sid, prices, sets)
     total += sum(q * ITEMS[i]["price"] for i, q in cart.get("items", {}).items())
     return total
 
-def build_cart_embed(user_id, message):
-    users = load_users()
-    user = users.get(user_id, {})
+async def build_cart_embed(user_id, message):
+    user = await aload_user(user_id) or {}
     money = user.get("money", 0)
     cart = carts.get(user_id, {"boosters": {}, "items": {}})
-    total = compute_cart_total(cart)
+    prices, sets = await load_pricing()
+    total = compute_cart_total(cart, prices, sets)
     embed = create_embed(title="Koszyk", description=message, color=EMBED_COLOR)
     embed.add_field(name="Wartość koszyka", value=format_bc(total), inline=False)
     embed.add_field(name="Twoje saldo", value=format_bc(money), inline=False)
@@ -644,7 +780,7 @@ def is_weekend(dt=None):
         dt = datetime.datetime.now(datetime.UTC)
     return dt.weekday() >= 5
 
-def update_weekly_best(user, price, name, *, dt=None):
+def update_weekly_best(uid, user, price, name, *, dt=None):
     week, year = current_week_info(dt)
     best = user.get("weekly_best", {})
     if (
@@ -653,13 +789,25 @@ def update_weekly_best(user, price, name, *, dt=None):
         or price > best.get("price", 0)
     ):
         user["weekly_best"] = {"week": week, "year": year, "price": price, "name": name}
+        get_weekly_board().offer("drops", week, year, str(uid), price, name)
+
+def grant_weekly_reward(user, reward, code):
+    """Dodaj nagrodę za ranking tygodnia i zwróć nowo zdobyte osiągnięcia."""
+    user["money"] = user.get("money", 0) + reward
+    user["money_events"] = user.get("money_events", 0) + reward
+    new_codes = []
+    if grant_achievement(user, code):
+        new_codes.append(code)
+    if check_for_all_achievements(user) and grant_achievement(user, "all_achievements"):
+        new_codes.append("all_achievements")
+    return new_codes
 
 def check_master_set(user, set_id, all_sets):
-    set_info = next((s for s in all_sets if s["id"] == set_id), None)
+    set_info = all_sets.get(set_id)
     if not set_info:
         return False
     total = set_info.get("total", 0)
-    owned = len({c["id"] for c in user["cards"] if c["id"].startswith(set_id)})
+    owned = set_owned(user, get_card_catalog(), set_id)
     if total > 0 and owned >= total:
         ach = f"master:{set_id}"
         return grant_achievement(user, ach)
@@ -669,11 +817,26 @@ def booster_image_url(set_id: str) -> str:
     """Return the URL of the booster pack image for a given set."""
     return f"https://images.pokemontcg.io/{set_id}/booster.png"
 
-def build_shop_embed(user_id):
-    sets = get_all_sets()
-    purchases = load_data()
+def take_boosters(user, set_id, count=1):
+    """Zabierz graczowi ``count`` boosterów danego setu. Zwraca False gdy ma ich za mało."""
+    boosters = user["boosters"]
+    if boosters.count(set_id) < count:
+        return False
+    # Jedno przejście zamiast ``count`` wywołań list.remove
+    kept = []
+    for b in boosters:
+        if b == set_id and count:
+            count -= 1
+        else:
+            kept.append(b)
+    boosters[:] = kept
+    return True
+
+async def build_shop_embed(user_id):
+    prices, sets = await load_pricing()
+    purchases = await aload_data()
     now = time.time()
-    active = [ev for ev in load_events() if ev.get("start", 0) <= now <= ev.get("end", 0)]
+    active = [ev for ev in await aload_events() if ev.get("start", 0) <= now <= ev.get("end", 0)]
     event_lines = []
     for ev in active:
         if ev.get("type") == "coins":
@@ -703,8 +866,8 @@ def build_shop_embed(user_id):
     if purchases:
         top = sorted(purchases.items(), key=lambda x: x[1], reverse=True)[:5]
         best_id, best_count = top[0]
-        best_set = next((s for s in sets if s['id'] == best_id), None)
-        best_name = best_set['name'] if best_set else best_id
+        best_set = sets.get(best_id)
+        best_name = sets.name(best_id)
         embed.set_image(url=booster_image_url(best_id))
         if best_set and 'images' in best_set and 'logo' in best_set['images']:
             embed.set_thumbnail(url=best_set['images']['logo'])
@@ -716,8 +879,7 @@ def build_shop_embed(user_id):
         )
         lines = []
         for idx, (sid, cnt) in enumerate(top[1:], start=2):
-            name = next((s['name'] for s in sets if s['id'] == sid), sid)
-            lines.append(f"{idx}. {name} - {cnt} szt.")
+            lines.append(f"{idx}. {sets.name(sid)} - {cnt} szt.")
         if lines:
             embed.add_field(
                 name="Pozostałe popularne",
@@ -733,14 +895,13 @@ def build_shop_embed(user_id):
     if cart and (cart.get("boosters") or cart.get("items")):
         lines = []
         for sid, q in cart.get("boosters", {}).items():
-            name = next((s['name'] for s in sets if s['id']==sid), sid)
-            lines.append(f"{name} x{q}")
+            lines.append(f"{sets.name(sid)} x{q}")
         for iid, q in cart.get("items", {}).items():
             info = ITEMS.get(iid, {})
             name = info.get('name', iid)
             emj = info.get('emoji', '')
             lines.append(f"{name} {emj} x{q}")
-        total = compute_cart_total(cart)
+        total = compute_cart_total(cart, prices, sets)
         lines.append(f"**Razem: {format_bc(total)}**")
         embed.add_field(name="Koszyk", value="\n".join(lines), inline=False)
     return embed
@@ -794,24 +955,26 @@ class QuickBonusView(View):
         if self.claimed:
             await interaction.response.send_message("Ktoś był szybszy!", ephemeral=True)
             return
-        users = load_users()
         uid = str(interaction.user.id)
-        if uid not in users:
+        # Rezerwujemy nagrodę przed pierwszym await, żeby nikt jej nie przechwycił
+        self.claimed = True
+        amount = self.amount or 0
+        async with edit_user(uid) as user:
+            if user is not None:
+                if self.booster_id:
+                    user["boosters"].append(self.booster_id)
+                else:
+                    user["money"] = user.get("money", 0) + amount
+                    user["money_events"] = user.get("money_events", 0) + amount
+        if user is None:
+            self.claimed = False
             await interaction.response.send_message("📭 Nie masz konta.", ephemeral=True)
             return
-        ensure_user_fields(users[uid])
         if self.booster_id:
-            users[uid]["boosters"].append(self.booster_id)
-            save_users(users)
-            name = next((s["name"] for s in get_all_sets() if s["id"] == self.booster_id), self.booster_id)
+            name = (await aget_all_sets()).name(self.booster_id)
             msg = f"🎉 Otrzymujesz booster **{name}**!"
         else:
-            amount = self.amount or 0
-            users[uid]["money"] = users[uid].get("money", 0) + amount
-            users[uid]["money_events"] = users[uid].get("money_events", 0) + amount
-            save_users(users)
             msg = f"🎉 Otrzymujesz {format_bc(amount)}!"
-        self.claimed = True
         await interaction.response.send_message(msg, ephemeral=True)
         global random_event_active
         random_event_active = False
@@ -837,24 +1000,24 @@ class QuickBonusView(View):
             if voter_id in self.voters:
                 await interaction.response.send_message("Już głosowałeś!", ephemeral=True)
                 return
-            users = load_users()
-            owner = users.get(self.owner_id)
-            voter = users.get(voter_id)
+            self.voters.add(voter_id)
+            async with edit_users(self.owner_id, voter_id) as users:
+                owner = users[self.owner_id]
+                voter = users[voter_id]
+                if owner and voter:
+                    week, year = current_week_info()
+                    wc = owner.get("weekly_community", {})
+                    if wc.get("week") != week or wc.get("year") != year:
+                        wc = {"week": week, "year": year, "score": 0}
+                    wc["score"] = wc.get("score", 0) + 1
+                    owner["weekly_community"] = wc
+                    get_weekly_board().offer("community", week, year, self.owner_id, wc["score"])
+                    voter["money"] = voter.get("money", 0) + 1
+                    voter["money_events"] = voter.get("money_events", 0) + 1
             if not owner or not voter:
+                self.voters.discard(voter_id)
                 await interaction.response.send_message("Użytkownik nieznany", ephemeral=True)
                 return
-            ensure_user_fields(owner)
-            ensure_user_fields(voter)
-            week, year = current_week_info()
-            wc = owner.get("weekly_community", {})
-            if wc.get("week") != week or wc.get("year") != year:
-                wc = {"week": week, "year": year, "score": 0}
-            wc["score"] = wc.get("score", 0) + 1
-            owner["weekly_community"] = wc
-            voter["money"] = voter.get("money", 0) + 1
-            voter["money_events"] = voter.get("money_events", 0) + 1
-            save_users(users)
-            self.voters.add(voter_id)
             self.count += 1
             button.label = str(self.count)
             await interaction.message.edit(view=self)
@@ -877,56 +1040,56 @@ class ShopView(View):
         if self.finalized:
             return
         self.finalized = True
-        users = load_users()
         uid = self.user_id
-        if uid not in users:
-            await interaction.response.send_message("📭 Nie masz konta.", ephemeral=True)
-            return
-        ensure_user_fields(users[uid])
         cart = carts.get(uid)
-        if not cart or (not cart.get("boosters") and not cart.get("items")):
-            await interaction.response.send_message("Koszyk jest pusty", ephemeral=True)
-            return
-        total = compute_cart_total(cart)
-        if users[uid].get("money", 0) < total:
-            await interaction.response.send_message("❌ Za mało BC", ephemeral=True)
-            return
-        users[uid]["money"] -= total
-        data = load_data()
+        error = None
+        total = 0
         mystery_results = []
-        for sid, q in cart.get("boosters", {}).items():
-            users[uid]["boosters"].extend([sid] * q)
-            data[sid] = data.get(sid, 0) + q
-        save_data(data)
-        now_ts = datetime.datetime.now(datetime.UTC).timestamp()
-        for iid, q in cart.get("items", {}).items():
-            if iid == "double_daily":
-                end = users[uid].get("double_daily_until", 0)
-                start_from = max(end, now_ts)
-                users[uid]["double_daily_until"] = start_from + 7 * 24 * 3600 * q
-            elif iid == "mystery_booster":
-                sets = get_all_sets()
-                for _ in range(q):
-                    chosen = weighted_random_set(sets)
-                    if not chosen:
-                        continue
-                    sid = chosen["id"]
-                    users[uid]["boosters"].append(sid)
-                    data[sid] = data.get(sid, 0) + 1
-                    mystery_results.append(chosen.get("name", sid))
-            elif iid == "streak_freeze":
-                users[uid]["streak_freeze"] = users[uid].get("streak_freeze", 0) + q
+        bought = Counter()
+        prices, sets = await load_pricing()
+        async with edit_user(uid) as user:
+            if user is None:
+                error = "📭 Nie masz konta."
+            elif not cart or (not cart.get("boosters") and not cart.get("items")):
+                error = "Koszyk jest pusty"
             else:
-                users[uid][iid] = users[uid].get(iid, 0) + q
-        save_users(users)
+                total = compute_cart_total(cart, prices, sets)
+                if user.get("money", 0) < total:
+                    error = "❌ Za mało BC"
+            if error is None:
+                user["money"] -= total
+                for sid, q in cart.get("boosters", {}).items():
+                    user["boosters"].extend([sid] * q)
+                    bought[sid] += q
+                now_ts = datetime.datetime.now(datetime.UTC).timestamp()
+                for iid, q in cart.get("items", {}).items():
+                    if iid == "double_daily":
+                        end = user.get("double_daily_until", 0)
+                        start_from = max(end, now_ts)
+                        user["double_daily_until"] = start_from + 7 * 24 * 3600 * q
+                    elif iid == "mystery_booster":
+                        for _ in range(q):
+                            chosen = weighted_random_set(sets, prices)
+                            if not chosen:
+                                continue
+                            sid = chosen["id"]
+                            user["boosters"].append(sid)
+                            bought[sid] += 1
+                            mystery_results.append(chosen.get("name", sid))
+                    elif iid == "streak_freeze":
+                        user["streak_freeze"] = user.get("streak_freeze", 0) + q
+                    else:
+                        user[iid] = user.get(iid, 0) + q
+        if error:
+            await interaction.response.send_message(error, ephemeral=True)
+            return
+        await record_purchases(bought)
         carts.pop(uid, None)
         await self.update()
         emj = random.choice(FUN_EMOJIS)
-        sets = get_all_sets()
-        id_to_code = {s["id"]: s.get("ptcgoCode", s["id"]) for s in sets}
         parts = []
         for sid, q in cart.get("boosters", {}).items():
-            code = id_to_code.get(sid, sid)
+            code = sets.ptcgo_code(sid, sid)
             part = f"{code} x{q}" if q > 1 else code
             parts.append(part)
         booster_info = ", ".join(parts)
@@ -945,7 +1108,7 @@ class ShopView(View):
 
     async def update(self):
         if self.message:
-            embed = build_shop_embed(self.user_id)
+            embed = await build_shop_embed(self.user_id)
             file1 = discord.File(SHOP_IMAGE_PATH, filename="shop.png")
             file2 = discord.File(COIN_IMAGE_PATH, filename="coin.png")
             await self.message.edit(embed=embed, view=self, attachments=[file1, file2])
@@ -956,7 +1119,8 @@ class ShopView(View):
             self.parent = parent
 
         async def callback(self, interaction: discord.Interaction):
-            groups = group_sets_by_language_and_series()
+            prices, all_sets = await load_pricing()
+            groups = group_sets_by_language_and_series(all_sets)
             eras = next(iter(groups.values())) if groups else {}
             era_opts = [discord.SelectOption(label=e, value=e) for e in eras]
 
@@ -974,7 +1138,7 @@ class ShopView(View):
                         discord.SelectOption(
                             label=s['name'],
                             value=s['id'],
-                            description=f"{booster_price_coins(s['id']):.2f} BC",
+                            description=f"{booster_price_coins(s['id'], prices, all_sets):.2f} BC",
                             emoji=bc_emoji,
                         )
                         for s in sets_list[:25]
@@ -988,13 +1152,13 @@ class ShopView(View):
                         @select(placeholder="Wybierz set", options=set_opts)
                         async def select_set(self, i4: discord.Interaction, menu_set: discord.ui.Select):
                             set_id = menu_set.values[0]
-                            set_name = next((s['name'] for s in sets_list if s['id']==set_id), set_id)
+                            set_name = all_sets.name(set_id)
 
                             async def after_qty(i5, qty, shop_view=self.shop_view):
                                 cart = carts.setdefault(shop_view.user_id, {"boosters": {}, "items": {}})
                                 cart['boosters'][set_id] = cart['boosters'].get(set_id, 0) + qty
                                 await shop_view.update()
-                                embed = build_cart_embed(shop_view.user_id, f"Dodano {qty}x {set_name}")
+                                embed = await build_cart_embed(shop_view.user_id, f"Dodano {qty}x {set_name}")
                                 file = discord.File(GRAPHIC_DIR / "koszyk.png", filename="koszyk.png")
                                 await i5.response.send_message(embed=embed, view=QuickBuyView(shop_view), ephemeral=True, files=[file])
 
@@ -1045,7 +1209,7 @@ class ShopView(View):
                         cart = carts.setdefault(self.parent.parent.user_id, {"boosters": {}, "items": {}})
                         cart['items'][item_id] = cart['items'].get(item_id, 0) + qty
                         await self.parent.parent.update()
-                        embed = build_cart_embed(
+                        embed = await build_cart_embed(
                             self.parent.parent.user_id,
                             f"Dodano {qty}x {item_name} {item_emoji}"
                         )
@@ -1073,18 +1237,77 @@ class MyClient(discord.Client):
     def __init__(self):
         super().__init__(intents=intents)
         self.tree = app_commands.CommandTree(self)
+        self.user_flusher = None
+        self.api_session = None
+        self.prefetch_task = None
+        self.card_refiller = None
+        self.booster_workers = None
+        self.standings_task = None
+        self.value_snapshots = None
+        self.price_refresher = None
+
+    async def setup_hook(self):
+        # Jedna sesja HTTP z pulą połączeń keep-alive dla całego ruchu do Pokémon TCG API
+        self.api_session = aiohttp.ClientSession(
+            headers={"X-Api-Key": POKETCG_API_KEY},
+            connector=aiohttp.TCPConnector(
+                limit=API_MAX_CONNECTIONS,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            ),
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT),
+        )
+        # Otwarcia przerwane poprzednim wyłączeniem bota
+        await replay_booster_journal()
+        if not len(PRICE_HISTORY):
+            # Pierwsze ceny do historii z kart zapisanych wcześniej w card_cache/
+            entry = PRICE_HISTORY.observe(get_card_catalog().by_id.values())
+            if entry is not None:
+                await run_io_write(PRICE_HISTORY.append, entry)
+        board = get_weekly_board()
+        if not board.exists:
+            # Pierwsze uruchomienie z tablicą rankingów - jednorazowy przegląd kont
+            board.rebuild(await aload_users())
+            await asave_weekly_board()
+        # Zapis kont w tle - zmiany trafiają na dysk paczkami
+        self.user_flusher = asyncio.create_task(run_user_flusher())
+        # Dociąganie brakujących setów dla otwieranych boosterów
+        self.card_refiller = asyncio.create_task(BOOSTER_ENGINE.run_refill(refill_card_set))
+
+    async def close(self):
+        for task in (self.card_refiller, self.user_flusher):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        flush_users()
+        await super().close()
+        if self.api_session:
+            await self.api_session.close()
 
     async def on_ready(self):
         if not hasattr(self, '_synced'):
             await self.tree.sync()
             self._synced = True
         await fetch_and_save_sets()
-        if not CARD_CACHE:
-            await prefetch_cards_for_sets([s["id"] for s in get_all_sets()])
+        # Karty pobierają się w tle; boostery z brakujących setów dociągną je same
+        if self.prefetch_task is None or self.prefetch_task.done():
+            self.prefetch_task = self.loop.create_task(
+                prefetch_cards_for_sets([s["id"] for s in await aget_all_sets()])
+            )
         self.loop.create_task(self.shop_update_loop())
         self.loop.create_task(self.weekly_ranking_loop())
         self.loop.create_task(self.event_notification_loop())
-        self.loop.create_task(self.booster_queue_worker())
+        if self.booster_workers is None or self.booster_workers.done():
+            self.booster_workers = self.loop.create_task(self.booster_queue_worker())
+        if self.standings_task is None or self.standings_task.done():
+            self.standings_task = self.loop.create_task(self.standings_loop())
+        if self.value_snapshots is None or self.value_snapshots.done():
+            self.value_snapshots = self.loop.create_task(self.value_snapshot_loop())
+        if self.price_refresher is None or self.price_refresher.done():
+            self.price_refresher = self.loop.create_task(self.price_refresh_loop())
         print(f"✅ Zalogowano jako {self.user} (ID: {self.user.id})")
 
     async def shop_update_loop(self):
@@ -1110,62 +1333,29 @@ class MyClient(discord.Client):
             now = datetime.datetime.now(datetime.UTC)
             week, year = current_week_info(now - datetime.timedelta(days=1))
             if now.weekday() == 0 and processed != (week, year):
-                users = load_users()
-                entries = []
-                for uid, data in users.items():
-                    ensure_user_fields(data)
-                    best = data.get("weekly_best")
-                    if (
-                        best
-                        and best.get("week") == week
-                        and best.get("year") == year
-                        and best.get("price", 0) > 0
-                    ):
-                        entries.append((uid, best.get("price", 0), best.get("name", "")))
-                top3 = sorted(entries, key=lambda x: x[1], reverse=True)[:3]
+                board = get_weekly_board()
+                top3 = board.top("drops", week, year, 3)
                 lines = []
-                changed = False
                 for idx, (uid, price, name) in enumerate(top3):
                     reward = (3 - idx) * 50
-                    users[uid]["money"] = users[uid].get("money", 0) + reward
-                    users[uid]["money_events"] = users[uid].get("money_events", 0) + reward
                     bc = usd_to_bc(price)
                     lines.append(f"{idx+1}. <@{uid}> - {name} ({format_bc(bc)})")
-                    new_codes = []
-                    if grant_achievement(users[uid], "top3_week"):
-                        new_codes.append("top3_week")
-                    if check_for_all_achievements(users[uid]) and grant_achievement(users[uid], "all_achievements"):
-                        new_codes.append("all_achievements")
-                    changed = True
+                    new_codes = await update_user(
+                        uid, lambda u, r=reward: grant_weekly_reward(u, r, "top3_week")
+                    ) or []
                     for code in new_codes:
                         user_obj = self.get_user(int(uid))
                         if user_obj:
                             await send_achievement_message(user_obj, code)
                 # Community ranking
-                community_entries = []
-                for uid, data in users.items():
-                    wc = data.get("weekly_community")
-                    if (
-                        wc
-                        and wc.get("week") == week
-                        and wc.get("year") == year
-                        and wc.get("score", 0) > 0
-                    ):
-                        community_entries.append((uid, wc.get("score", 0)))
-                community_entries.sort(key=lambda x: x[1], reverse=True)
+                community_entries = board.top("community", week, year, 1)
                 if community_entries:
-                    best_uid, best_score = community_entries[0]
-                    reward = 100
-                    users[best_uid]["money"] = users[best_uid].get("money", 0) + reward
-                    users[best_uid]["money_events"] = users[best_uid].get("money_events", 0) + reward
+                    best_uid, best_score, _ = community_entries[0]
                     lines.append("")
                     lines.append(f"🏅 Nagroda społeczności: <@{best_uid}> ({best_score} 👍)")
-                    new_codes = []
-                    if grant_achievement(users[best_uid], "community_week"):
-                        new_codes.append("community_week")
-                    if check_for_all_achievements(users[best_uid]) and grant_achievement(users[best_uid], "all_achievements"):
-                        new_codes.append("all_achievements")
-                    changed = True
+                    new_codes = await update_user(
+                        best_uid, lambda u: grant_weekly_reward(u, 100, "community_week")
+                    ) or []
                     for code in new_codes:
                         user_obj = self.get_user(int(best_uid))
                         if user_obj:
@@ -1179,8 +1369,6 @@ class MyClient(discord.Client):
                     channel = self.get_channel(DROP_CHANNEL_ID)
                     if channel:
                         await channel.send(embed=embed)
-                if changed:
-                    save_users(users)
                 processed = (week, year)
             await asyncio.sleep(3600)
 
@@ -1188,7 +1376,8 @@ class MyClient(discord.Client):
         await self.wait_until_ready()
         while not self.is_closed():
             now = time.time()
-            events = await asyncio.to_thread(load_events)
+            async with EVENTS_LOCK:
+                events = await aload_events()
             changed = False
             for ev in events:
                 if (
@@ -1219,26 +1408,54 @@ class MyClient(discord.Client):
                     ev["announced"] = True
                     changed = True
             if changed:
-                await asyncio.to_thread(save_events, events)
+                async with EVENTS_LOCK:
+                    # Event mógł zostać dodany w międzyczasie - oznaczamy tylko ogłoszone
+                    announced = {(ev["start"], ev["end"], ev["type"]) for ev in events if ev.get("announced")}
+                    fresh = await aload_events()
+                    for ev in fresh:
+                        if (ev.get("start"), ev.get("end"), ev.get("type")) in announced:
+                            ev["announced"] = True
+                    await asave_events(fresh)
             await asyncio.sleep(60)
 
     async def booster_queue_worker(self):
+        await self.wait_until_ready()
+        await BOOSTER_QUEUE.run()
+
+    async def standings_loop(self):
         await self.wait_until_ready()
         while not self.is_closed():
-            interaction, set_id = await BOOSTER_QUEUE.get()
             try:
-                await open_booster(interaction, set_id)
+                await refresh_standings()
             except Exception as e:
-                print(f"Error opening booster: {e}")
-                try:
-                    await interaction.edit_original_response(
-                        content="❌ Wystąpił błąd podczas otwierania boostera.",
-                        embed=None,
-                        view=None,
-                    )
-                except Exception:
-                    pass
-            BOOSTER_QUEUE.task_done()
+                print(f"❌ Błąd przeliczania rankingów: {e}")
+            await asyncio.sleep(TOP_REFRESH_INTERVAL)
+
+    async def price_refresh_loop(self):
+        await self.wait_until_ready()
+        # Najpierw niech startowe pobieranie brakujących setów się skończy
+        if self.prefetch_task is not None:
+            await asyncio.wait([self.prefetch_task])
+        while not self.is_closed():
+            try:
+                await refresh_card_prices()
+            except Exception as e:
+                print(f"❌ Błąd odświeżania cen kart: {e}")
+            await asyncio.sleep(PRICE_REFRESH_INTERVAL)
+
+    async def value_snapshot_loop(self):
+        await self.wait_until_ready()
+        while not self.is_closed():
+            # Odliczanie od ostatniej migawki, więc restart nie dubluje wpisów
+            wait = VALUE_HISTORY.last_time + VALUE_SNAPSHOT_INTERVAL - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await snapshot_collection_values()
+            except Exception as e:
+                print(f"❌ Błąd migawki wartości kolekcji: {e}")
+                await asyncio.sleep(600)
 
 client = MyClient()
 
@@ -1252,9 +1469,10 @@ async def on_member_update(before: discord.Member, after: discord.Member):
         await create_account_and_welcome(after)
 
 class CollectionMainView(View):
-    def __init__(self, user, boosters_counter, all_sets):
+    def __init__(self, user, boosters_counter, all_sets, user_id=None):
         super().__init__(timeout=180)
         self.user = user
+        self.user_id = str(user_id) if user_id is not None else None
         self.boosters_counter = boosters_counter
         self.all_sets = all_sets
         self.add_item(self.SetViewButton(self.user, self.all_sets))
@@ -1265,29 +1483,14 @@ class CollectionMainView(View):
         boosters_counter = self.boosters_counter
         all_sets = self.all_sets
 
-        total_cards = sum(
-            c["count"] if isinstance(c, dict) and "count" in c else 1
-            for c in user["cards"]
-        )
-        unique_cards = len(
-            set(c["id"] if isinstance(c, dict) else c for c in user["cards"])
-        )
+        catalog = get_card_catalog()
+        # Liczniki kolekcji są utrzymywane przy każdej zmianie kart
+        stats = valuation(user, catalog)
+        total_cards = stats["total"]
+        unique_cards = stats["distinct"]
         total_boosters = sum(boosters_counter.values())
 
-        id_to_card = {}
-        for c in user["cards"]:
-            cid = c["id"] if isinstance(c, dict) else c
-            price = c.get("price_usd", 0) if isinstance(c, dict) else 0
-            if cid not in id_to_card:
-                id_to_card[cid] = {"id": cid, "price_usd": price, "count": 1}
-            else:
-                id_to_card[cid]["count"] += 1
-
-        card_values = []
-        for val in id_to_card.values():
-            card_values.append((val["id"], val["price_usd"], val["count"]))
-
-        top5 = sorted(card_values, key=lambda x: x[1], reverse=True)[:5]
+        top5 = top_cards(user, catalog, 5)
 
         embed = create_embed(
             title="Twój profil Pokémon",
@@ -1300,25 +1503,17 @@ class CollectionMainView(View):
         embed.set_thumbnail(url="attachment://kolekcja.png")
         if top5 and top5[0][1] > 0:
             najdrozsza_id = top5[0][0]
-            img_url = ""
-            card_name = najdrozsza_id
             set_code = najdrozsza_id.split("-")[0]
             card_number = najdrozsza_id.split("-")[1]
-            ptcgo_code = "-"
-            for s in all_sets:
-                if s["id"] == set_code:
-                    ptcgo_code = s["ptcgoCode"]
-                    break
-            for c in user["cards"]:
-                if c["id"] == najdrozsza_id:
-                    card_name = c.get("name", najdrozsza_id)
-                    img_url = c.get("img_url", "")
-                    break
+            ptcgo_code = all_sets.ptcgo_code(set_code)
+            info = catalog.info(najdrozsza_id)
+            card_name = info["name"] or najdrozsza_id
+            img_url = info["img_url"]
             if img_url:
                 embed.set_image(url=img_url)
-                set_obj = next((s for s in all_sets if s.get("id") == set_code), None)
-                if set_obj and "images" in set_obj and "logo" in set_obj["images"]:
-                    embed.set_thumbnail(url=set_obj["images"]["logo"])
+                logo = all_sets.logo(set_code)
+                if logo:
+                    embed.set_thumbnail(url=logo)
             embed.add_field(
                 name=f"💎 Najcenniejsza karta",
                 value=(
@@ -1330,28 +1525,20 @@ class CollectionMainView(View):
         if len(top5) > 1:
             opis = ""
             for idx, (cid, price, cnt) in enumerate(top5[1:], start=2):
-                card_name = cid
+                card_name = catalog.info(cid)["name"] or cid
                 set_code = cid.split("-")[0]
                 card_number = cid.split("-")[1]
-                ptcgo_code = "-"
-                for s in all_sets:
-                    if s["id"] == set_code:
-                        ptcgo_code = s["ptcgoCode"]
-                        break
-                for c in user["cards"]:
-                    if c["id"] == cid:
-                        card_name = c.get("name", cid)
-                        break
+                ptcgo_code = all_sets.ptcgo_code(set_code)
                 opis += (
                     f"{idx}. {card_name} | `{ptcgo_code}` | #{card_number} x{cnt} "
                     f"— **{format_bc(usd_to_bc(price))}**\n"
                 )
             embed.add_field(name="Pozostałe z TOP 5:", value=opis, inline=False)
-        hist = user.get("history", [])
-        all_total_usd = sum(price * cnt for _, price, cnt in card_values)
+        all_total_usd = stats["usd"]
         all_total_bc = usd_to_bc(all_total_usd)
-        if len(hist) >= 2:
-            diff = hist[-1]["total_usd"] - hist[-2]["total_usd"]
+        # Zmiana między dwiema ostatnimi migawkami wartości kolekcji
+        diff = VALUE_HISTORY.change(self.user_id) if self.user_id else None
+        if diff is not None:
             if diff > 0:
                 change = f"⬆️ +{diff:.2f} USD"
             elif diff < 0:
@@ -1368,6 +1555,13 @@ class CollectionMainView(View):
             ),
             inline=False
         )
+        trend = VALUE_HISTORY.series(self.user_id, VALUE_TREND_POINTS) if self.user_id else []
+        if len(trend) >= 3:
+            embed.add_field(
+                name="📈 Trend wartości",
+                value=f"`{sparkline([v for _, v in trend])}` {trend[0][1]:.2f} → {trend[-1][1]:.2f} USD",
+                inline=False,
+            )
         boost_count = user.get("rare_boost", 0)
         if boost_count > 0:
             embed.add_field(name="Rare Boosty do użycia", value=f"{boost_count} szt.", inline=False)
@@ -1387,12 +1581,15 @@ class CollectionMainView(View):
 
         async def callback(self, interaction: discord.Interaction):
             # Można tu dodać pokazanie kart użytkownika z danego setu
-            cards = [c for c in self.user["cards"] if c['id'].startswith(self.set_id)]
+            cards = owned_cards(self.user, get_card_catalog(), self.set_id)
             if not cards:
                 await interaction.response.send_message("❌ Nie masz kart z tego zestawu.", ephemeral=True)
                 return
 
-            lines = [f"• {c['name']}" for c in cards[:25]]
+            lines = [
+                f"• {c['name']}" + (f" x{c['count']}" if c["count"] > 1 else "")
+                for c in cards[:25]
+            ]
             embed = create_embed(
                 title="Twoje karty z zestawu",
                 description="\n".join(lines),
@@ -1409,8 +1606,7 @@ class CollectionMainView(View):
 
         async def callback(self, interaction: discord.Interaction):
             sets = self.all_sets
-            user_cards = self.user["cards"]
-            user_set_ids = {c['id'].split('-')[0] for c in user_cards}
+            user_set_ids = ensure_stats(self.user, get_card_catalog())["sets"]
 
             options = [
                 discord.SelectOption(
@@ -1450,25 +1646,13 @@ class CollectionMainView(View):
                             self.disabled = True
 
                     async def callback(self, interaction: discord.Interaction):
-                        users = load_users()
-                        user = users[str(interaction.user.id)]
-                        duplicates = get_set_duplicates(user, self.parent_view.selected_set_id)
+                        set_id = self.parent_view.selected_set_id
+                        async with edit_user(interaction.user.id) as user:
+                            duplicates = get_set_duplicates(user, set_id)
+                            total = sell_cards(user, duplicates)
                         if not duplicates:
                             await interaction.response.send_message("Brak duplikatów w tym secie.", ephemeral=True)
                             return
-                        total = 0
-                        remaining = []
-                        counts = Counter(d["id"] for d in duplicates)
-                        for c in user["cards"]:
-                            if counts.get(c["id"], 0) > 0:
-                                counts[c["id"]] -= 1
-                                total += usd_to_bc(c.get("price_usd", 0))
-                            else:
-                                remaining.append(c)
-                        user["cards"] = remaining
-                        user["money"] = user.get("money", 0) + total
-                        user["money_sales"] = user.get("money_sales", 0) + total
-                        save_users(users)
 
                         # update view state
                         self.parent_view.user = user
@@ -1532,11 +1716,10 @@ class CollectionMainView(View):
                 )
                 return
 
-            id_to_name = {s["id"]: s["name"] for s in self.all_sets}
             counts = Counter(self.user["boosters"])
             options = [
                 discord.SelectOption(
-                    label=f"{id_to_name.get(bid, bid)} x{cnt}", value=bid
+                    label=f"{self.all_sets.name(bid)} x{cnt}", value=bid
                 )
                 for bid, cnt in counts.items()
             ]
@@ -1545,20 +1728,9 @@ class CollectionMainView(View):
                 @select(placeholder="Wybierz booster do otwarcia", options=options)
                 async def select_cb(self, i2: discord.Interaction, menu: discord.ui.Select):
                     chosen = menu.values[0]
-                    users = load_users()
-                    uid = str(i2.user.id)
-                    ensure_user_fields(users[uid])
-                    if chosen in users[uid]["boosters"]:
-                        users[uid]["boosters"].remove(chosen)
-                        save_users(users)
-                        await i2.response.defer(ephemeral=True)
-                        await i2.followup.send(
-                            "⏳ Dodano do kolejki otwierania boostera...",
-                            ephemeral=True,
-                        )
-                        await BOOSTER_QUEUE.put((i2, chosen))
-                    else:
-                        await i2.response.send_message("Nie znaleziono boostera.", ephemeral=True)
+                    await i2.response.defer(ephemeral=True)
+                    if not await enqueue_booster(i2, chosen):
+                        await i2.followup.send("Nie znaleziono boostera.", ephemeral=True)
 
             await interaction.response.send_message(
                 "🃏 Wybierz booster do otwarcia:",
@@ -1566,11 +1738,22 @@ class CollectionMainView(View):
                 ephemeral=True,
             )
 
+def format_numbers(numbers: list[int], limit: int = 1000) -> str:
+    """Lista numerów kart przycięta do limitu długości pola embeda."""
+    text = ", ".join(map(str, numbers))
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(", ", 0, limit - 20)
+    shown = text[:cut].count(", ") + 1
+    return f"{text[:cut]} … (+{len(numbers) - shown})"
+
+
 async def build_set_embed(user, sets, set_id):
-    set_obj = next((s for s in sets if s['id'] == set_id), None)
-    user_cards = [c for c in user["cards"] if c["id"].split("-")[0] == set_id]
+    set_obj = sets.get(set_id)
+    catalog = get_card_catalog()
+    user_cards = owned_cards(user, catalog, set_id)
     total_cards = set_obj.get("total", 0)
-    owned = len(set([c["id"] for c in user_cards]))
+    owned = set_owned(user, catalog, set_id)
     percent = (owned / total_cards) * 100 if total_cards else 0
     filled = round(percent / 10)
     bar = "🟨" * filled + "⬜" * (10 - filled)
@@ -1596,58 +1779,65 @@ async def build_set_embed(user, sets, set_id):
             inline=False
         )
         embed.set_image(url=top5[0][3])
-    numery = sorted(set(int(c["id"].split("-")[1]) for c in user_cards))
+    numery = owned_numbers(user, catalog, set_id)
     if numery:
-        nums = ", ".join(str(n) for n in numery)
-        embed.add_field(name="📄 **Posiadane karty (numery)**", value=nums, inline=False)
+        embed.add_field(name="📄 **Posiadane karty (numery)**", value=format_numbers(numery), inline=False)
+    # Brakujące liczone z numerowanej serii setu (bez kart TG/GG/RC i sekretnych)
+    printed = set_obj.get("printedTotal", total_cards)
+    brakujace = missing_numbers(user, catalog, set_id, printed) if numery else []
+    if brakujace:
+        embed.add_field(name="🔎 **Brakujące karty (numery)**", value=format_numbers(brakujace), inline=False)
     duplicates = get_set_duplicates(user, set_id)
     if duplicates:
-        dup_count = len(duplicates)
-        dup_value = sum(usd_to_bc(c.get("price_usd", 0)) for c in duplicates)
+        dup_count = sum(duplicates.values())
+        dup_value = sum(usd_to_bc(catalog.price(cid)) * n for cid, n in duplicates.items())
         embed.add_field(
             name="♻️ Duplikaty",
             value=f"{dup_count} kart o wartości {format_bc(dup_value)}",
             inline=False,
         )
-    if owned == total_cards and total_cards > 0:
+    if owned >= total_cards and total_cards > 0:
         embed.add_field(name="🎉 Ukończono master set!", value="Masz wszystkie karty z tego setu!", inline=False)
     return embed
 
 
-def get_set_duplicates(user: dict, set_id: str) -> list[dict]:
-    """Return a list of duplicate cards from a specific set."""
-    duplicates: list[dict] = []
-    counts: Counter[str] = Counter()
-    for card in user.get("cards", []):
-        if card["id"].startswith(set_id):
-            counts[card["id"]] += 1
-            if counts[card["id"]] > 1:
-                duplicates.append(card)
-    return duplicates
+def get_set_duplicates(user: dict, set_id: str) -> dict[str, int]:
+    """Return ``{card_id: spare copies}`` for the duplicates from a specific set."""
+    return {cid: n - 1 for cid, n in set_cards(user, set_id).items() if n > 1}
+
+
+def sell_cards(user: dict, cards: dict[str, int]) -> float:
+    """Usuń wskazane karty ``{card_id: ilość}`` z kolekcji, dopisz BC za sprzedaż i zwróć sumę."""
+    catalog = get_card_catalog()
+    total = 0
+    for cid, n in cards.items():
+        removed = remove_cards(user, catalog, cid, n)
+        total += usd_to_bc(catalog.price(cid)) * removed
+    user["money"] = user.get("money", 0) + total
+    user["money_sales"] = user.get("money_sales", 0) + total
+    return total
 
 
 def build_other_profile_embed(user, all_sets, username: str, avatar_url: str | None = None) -> discord.Embed:
     """Stwórz uproszczony profil innego gracza."""
     ensure_user_fields(user)
-    total_usd = sum(c.get("price_usd", 0) for c in user.get("cards", []))
+    catalog = get_card_catalog()
+    stats = valuation(user, catalog, 1)
+    total_usd = stats["usd"]
     total_bc = usd_to_bc(total_usd)
 
-    owned_sets = {}
-    for c in user.get("cards", []):
-        sid = c["id"].split("-")[0]
-        owned_sets.setdefault(sid, set()).add(c["id"])
     lines = []
-    for sid, cards in owned_sets.items():
-        set_obj = next((s for s in all_sets if s["id"] == sid), None)
+    for sid in stats["sets"]:
+        set_obj = all_sets.get(sid)
         total = set_obj.get("total", 0) if set_obj else 0
-        percent = (len(cards) / total) * 100 if total else 0
+        percent = (set_owned(user, catalog, sid) / total) * 100 if total else 0
         name = set_obj.get("name", sid) if set_obj else sid
         lines.append(f"{name}: {percent:.1f}%")
     lines.sort()
 
     best_card = None
-    if user.get("cards"):
-        best_card = max(user["cards"], key=lambda c: c.get("price_usd", 0))
+    for cid, _, _ in top_cards(user, catalog, 1):
+        best_card = catalog.info(cid)
 
     icons = [BADGE_INFO[a]["emoji"] for a in user.get("achievements", []) if a in BADGE_INFO]
 
@@ -1675,12 +1865,55 @@ def build_other_profile_embed(user, all_sets, username: str, avatar_url: str | N
             embed.set_image(url=best_card["img_url"])
     return embed
 
+def reveal_card(cid):
+    """Dane karty do wyświetlenia: z cache API, a gdy go brak - z katalogu kart."""
+    catalog = get_card_catalog()
+    card = catalog.card(cid)
+    if card is not None:
+        return card
+    info = catalog.info(cid)
+    return {"id": cid, "name": info["name"], "rarity": info["rarity"], "images": {"large": info["img_url"]}}
+
+def grant_booster_cards(uid, user, set_id, cards, all_sets):
+    """Dopisz karty z boostera do gracza (w blokadzie gracza).
+
+    Zwraca nowe osiągnięcia i maskę bitową duplikatów (bit i = karta i).
+    """
+    max_price = 0
+    max_name = ""
+    duplicate_mask = 0
+    for i, card in enumerate(cards):
+        price = card_price_usd(card)
+        if card["id"] in user["cards"]:
+            duplicate_mask |= 1 << i
+        credit_card(user, card)
+        if price and price > max_price:
+            max_price = price
+            max_name = card["name"]
+    update_weekly_best(uid, user, max_price, max_name)
+    if check_master_set(user, set_id, all_sets):
+        new_codes = [f"master:{set_id}"]
+    else:
+        new_codes = []
+    user["boosters_opened"] = user.get("boosters_opened", 0) + 1
+    new_codes += check_collection_achievements(user, all_sets)
+    if check_for_all_achievements(user) and grant_achievement(user, "all_achievements"):
+        new_codes.append("all_achievements")
+    return new_codes, duplicate_mask
+
 class CardRevealView(View):
-    def __init__(self, cards, user_id, set_id, set_logo_url=None):
+    """Odsłanianie kart jedna po drugiej.
+
+    Karty są już w kolekcji gracza - widok trzyma tylko ich ID, indeks,
+    maskę duplikatów i kody nowych osiągnięć.
+    """
+
+    def __init__(self, card_ids, user_id, set_id, set_logo_url=None, *, duplicate_mask=0, new_codes=()):
         super().__init__(timeout=900)
-        self.cards = cards
+        self.card_ids = tuple(card_ids)
+        self.duplicate_mask = duplicate_mask
+        self.new_codes = tuple(new_codes)
         self.index = 0
-        self.summaries = []
         self.user_id = str(user_id)
         self.set_id = set_id
         self.set_logo_url = set_logo_url
@@ -1699,207 +1932,117 @@ class CardRevealView(View):
         if self.finalized:
             return
         self.finalized = True
-        users = load_users()
-        uid = str(self.user_id)
-        if uid in users:
-            ensure_user_fields(users[uid])
-            max_price = 0
-            max_name = ""
-            existing = Counter(c["id"] for c in users[uid]["cards"])
-            summary_lines = []
-            duplicate_cards = []
-            duplicate_usd = 0.0
-            rarity_emojis = RARITY_EMOJIS
-            for card in self.cards:
-                price = card_price_usd(card)
-                img_url = ""
-                if "images" in card:
-                    img_url = card["images"].get("small") or card["images"].get("large") or ""
-                users[uid]["cards"].append({
-                    "id": card["id"],
-                    "name": card["name"],
-                    "price_usd": price or 0,
-                    "img_url": img_url,
-                    "rarity": card.get("rarity", "")
-                })
-                rarity = card.get("rarity", "Unknown")
-                emoji = rarity_emojis.get(rarity, "❔")
-                line = f"{emoji} {card['name']} ({rarity})"
-                if existing[card["id"]] > 0:
-                    line += " ♻️"
-                    duplicate_cards.append({"id": card["id"], "price_usd": price or 0})
-                    if price:
-                        duplicate_usd += price
-                summary_lines.append(line)
-                existing[card["id"]] += 1
-                if price and price > max_price:
-                    max_price = price
-                    max_name = card["name"]
-            duplicate_bc = usd_to_bc(duplicate_usd)
-            self.summaries = summary_lines
-            update_weekly_best(users[uid], max_price, max_name)
-            all_sets = get_all_sets()
-            if check_master_set(users[uid], self.set_id, all_sets):
-                new_codes = [f"master:{self.set_id}"]
-            else:
-                new_codes = []
-            users[uid]["boosters_opened"] = users[uid].get("boosters_opened", 0) + 1
-            opened = users[uid]["boosters_opened"]
-            if opened >= 1 and grant_achievement(users[uid], "first_booster"):
-                new_codes.append("first_booster")
-            if opened >= 5 and grant_achievement(users[uid], "open_5_boosters"):
-                new_codes.append("open_5_boosters")
-            if opened >= 25 and grant_achievement(users[uid], "open_25_boosters"):
-                new_codes.append("open_25_boosters")
-            if opened >= 100 and grant_achievement(users[uid], "open_100_boosters"):
-                new_codes.append("open_100_boosters")
-            if opened >= 500 and grant_achievement(users[uid], "open_500_boosters"):
-                new_codes.append("open_500_boosters")
-            total_cards = len(users[uid]["cards"])
-            if total_cards >= 1 and grant_achievement(users[uid], "first_card"):
-                new_codes.append("first_card")
-            if total_cards >= 50 and grant_achievement(users[uid], "cards_50"):
-                new_codes.append("cards_50")
-            if total_cards >= 250 and grant_achievement(users[uid], "cards_250"):
-                new_codes.append("cards_250")
-            if total_cards >= 1000 and grant_achievement(users[uid], "cards_1000"):
-                new_codes.append("cards_1000")
-            rare_ids = {c["id"] for c in users[uid]["cards"] if c.get("rarity") == "Rare"}
-            if len(rare_ids) >= 1 and grant_achievement(users[uid], "first_rare"):
-                new_codes.append("first_rare")
-            if len(rare_ids) >= 10 and grant_achievement(users[uid], "rare_10"):
-                new_codes.append("rare_10")
-            if len(rare_ids) >= 50 and grant_achievement(users[uid], "rare_50"):
-                new_codes.append("rare_50")
-            counts = Counter(c["id"] for c in users[uid]["cards"])
-            if any(v >= 2 for v in counts.values()) and grant_achievement(users[uid], "first_duplicate"):
-                new_codes.append("first_duplicate")
-            if any(v >= 10 for v in counts.values()) and grant_achievement(users[uid], "duplicate_10"):
-                new_codes.append("duplicate_10")
-            if len([v for v in counts.values() if v >= 2]) >= 20 and grant_achievement(users[uid], "duplicates_20_cards"):
-                new_codes.append("duplicates_20_cards")
-            set_ids = {c["id"].split("-")[0] for c in users[uid]["cards"]}
-            if len(set_ids) >= 1 and grant_achievement(users[uid], "first_set"):
-                new_codes.append("first_set")
-            if len(set_ids) >= 5 and grant_achievement(users[uid], "sets_5"):
-                new_codes.append("sets_5")
-            if len(set_ids) >= 10 and grant_achievement(users[uid], "sets_10"):
-                new_codes.append("sets_10")
-            if len(set_ids) == len(all_sets) and grant_achievement(users[uid], "sets_all"):
-                new_codes.append("sets_all")
-            if check_for_all_achievements(users[uid]) and grant_achievement(users[uid], "all_achievements"):
-                new_codes.append("all_achievements")
-            save_users(users)
-            for code in new_codes:
-                await send_achievement_message(interaction, code)
-            drop_channel = None
-            if hasattr(interaction, "guild") and interaction.guild:
-                drop_channel = interaction.guild.get_channel(DROP_CHANNEL_ID)
-            # Najdroższa karta powyżej 50 USD
-            max_card = None
-            max_price = 0
-            for card in self.cards:
-                price = card_price_usd(card) or 0
-                if price > max_price:
-                    max_price = price
-                    max_card = card
-            if drop_channel and max_card and max_price >= 50:
-                price_bc = usd_to_bc(max_price)
-                embed = create_embed(
-                    title="🔥 WYJĄTKOWY DROP!",
-                    description=(
-                        f"{interaction.user.mention} trafił/a **{max_card['name']}**\n"
-                        f"`{max_card.get('set', {}).get('ptcgoCode', '-')}` | #{max_card.get('number', '-') }\n"
-                        f"Wartość: {format_bc(price_bc)}"
-                    ),
-                    color=discord.Color.gold(),
-                )
-                if "images" in max_card and "large" in max_card["images"]:
-                    embed.set_image(url=max_card["images"]["large"])
-                await drop_channel.send(embed=embed)
-            summary = "\n".join(self.summaries)
-            total_usd = sum(card_price_usd(c) or 0 for c in self.cards)
-            total_bc = usd_to_bc(total_usd)
-            podsumowanie = (
-                f"💰 **Suma wartości boostera:** {total_usd:.2f} USD ({format_bc(total_bc)})\n"
-                f"♻️ **Wartość duplikatów:** {format_bc(duplicate_bc)}"
-            )
-            class AfterBoosterView(View):
-                def __init__(self, duplicates):
-                    super().__init__(timeout=120)
-                    self.duplicates = duplicates
-                    if not self.duplicates:
-                        self.sell_duplicates.disabled = True
-
-                @discord.ui.button(label="Przejdź do profilu", style=discord.ButtonStyle.primary)
-                async def to_collection(self, i: discord.Interaction, button: Button):
-                    users = load_users()
-                    user = users[str(i.user.id)]
-                    all_sets = get_all_sets()
-                    boosters_counter = Counter(user["boosters"])
-                    view = CollectionMainView(user, boosters_counter, all_sets)
-                    embed = await view.build_summary_embed()
-                    file = discord.File(GRAPHIC_DIR / "kolekcja.png", filename="kolekcja.png")
-                    await i.response.send_message(embed=embed, view=view, ephemeral=True, file=file)
-
-                @discord.ui.button(label="Sprzedaj duplikaty", style=discord.ButtonStyle.danger)
-                async def sell_duplicates(self, i: discord.Interaction, button: Button):
-                    users = load_users()
-                    user = users[str(i.user.id)]
-                    total = 0
-                    remaining = []
-                    counts = Counter(d["id"] for d in self.duplicates)
-                    for c in user["cards"]:
-                        if counts.get(c["id"], 0) > 0:
-                            counts[c["id"]] -= 1
-                            total += usd_to_bc(c.get("price_usd", 0))
-                        else:
-                            remaining.append(c)
-                    user["cards"] = remaining
-                    user["money"] = user.get("money", 0) + total
-                    user["money_sales"] = user.get("money_sales", 0) + total
-                    save_users(users)
-                    button.disabled = True
-                    await i.response.edit_message(view=self)
-                    await i.followup.send(f"Sprzedano duplikaty za {format_bc(total)}", ephemeral=True)
-            await interaction.edit_original_response(
-                content=(
-                    f"{random.choice(FUN_EMOJIS)} Koniec boostera! Oto Twoje karty:\n"
-                    f"```{summary}```\n"
-                    f"{podsumowanie}"
+        catalog = get_card_catalog()
+        cards = [reveal_card(cid) for cid in self.card_ids]
+        summary_lines = []
+        duplicate_cards = Counter()
+        duplicate_usd = 0.0
+        for i, card in enumerate(cards):
+            rarity = card.get("rarity") or "Unknown"
+            emoji = RARITY_EMOJIS.get(rarity, "❔")
+            line = f"{emoji} {card['name']} ({rarity})"
+            if self.duplicate_mask >> i & 1:
+                line += " ♻️"
+                duplicate_cards[card["id"]] += 1
+                duplicate_usd += catalog.price(card["id"])
+            summary_lines.append(line)
+        duplicate_bc = usd_to_bc(duplicate_usd)
+        all_sets = await aget_all_sets()
+        for code in self.new_codes:
+            await send_achievement_message(interaction, code)
+        drop_channel = None
+        if hasattr(interaction, "guild") and interaction.guild:
+            drop_channel = interaction.guild.get_channel(DROP_CHANNEL_ID)
+        # Najdroższa karta powyżej 50 USD
+        max_card = None
+        max_price = 0
+        for card in cards:
+            price = catalog.price(card["id"])
+            if price > max_price:
+                max_price = price
+                max_card = card
+        if drop_channel and max_card and max_price >= 50:
+            price_bc = usd_to_bc(max_price)
+            embed = create_embed(
+                title="🔥 WYJĄTKOWY DROP!",
+                description=(
+                    f"{interaction.user.mention} trafił/a **{max_card['name']}**\n"
+                    f"`{max_card.get('set', {}).get('ptcgoCode', '-')}` | #{max_card.get('number', '-') }\n"
+                    f"Wartość: {format_bc(price_bc)}"
                 ),
-                embed=None,
-                view=AfterBoosterView(duplicate_cards),
-            )
-            # Send public summary with image of the best card
-            best_card = max(self.cards, key=lambda c: card_price_usd(c) or 0)
-            img = best_card.get("images", {}).get("large") or best_card.get("images", {}).get("small")
-            public_embed = None
-            if img:
-                public_embed = create_embed(title="Najlepsza karta", color=discord.Color.gold())
-                public_embed.set_image(url=img)
-            booster_name = next((s['name'] for s in all_sets if s['id'] == self.set_id), self.set_id)
-            public_msg = (
-                f"{interaction.user.display_name} otworzył {booster_name} o wartości {format_bc(total_bc)}"
+                color=discord.Color.gold(),
             )
-            target_channel = None
-            if interaction.guild:
-                target_channel = interaction.guild.get_channel(SHOP_CHANNEL_ID)
-            if target_channel:
-                await target_channel.send(content=public_msg, embed=public_embed, view=QuickBonusView.DropRatingView(self.user_id))
-            else:
-                await interaction.followup.send(content=public_msg, embed=public_embed, view=QuickBonusView.DropRatingView(self.user_id), ephemeral=False)
+            if "images" in max_card and "large" in max_card["images"]:
+                embed.set_image(url=max_card["images"]["large"])
+            await drop_channel.send(embed=embed)
+        summary = "\n".join(summary_lines)
+        total_usd = sum(catalog.price(c["id"]) for c in cards)
+        total_bc = usd_to_bc(total_usd)
+        podsumowanie = (
+            f"💰 **Suma wartości boostera:** {total_usd:.2f} USD ({format_bc(total_bc)})\n"
+            f"♻️ **Wartość duplikatów:** {format_bc(duplicate_bc)}"
+        )
+        class AfterBoosterView(View):
+            def __init__(self, duplicates):
+                super().__init__(timeout=120)
+                self.duplicates = duplicates
+                if not self.duplicates:
+                    self.sell_duplicates.disabled = True
+
+            @discord.ui.button(label="Przejdź do profilu", style=discord.ButtonStyle.primary)
+            async def to_collection(self, i: discord.Interaction, button: Button):
+                user = ensure_user_fields(await aload_user(i.user.id))
+                all_sets = await aget_all_sets()
+                boosters_counter = Counter(user["boosters"])
+                view = CollectionMainView(user, boosters_counter, all_sets, i.user.id)
+                embed = await view.build_summary_embed()
+                file = discord.File(GRAPHIC_DIR / "kolekcja.png", filename="kolekcja.png")
+                await i.response.send_message(embed=embed, view=view, ephemeral=True, file=file)
+
+            @discord.ui.button(label="Sprzedaj duplikaty", style=discord.ButtonStyle.danger)
+            async def sell_duplicates(self, i: discord.Interaction, button: Button):
+                total = await update_user(i.user.id, lambda u: sell_cards(u, self.duplicates)) or 0
+                button.disabled = True
+                await i.response.edit_message(view=self)
+                await i.followup.send(f"Sprzedano duplikaty za {format_bc(total)}", ephemeral=True)
+        await interaction.edit_original_response(
+            content=(
+                f"{random.choice(FUN_EMOJIS)} Koniec boostera! Oto Twoje karty:\n"
+                f"```{summary}```\n"
+                f"{podsumowanie}"
+            ),
+            embed=None,
+            view=AfterBoosterView(duplicate_cards),
+        )
+        # Send public summary with image of the best card
+        best_card = max(cards, key=lambda c: catalog.price(c["id"]))
+        img = best_card.get("images", {}).get("large") or best_card.get("images", {}).get("small")
+        public_embed = None
+        if img:
+            public_embed = create_embed(title="Najlepsza karta", color=discord.Color.gold())
+            public_embed.set_image(url=img)
+        booster_name = all_sets.name(self.set_id)
+        public_msg = (
+            f"{interaction.user.display_name} otworzył {booster_name} o wartości {format_bc(total_bc)}"
+        )
+        target_channel = None
+        if interaction.guild:
+            target_channel = interaction.guild.get_channel(SHOP_CHANNEL_ID)
+        if target_channel:
+            await target_channel.send(content=public_msg, embed=public_embed, view=QuickBonusView.DropRatingView(self.user_id))
+        else:
+            await interaction.followup.send(content=public_msg, embed=public_embed, view=QuickBonusView.DropRatingView(self.user_id), ephemeral=False)
         self.stop()
 
     async def interaction_check(self, interaction):
         return str(interaction.user.id) == self.user_id
 
     async def show_card(self, interaction, first=False):
-        if self.index >= len(self.cards):
+        if self.index >= len(self.card_ids):
             await self.finalize(interaction)
             return
-        card = self.cards[self.index]
-        rarity = card.get("rarity", "Unknown")
+        card = reveal_card(self.card_ids[self.index])
+        rarity = card.get("rarity") or "Unknown"
         emoji = RARITY_EMOJIS.get(rarity, "❔")
         rarity_colors = RARITY_COLORS
         embed = create_embed(
@@ -1908,16 +2051,10 @@ class CardRevealView(View):
             color=rarity_colors.get(rarity, 0xFFFFFF)
         )
         embed.set_image(url=card["images"]["large"])
-        embed.set_footer(text=f"Karta {self.index + 1} z {len(self.cards)}")
+        embed.set_footer(text=f"Karta {self.index + 1} z {len(self.card_ids)}")
         if self.set_logo_url:
             embed.set_thumbnail(url=self.set_logo_url)
-        price = None
-        if "tcgplayer" in card and "prices" in card["tcgplayer"]:
-            prices = card["tcgplayer"]["prices"]
-            for ver in prices.values():
-                if "market" in ver and ver["market"]:
-                    price = ver["market"]
-                    break
+        price = get_card_catalog().price(card["id"])
         if price:
             embed.add_field(
                 name="Wartość rynkowa",
@@ -1926,9 +2063,8 @@ class CardRevealView(View):
             )
         else:
             embed.add_field(name="Wartość rynkowa", value="Brak danych", inline=True)
-        self.summaries.append(f"{emoji} {card['name']} ({rarity})")
         self.clear_items()
-        if self.index < len(self.cards) - 1:
+        if self.index < len(self.card_ids) - 1:
             self.add_item(self.NextCardButton(self))
         else:
             self.add_item(self.SummaryButton(self))
@@ -2005,60 +2141,52 @@ async def start_cmd(interaction: discord.Interaction):
 @client.tree.command(name="otworz", description="Otwórz booster i zobacz karty jedna po drugiej!")
 async def otworz(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    users = load_users()
-    if user_id not in users or not users[user_id]["boosters"]:
+    user = await aload_user(user_id)
+    if user is None or not user["boosters"]:
         await interaction.response.send_message("❌ Nie masz boosterów do otwarcia! Odwiedź `/sklep`.", ephemeral=True)
         return
-    ensure_user_fields(users[user_id])
-    all_sets = get_all_sets()
-    id_to_name = {s['id']: s['name'] for s in all_sets}
-    booster_counts = Counter(users[user_id]["boosters"])
+    ensure_user_fields(user)
+    all_sets = await aget_all_sets()
+    booster_counts = Counter(user["boosters"])
     if len(booster_counts) > 1:
         options = [
-            discord.SelectOption(label=f"{id_to_name.get(booster_id, booster_id)} x{qty}", value=booster_id)
+            discord.SelectOption(label=f"{all_sets.name(booster_id)} x{qty}", value=booster_id)
             for booster_id, qty in booster_counts.items()
         ]
         class BoosterSelectView(View):
             @select(placeholder="Wybierz booster do otwarcia", options=options)
             async def select_callback(self, i2: discord.Interaction, menu_booster: discord.ui.Select):
                 chosen = menu_booster.values[0]
-                users[user_id]["boosters"].remove(chosen)
-                save_users(users)
                 await i2.response.defer(ephemeral=True)
-                await i2.followup.send(
-                    "⏳ Dodano do kolejki otwierania boostera...",
-                    ephemeral=True,
-                )
-                await BOOSTER_QUEUE.put((i2, chosen))
+                if not await enqueue_booster(i2, chosen):
+                    await i2.followup.send("Nie znaleziono boostera.", ephemeral=True)
         await interaction.response.send_message("🃏 Wybierz booster do otwarcia:", view=BoosterSelectView(), ephemeral=True)
     else:
-        chosen = users[user_id]["boosters"].pop(0)
-        save_users(users)
+        chosen = user["boosters"][0]
         await interaction.response.defer(ephemeral=True)
-        await interaction.followup.send(
-            "⏳ Dodano do kolejki otwierania boostera...",
-            ephemeral=True,
-        )
-        await BOOSTER_QUEUE.put((interaction, chosen))
+        if not await enqueue_booster(interaction, chosen):
+            await interaction.followup.send("Nie znaleziono boostera.", ephemeral=True)
 
 # --- KOMENDA Otwórz Szybko ---
+# Boostery losowane są hurtowo, więc limit może być wysoki
+QUICK_OPEN_MAX = 500
+
 @client.tree.command(name="otworz_szybko", description="Otwórz booster bez animacji")
 @app_commands.describe(count="Ile boosterów otworzyć")
-async def otworz_szybko(interaction: discord.Interaction, count: app_commands.Range[int, 1, 10] = 1):
+async def otworz_szybko(interaction: discord.Interaction, count: app_commands.Range[int, 1, QUICK_OPEN_MAX] = 1):
     user_id = str(interaction.user.id)
-    users = load_users()
-    if user_id not in users or not users[user_id]["boosters"]:
+    user = await aload_user(user_id)
+    if user is None or not user["boosters"]:
         await interaction.response.send_message(
             "❌ Nie masz boosterów do otwarcia! Odwiedź `/sklep`.", ephemeral=True
         )
         return
-    ensure_user_fields(users[user_id])
-    all_sets = get_all_sets()
-    id_to_name = {s['id']: s['name'] for s in all_sets}
-    booster_counts = Counter(users[user_id]["boosters"])
+    ensure_user_fields(user)
+    all_sets = await aget_all_sets()
+    booster_counts = Counter(user["boosters"])
     if len(booster_counts) > 1:
         options = [
-            discord.SelectOption(label=f"{id_to_name.get(booster_id, booster_id)} x{count}", value=booster_id)
+            discord.SelectOption(label=f"{all_sets.name(booster_id)} x{count}", value=booster_id)
             for booster_id, count in booster_counts.items()
         ]
 
@@ -2066,45 +2194,62 @@ async def otworz_szybko(interaction: discord.Interaction, count: app_commands.Ra
             @select(placeholder="Wybierz booster do otwarcia", options=options)
             async def select_callback(self, i2: discord.Interaction, menu_booster: discord.ui.Select):
                 chosen = menu_booster.values[0]
-                if booster_counts[chosen] < count:
-                    await i2.response.send_message("❌ Masz za mało boosterów tego typu.", ephemeral=True)
-                    return
-                for _ in range(count):
-                    users[user_id]["boosters"].remove(chosen)
-                save_users(users)
                 await i2.response.defer(ephemeral=True, thinking=True)
                 await open_booster_quick(i2, chosen, count=count)
 
         await interaction.response.send_message("🃏 Wybierz booster do otwarcia:", view=BoosterSelectView(), ephemeral=True)
     else:
-        chosen = users[user_id]["boosters"][0]
-        if booster_counts[chosen] < count:
-            await interaction.response.send_message(
-                "❌ Masz za mało boosterów tego typu.", ephemeral=True
-            )
-            return
-        for _ in range(count):
-            users[user_id]["boosters"].remove(chosen)
-        save_users(users)
+        chosen = user["boosters"][0]
         await interaction.response.defer(ephemeral=True, thinking=True)
         await open_booster_quick(interaction, chosen, count=count)
 
 # --- FUNKCJA Otwierania boostera (z logo setu) ---
-async def open_booster(interaction, set_id):
-    cards = await fetch_cards_from_set(set_id, user_id=str(interaction.user.id))
+async def open_booster(interaction, set_id, job_id=None):
+    # Rare Boost został zużyty razem z boosterem i zapisany w zadaniu
+    job = BOOSTER_JOURNAL.jobs.get(job_id) or {}
+    cards = await fetch_cards_from_set(set_id, user_id=str(interaction.user.id), boost=bool(job.get("r")))
     if not cards:
-        await interaction.edit_original_response(content="⚠️ Nie udało się pobrać kart z boostera!", embed=None, view=None)
+        content = "⚠️ Nie udało się pobrać kart z boostera!"
+        job = BOOSTER_JOURNAL.claim(job_id)
+        if job is not None:
+            await settle_booster_job(job_id, job)
+            content += " Booster wrócił do Twojej kolekcji."
+        await interaction.edit_original_response(content=content, embed=None, view=None)
         return
+    user_id = str(interaction.user.id)
+    all_sets = await aget_all_sets()
+    if job_id is not None:
+        await BOOSTER_JOURNAL.drawn(job_id, [c["id"] for c in cards])
+        job = BOOSTER_JOURNAL.claim(job_id)
+        if job is None:
+            # Zadanie zostało już rozliczone inną drogą
+            return
 
-    all_sets = get_all_sets()
-    set_data = next((s for s in all_sets if s["id"] == set_id), None)
-    logo_url = set_data["images"]["logo"] if set_data and "images" in set_data and "logo" in set_data["images"] else None
+    # Karty trafiają do kolekcji od razu po losowaniu - widok tylko je pokazuje
+    try:
+        async with edit_user(user_id) as user:
+            if user is not None:
+                new_codes, duplicate_mask = grant_booster_cards(user_id, user, set_id, cards, all_sets)
+                # Nowe karty trafiają do katalogu przed zapisem gracza
+                await asave_card_catalog()
+    except Exception:
+        # Nieudana edycja jest porzucana - zadanie dopisuje karty osobno
+        if job_id is not None:
+            await settle_booster_job(job_id, job)
+        raise
+    # Przejęte zadanie zawsze jest rozliczane, także gdy konto zniknęło
+    if job_id is not None:
+        await BOOSTER_JOURNAL.settled(job_id, "credited")
+    if user is None:
+        return
 
     view = CardRevealView(
-        cards,
-        user_id=str(interaction.user.id),
+        [c["id"] for c in cards],
+        user_id=user_id,
         set_id=set_id,
-        set_logo_url=logo_url,
+        set_logo_url=all_sets.logo(set_id),
+        duplicate_mask=duplicate_mask,
+        new_codes=new_codes,
     )
     view.interaction = interaction
 
@@ -2112,124 +2257,261 @@ async def open_booster(interaction, set_id):
     # always edit the original response to show the first card.
     await view.show_card(interaction, first=True)
 
+# Dziennik zadań otwierania: booster zabrany z ekwipunku, wylosowane karty,
+# rozliczenie. Po restarcie niedokończone zadania są dopisywane albo zwracane.
+BOOSTER_JOURNAL = JobJournal(
+    BASE_DIR / "booster_jobs.jsonl",
+    write=run_io_write,
+    barrier=abarrier_users,
+)
+
+async def settle_booster_job(job_id, job):
+    """Rozlicz zadanie bez widoku odsłaniania: dopisz wylosowane karty albo zwróć booster."""
+    drawn = "c" in job
+    packs = job.get("n", 1)
+    catalog = get_card_catalog()
+    async with edit_user(job["u"]) as user:
+        if user is not None:
+            if drawn:
+                # Otwarcie hurtowe zapisuje {id: kopie}, pojedyncze listę id
+                counts = job["c"] if isinstance(job["c"], dict) else Counter(job["c"])
+                for cid, qty in counts.items():
+                    card = catalog.card(cid)
+                    if card is not None:
+                        credit_card(user, card, qty)
+                    else:
+                        add_cards(user, catalog, cid, qty)
+                user["boosters_opened"] = user.get("boosters_opened", 0) + packs
+            else:
+                user["boosters"].extend([job["s"]] * packs)
+                user["rare_boost"] = user.get("rare_boost", 0) + job.get("r", 0)
+    await BOOSTER_JOURNAL.settled(job_id, "credited" if drawn else "refunded")
+
+async def replay_booster_journal():
+    """Dokończ otwarcia boosterów przerwane restartem bota."""
+    jobs = await run_io_read(BOOSTER_JOURNAL.load)
+    for job_id in jobs:
+        BOOSTER_JOURNAL.claim(job_id)
+    await asyncio.gather(*(settle_booster_job(job_id, job) for job_id, job in jobs.items()))
+    if jobs:
+        print(f"♻️ Rozliczono {len(jobs)} przerwanych otwarć boosterów")
+    await BOOSTER_JOURNAL.compact()
+
+async def open_booster_job(job):
+    interaction, set_id, job_id = job
+    try:
+        await open_booster(interaction, set_id, job_id)
+    except Exception as e:
+        print(f"Error opening booster: {e}")
+        job_state = BOOSTER_JOURNAL.claim(job_id)
+        if job_state is not None:
+            await settle_booster_job(job_id, job_state)
+        try:
+            await interaction.edit_original_response(
+                content="❌ Wystąpił błąd podczas otwierania boostera.",
+                embed=None,
+                view=None,
+            )
+        except Exception:
+            pass
+        raise
+
+async def expire_booster_job(job):
+    # Interakcja wygasa po 15 minutach - booster wraca do gracza zamiast przepaść
+    interaction, set_id, job_id = job
+    job_state = BOOSTER_JOURNAL.claim(job_id)
+    if job_state is None:
+        return
+    await settle_booster_job(job_id, job_state)
+    print(f"⌛ Zwrócono booster {set_id} graczowi {interaction.user.id} (za długo w kolejce)")
+    try:
+        await interaction.edit_original_response(
+            content="⌛ Kolejka była zbyt długa - booster wrócił do Twojej kolekcji.",
+            embed=None,
+            view=None,
+        )
+    except Exception:
+        pass
+
+# Kolejka do otwierania boosterów - pula workerów podzielona po ID gracza,
+# więc boostery jednego gracza otwierają się po kolei, a różni gracze równolegle.
+# Kolejka jest ograniczona: limit oczekujących na worker, limit na gracza
+# i termin, po którym booster jest zwracany zamiast otwierany.
+BOOSTER_WORKERS = int(os.environ.get("BOOSTER_WORKERS", "4"))
+BOOSTER_QUEUE = ShardedQueue(
+    open_booster_job,
+    workers=BOOSTER_WORKERS,
+    max_depth=int(os.environ.get("BOOSTER_QUEUE_MAX", "50")),
+    per_key=int(os.environ.get("BOOSTER_QUEUE_PER_USER", "5")),
+    deadline=float(os.environ.get("BOOSTER_QUEUE_DEADLINE", "600")),
+    on_expired=expire_booster_job,
+)
+
+def format_eta(seconds):
+    seconds = max(1, int(seconds + 0.5))
+    if seconds < 120:
+        return f"{seconds} s"
+    return f"{(seconds + 59) // 60} min"
+
+async def start_booster_job(job_id, user_id, set_id, count=1):
+    """Zabierz graczowi ``count`` boosterów i Rare Boosty jako zadanie w dzienniku.
+
+    Wpis "enqueued" trafia na dysk, zanim zniknie booster, więc po awarii
+    booster i boosty wracają do gracza. Zwraca liczbę zużytych boostów
+    albo ``None``, gdy gracz ma za mało boosterów.
+    """
+    async with edit_user(user_id) as user:
+        if user is None or user["boosters"].count(set_id) < count:
+            return None
+        boosts = min(user.get("rare_boost", 0), count)
+        await BOOSTER_JOURNAL.enqueued(job_id, user_id, set_id, count, boosts)
+        take_boosters(user, set_id, count)
+        consume_rare_boosts(user, count)
+    return boosts
+
+async def enqueue_booster(interaction, set_id):
+    """Zabierz booster, dodaj jego otwarcie do kolejki i podaj graczowi pozycję.
+
+    Zwraca False, gdy gracz nie ma boostera tego setu.
+    """
+    user_id = str(interaction.user.id)
+    job_id = BOOSTER_JOURNAL.new_id()
+    if await start_booster_job(job_id, user_id, set_id) is None:
+        return False
+    try:
+        position = BOOSTER_QUEUE.put(user_id, (interaction, set_id, job_id))
+    except QueueFull as e:
+        job = BOOSTER_JOURNAL.claim(job_id)
+        if job is not None:
+            await settle_booster_job(job_id, job)
+        if e.reason == "user":
+            msg = f"🚦 Masz już {BOOSTER_QUEUE.per_key} boosterów w kolejce."
+        else:
+            msg = "🚦 Kolejka otwierania boosterów jest pełna."
+        await interaction.followup.send(
+            f"{msg} Spróbuj ponownie za ok. {format_eta(e.eta)} - booster wrócił do Twojej kolekcji.",
+            ephemeral=True,
+        )
+        return True
+    await interaction.followup.send(
+        f"⏳ Dodano do kolejki otwierania boostera (pozycja w kolejce: {position}, "
+        f"ok. {format_eta(BOOSTER_QUEUE.service_time() * position)})...",
+        ephemeral=True,
+    )
+    return True
+
 # --- FUNKCJA Szybkiego otwierania boostera ---
 async def open_booster_quick(interaction, set_id, *, count: int = 1):
     """Otwórz jeden lub więcej boosterów bez animacji i pokaż podsumowanie."""
     user_id = str(interaction.user.id)
-    all_cards = []
-    for _ in range(count):
-        cards = await fetch_cards_from_set(set_id, user_id=user_id)
-        if not cards:
-            continue
-        all_cards.extend(cards)
-
-    if not all_cards:
+    # Wszystkie boostery losowane są naraz: jedno sprawdzenie eventów,
+    # jedno zużycie boostów i jedno losowanie całej paczki
+    job_id = BOOSTER_JOURNAL.new_id()
+    boosts = await start_booster_job(job_id, user_id, set_id, count)
+    if boosts is None:
+        await interaction.edit_original_response(content="❌ Masz za mało boosterów tego typu.")
+        return
+    event_boost = "drop" in await aactive_event_types()
+    boosted = count if event_boost else boosts
+    open_id, rng = OPEN_LOG.stream()
+    try:
+        counts_added = await BOOSTER_ENGINE.open_bulk(set_id, count, boosted=boosted, rng=rng)
+    except Exception as e:
+        print(f"Error opening boosters: {e}")
+        counts_added = None
+    if counts_added:
+        entry = OPEN_LOG.entry_for_bulk(open_id, user_id, set_id, count, boosted, counts_added)
+        await run_io_write(OPEN_LOG.append, [entry])
+        await BOOSTER_JOURNAL.drawn(job_id, counts_added)
+    job = BOOSTER_JOURNAL.claim(job_id)
+
+    if not counts_added:
+        content = "⚠️ Nie udało się pobrać kart z boostera!"
+        if job is not None:
+            await settle_booster_job(job_id, job)
+            content += " Boostery wróciły do Twojej kolekcji."
+        await interaction.edit_original_response(content=content, embed=None, view=None)
+        return
+    if job is None:
+        # Zadanie zostało już rozliczone inną drogą
+        return
+    catalog = get_card_catalog()
+    drawn_cards = {cid: catalog.card(cid) for cid in counts_added}
+    # Karta mogła zniknąć z katalogu przy odświeżeniu setu między losowaniem a zapisem
+    unknown = [cid for cid, card in drawn_cards.items() if card is None]
+    if unknown:
+        print(f"⚠️ Pominięto nieznane karty z otwarcia {job_id}: {', '.join(unknown)}")
+        for cid in unknown:
+            del drawn_cards[cid]
+            del counts_added[cid]
+    if not drawn_cards:
+        # Bez żadnej znanej karty całe otwarcie wraca do gracza
+        job.pop("c", None)
+        await settle_booster_job(job_id, job)
         await interaction.edit_original_response(
-            content="⚠️ Nie udało się pobrać kart z boostera!", embed=None, view=None
+            content="⚠️ Nie udało się pobrać kart z boostera! Boostery wróciły do Twojej kolekcji.",
+            embed=None,
+            view=None,
         )
         return
 
-    users = load_users()
-    ensure_user_fields(users[user_id])
-    user = users[user_id]
-
-    existing_before = Counter(c["id"] for c in user["cards"])
-    existing = existing_before.copy()
-    counts_added = Counter()
-    summary_info = {}
-    duplicate_cards = []
-    duplicate_usd = 0.0
-    max_price = 0.0
-    max_name = ""
-
-    for card in all_cards:
-        price = card_price_usd(card)
-        img_url = ""
-        if "images" in card:
-            img_url = card["images"].get("small") or card["images"].get("large") or ""
-        rarity = card.get("rarity", "Unknown")
-        emoji = RARITY_EMOJIS.get(rarity, "❔")
-        summary_info[card["id"]] = {"name": card["name"], "rarity": rarity, "emoji": emoji}
-        if existing[card["id"]] > 0:
-            duplicate_cards.append({"id": card["id"], "price_usd": price or 0})
-            if price:
-                duplicate_usd += price
-        counts_added[card["id"]] += 1
-        existing[card["id"]] += 1
-        user["cards"].append({
-            "id": card["id"],
-            "name": card["name"],
-            "price_usd": price or 0,
-            "img_url": img_url,
-            "rarity": rarity,
-        })
-        if price and price > max_price:
-            max_price = price
-            max_name = card["name"]
+    try:
+        async with edit_user(user_id) as user:
+            if user is not None:
+                existing_before = {cid: user["cards"].get(cid, 0) for cid in counts_added}
+                summary_info = {}
+                duplicate_cards = Counter()
+                duplicate_usd = 0.0
+                max_price = 0.0
+                max_name = ""
+
+                for cid, qty in counts_added.items():
+                    card = drawn_cards[cid]
+                    price = card_price_usd(card)
+                    rarity = card.get("rarity", "Unknown")
+                    emoji = RARITY_EMOJIS.get(rarity, "❔")
+                    summary_info[cid] = {"name": card["name"], "rarity": rarity, "emoji": emoji}
+                    # Pierwsza kopia nowej karty nie jest duplikatem
+                    duplicates = qty if cid in user["cards"] else qty - 1
+                    if duplicates:
+                        duplicate_cards[cid] += duplicates
+                        if price:
+                            duplicate_usd += price * duplicates
+                    credit_card(user, card, qty)
+                    if price and price > max_price:
+                        max_price = price
+                        max_name = card["name"]
 
-    duplicate_bc = usd_to_bc(duplicate_usd)
-    update_weekly_best(user, max_price, max_name)
-    all_sets = get_all_sets()
-    new_codes = []
-    if check_master_set(user, set_id, all_sets):
-        new_codes.append(f"master:{set_id}")
-
-    user["boosters_opened"] = user.get("boosters_opened", 0) + count
-    opened = user["boosters_opened"]
-    if opened >= 1 and grant_achievement(user, "first_booster"):
-        new_codes.append("first_booster")
-    if opened >= 5 and grant_achievement(user, "open_5_boosters"):
-        new_codes.append("open_5_boosters")
-    if opened >= 25 and grant_achievement(user, "open_25_boosters"):
-        new_codes.append("open_25_boosters")
-    if opened >= 100 and grant_achievement(user, "open_100_boosters"):
-        new_codes.append("open_100_boosters")
-    if opened >= 500 and grant_achievement(user, "open_500_boosters"):
-        new_codes.append("open_500_boosters")
-
-    total_cards = len(user["cards"])
-    if total_cards >= 1 and grant_achievement(user, "first_card"):
-        new_codes.append("first_card")
-    if total_cards >= 50 and grant_achievement(user, "cards_50"):
-        new_codes.append("cards_50")
-    if total_cards >= 250 and grant_achievement(user, "cards_250"):
-        new_codes.append("cards_250")
-    if total_cards >= 1000 and grant_achievement(user, "cards_1000"):
-        new_codes.append("cards_1000")
-    rare_ids = {c["id"] for c in user["cards"] if c.get("rarity") == "Rare"}
-    if len(rare_ids) >= 1 and grant_achievement(user, "first_rare"):
-        new_codes.append("first_rare")
-    if len(rare_ids) >= 10 and grant_achievement(user, "rare_10"):
-        new_codes.append("rare_10")
-    if len(rare_ids) >= 50 and grant_achievement(user, "rare_50"):
-        new_codes.append("rare_50")
-    counts_total = Counter(c["id"] for c in user["cards"])
-    if any(v >= 2 for v in counts_total.values()) and grant_achievement(user, "first_duplicate"):
-        new_codes.append("first_duplicate")
-    if any(v >= 10 for v in counts_total.values()) and grant_achievement(user, "duplicate_10"):
-        new_codes.append("duplicate_10")
-    if len([v for v in counts_total.values() if v >= 2]) >= 20 and grant_achievement(user, "duplicates_20_cards"):
-        new_codes.append("duplicates_20_cards")
-    set_ids = {c["id"].split("-")[0] for c in user["cards"]}
-    if len(set_ids) >= 1 and grant_achievement(user, "first_set"):
-        new_codes.append("first_set")
-    if len(set_ids) >= 5 and grant_achievement(user, "sets_5"):
-        new_codes.append("sets_5")
-    if len(set_ids) >= 10 and grant_achievement(user, "sets_10"):
-        new_codes.append("sets_10")
-    if len(set_ids) == len(all_sets) and grant_achievement(user, "sets_all"):
-        new_codes.append("sets_all")
-    if check_for_all_achievements(user) and grant_achievement(user, "all_achievements"):
-        new_codes.append("all_achievements")
+                duplicate_bc = usd_to_bc(duplicate_usd)
+                update_weekly_best(user_id, user, max_price, max_name)
+                all_sets = await aget_all_sets()
+                new_codes = []
+                if check_master_set(user, set_id, all_sets):
+                    new_codes.append(f"master:{set_id}")
+
+                user["boosters_opened"] = user.get("boosters_opened", 0) + count
+                new_codes += check_collection_achievements(user, all_sets)
+                if check_for_all_achievements(user) and grant_achievement(user, "all_achievements"):
+                    new_codes.append("all_achievements")
+                await asave_card_catalog()
+    except Exception:
+        # Nieudana edycja jest porzucana - zadanie dopisuje karty osobno
+        await settle_booster_job(job_id, job)
+        raise
+    if user is None:
+        # Konto zniknęło w trakcie otwierania - nie ma komu dopisać kart
+        await BOOSTER_JOURNAL.settled(job_id, "refunded")
+        await interaction.edit_original_response(content="❌ Nie znaleziono Twojego konta.", embed=None, view=None)
+        return
+    await BOOSTER_JOURNAL.settled(job_id, "credited")
 
-    save_users(users)
     for code in new_codes:
         await send_achievement_message(interaction, code)
 
     drop_channel = None
     if hasattr(interaction, "guild") and interaction.guild:
         drop_channel = interaction.guild.get_channel(DROP_CHANNEL_ID)
-    best_card = max(all_cards, key=lambda c: card_price_usd(c) or 0)
+    best_card = max(drawn_cards.values(), key=lambda c: card_price_usd(c) or 0)
     best_price = card_price_usd(best_card) or 0
     if drop_channel and best_price >= 50:
         price_bc = usd_to_bc(best_price)
@@ -2257,10 +2539,10 @@ async def open_booster_quick(interaction, set_id, *, count: int = 1):
         summary_lines.append(line)
 
     summary = "\n".join(summary_lines)
-    total_usd = sum(card_price_usd(c) or 0 for c in all_cards)
+    total_usd = sum((card_price_usd(drawn_cards[cid]) or 0) * qty for cid, qty in counts_added.items())
     total_bc = usd_to_bc(total_usd)
 
-    top_sorted = sorted(all_cards, key=lambda c: card_price_usd(c) or 0, reverse=True)[:5]
+    top_sorted = sorted(drawn_cards.values(), key=lambda c: card_price_usd(c) or 0, reverse=True)[:5]
     top_lines = [
         f"{idx+1}. {c['name']} — {format_bc_plain(usd_to_bc(card_price_usd(c) or 0))}"
         for idx, c in enumerate(top_sorted)
@@ -2282,32 +2564,17 @@ async def open_booster_quick(interaction, set_id, *, count: int = 1):
 
         @discord.ui.button(label="Przejdź do profilu", style=discord.ButtonStyle.primary)
         async def to_collection(self, i: discord.Interaction, button: Button):
-            users = load_users()
-            user = users[str(i.user.id)]
-            all_sets = get_all_sets()
+            user = ensure_user_fields(await aload_user(i.user.id))
+            all_sets = await aget_all_sets()
             boosters_counter = Counter(user["boosters"])
-            view = CollectionMainView(user, boosters_counter, all_sets)
+            view = CollectionMainView(user, boosters_counter, all_sets, i.user.id)
             embed = await view.build_summary_embed()
             file = discord.File(GRAPHIC_DIR / "kolekcja.png", filename="kolekcja.png")
             await i.response.send_message(embed=embed, view=view, ephemeral=True, file=file)
 
         @discord.ui.button(label="Sprzedaj duplikaty", style=discord.ButtonStyle.danger)
         async def sell_duplicates(self, i: discord.Interaction, button: Button):
-            users = load_users()
-            user = users[str(i.user.id)]
-            total = 0
-            remaining = []
-            counts = Counter(d["id"] for d in self.duplicates)
-            for c in user["cards"]:
-                if counts.get(c["id"], 0) > 0:
-                    counts[c["id"]] -= 1
-                    total += usd_to_bc(c.get("price_usd", 0))
-                else:
-                    remaining.append(c)
-            user["cards"] = remaining
-            user["money"] = user.get("money", 0) + total
-            user["money_sales"] = user.get("money_sales", 0) + total
-            save_users(users)
+            total = await update_user(i.user.id, lambda u: sell_cards(u, self.duplicates)) or 0
             button.disabled = True
             await i.response.edit_message(view=self)
             await i.followup.send(f"Sprzedano duplikaty za {format_bc(total)}", ephemeral=True)
@@ -2340,14 +2607,14 @@ async def open_booster_quick(interaction, set_id, *, count: int = 1):
 @client.tree.command(name="profil", description="Twój profil, boostery i karty z setów!")
 async def profil(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    users = load_users()
-    all_sets = get_all_sets()
-    if user_id not in users:
+    user = await aload_user(user_id)
+    all_sets = await aget_all_sets()
+    if user is None:
         await interaction.response.send_message("📭 Nie masz konta. Użyj `/start`.", ephemeral=True)
         return
-    user = ensure_user_fields(users[user_id])
+    ensure_user_fields(user)
     boosters_counter = Counter(user["boosters"])
-    view = CollectionMainView(user, boosters_counter, all_sets)
+    view = CollectionMainView(user, boosters_counter, all_sets, user_id)
     embed = await view.build_summary_embed()
     file = discord.File(GRAPHIC_DIR / "kolekcja.png", filename="kolekcja.png")
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True, file=file)
@@ -2360,13 +2627,12 @@ async def profil_gracza(interaction: discord.Interaction, gracz: discord.Member)
             "⛔ Ta komenda działa tylko na kanale sklepu.", ephemeral=True
         )
         return
-    users = load_users()
-    uid = str(gracz.id)
-    if uid not in users:
+    user = await aload_user(gracz.id)
+    if user is None:
         await interaction.response.send_message("📭 Ten użytkownik nie ma konta.", ephemeral=True)
         return
-    user = ensure_user_fields(users[uid])
-    all_sets = get_all_sets()
+    ensure_user_fields(user)
+    all_sets = await aget_all_sets()
     avatar = gracz.display_avatar.url
     embed = build_other_profile_embed(user, all_sets, gracz.display_name, avatar)
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -2379,14 +2645,11 @@ async def saldo(interaction: discord.Interaction):
             "⛔ Ta komenda działa tylko na kanale sklepu.", ephemeral=True
         )
         return
-    users = load_users()
-    uid = str(interaction.user.id)
-    if uid in users:
-        ensure_user_fields(users[uid])
-    if uid not in users:
+    user = await aload_user(interaction.user.id)
+    if user is None:
         await interaction.response.send_message("📭 Nie masz konta. Użyj `/start`.", ephemeral=True)
         return
-    user = users[uid]
+    ensure_user_fields(user)
     money = user.get("money", 0)
     sales = user.get("money_sales", 0)
     events = user.get("money_events", 0)
@@ -2403,19 +2666,54 @@ async def saldo(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=False)
 
 # --- KOMENDA DAILY ---
+def claim_daily(user, now_dt, coins_event=False):
+    """Przyznaj dzienną nagrodę. Zwraca None przy cooldownie lub
+    krotkę (amount, bonus, streak, new_codes)."""
+    now = now_dt.timestamp()
+    last = user.get("last_daily", 0)
+    last_dt = datetime.datetime.fromtimestamp(last, datetime.UTC)
+    if last != 0 and last_dt.date() == now_dt.date():
+        return None
+    # Aktualizacja serii dziennych nagród
+    streak = user.get("daily_streak", 0)
+    if last != 0 and (now_dt.date() - last_dt.date()).days == 1:
+        streak += 1
+    else:
+        if last != 0 and user.get("streak_freeze", 0) > 0:
+            user["streak_freeze"] -= 1
+            streak += 1
+        else:
+            streak = 1
+    user["daily_streak"] = streak
+    new_codes = evaluate(user, ACHIEVEMENT_RULES, {"daily_streak": streak}, grant_achievement)
+    amount = DAILY_AMOUNT
+    if user.get("double_daily_until", 0) > now:
+        amount *= 2
+    if is_weekend() or coins_event:
+        amount *= 2
+    bonus = 0
+    if streak % 7 == 0:
+        bonus = STREAK_BONUS * (streak // 7)
+    total_gain = amount + bonus
+    user["money"] = user.get("money", 0) + total_gain
+    user["money_events"] = user.get("money_events", 0) + total_gain
+    user["last_daily"] = now_dt.timestamp()
+    if check_for_all_achievements(user) and grant_achievement(user, "all_achievements"):
+        new_codes.append("all_achievements")
+    return amount, bonus, streak, new_codes
+
+
 @client.tree.command(name="daily", description="Odbierz dzienną nagrodę monet")
 async def daily(interaction: discord.Interaction):
-    users = load_users()
     uid = str(interaction.user.id)
-    if uid not in users:
+    now_dt = datetime.datetime.now(datetime.UTC)
+    coins_event = "coins" in await aactive_event_types(now_dt.timestamp())
+    async with edit_user(uid) as user:
+        result = claim_daily(user, now_dt, coins_event) if user is not None else None
+    if user is None:
         await interaction.response.send_message("📭 Nie masz konta. Użyj `/start`.", ephemeral=True)
         return
-    ensure_user_fields(users[uid])
-    now_dt = datetime.datetime.now(datetime.UTC)
-    now = now_dt.timestamp()
-    last = users[uid].get("last_daily", 0)
-    last_dt = datetime.datetime.fromtimestamp(last, datetime.UTC)
-    if last != 0 and last_dt.date() == now_dt.date():
+    if result is None:
         remaining = (
             datetime.datetime.combine(
                 now_dt.date() + datetime.timedelta(days=1),
@@ -2431,37 +2729,7 @@ async def daily(interaction: discord.Interaction):
             f"⌛ Nagrodę możesz odebrać za {h}h {m}m {s}s.", ephemeral=True
         )
         return
-    # Aktualizacja serii dziennych nagród
-    streak = users[uid].get("daily_streak", 0)
-    if last != 0 and (now_dt.date() - last_dt.date()).days == 1:
-        streak += 1
-    else:
-        if last != 0 and users[uid].get("streak_freeze", 0) > 0:
-            users[uid]["streak_freeze"] -= 1
-            streak += 1
-        else:
-            streak = 1
-    users[uid]["daily_streak"] = streak
-    new_codes = []
-    if streak >= 10 and grant_achievement(users[uid], "daily_10"):
-        new_codes.append("daily_10")
-    if streak >= 30 and grant_achievement(users[uid], "daily_30"):
-        new_codes.append("daily_30")
-    amount = DAILY_AMOUNT
-    if users[uid].get("double_daily_until", 0) > now:
-        amount *= 2
-    if is_weekend() or "coins" in active_event_types(now):
-        amount *= 2
-    bonus = 0
-    if streak % 7 == 0:
-        bonus = STREAK_BONUS * (streak // 7)
-    total_gain = amount + bonus
-    users[uid]["money"] = users[uid].get("money", 0) + total_gain
-    users[uid]["money_events"] = users[uid].get("money_events", 0) + total_gain
-    users[uid]["last_daily"] = now_dt.timestamp()
-    if check_for_all_achievements(users[uid]) and grant_achievement(users[uid], "all_achievements"):
-        new_codes.append("all_achievements")
-    save_users(users)
+    amount, bonus, streak, new_codes = result
     for code in new_codes:
         await send_achievement_message(interaction, code)
     emj = random.choice(FUN_EMOJIS)
@@ -2475,13 +2743,11 @@ async def daily(interaction: discord.Interaction):
 # --- KOMENDA SKLEP ---
 @client.tree.command(name="sklep", description="Wyświetl sklep i zarządzaj koszykiem")
 async def sklep(interaction: discord.Interaction):
-    users = load_users()
     uid = str(interaction.user.id)
-    if uid not in users:
+    if await aload_user(uid) is None:
         await interaction.response.send_message("📭 Nie masz konta. Użyj `/start`.", ephemeral=True)
         return
-    ensure_user_fields(users[uid])
-    embed = build_shop_embed(uid)
+    embed = await build_shop_embed(uid)
     view = ShopView(uid)
     file1 = discord.File(SHOP_IMAGE_PATH, filename="shop.png")
     file2 = discord.File(COIN_IMAGE_PATH, filename="coin.png")
@@ -2491,13 +2757,13 @@ async def sklep(interaction: discord.Interaction):
 # --- KOMENDA OSIAGNIĘCIA ---
 @client.tree.command(name="osiagniecia", description="Wyświetl swoje osiągnięcia")
 async def achievements_cmd(interaction: discord.Interaction):
-    users = load_users()
     uid = str(interaction.user.id)
-    if uid not in users:
+    user = await aload_user(uid)
+    if user is None:
         await interaction.response.send_message("📭 Nie masz konta. Użyj `/start`.", ephemeral=True)
         return
-    user = ensure_user_fields(users[uid])
-    all_sets = get_all_sets()
+    ensure_user_fields(user)
+    all_sets = await aget_all_sets()
 
     pages = build_achievement_pages(user, all_sets)
     view = AchievementsView(pages, uid)
@@ -2507,38 +2773,111 @@ async def achievements_cmd(interaction: discord.Interaction):
 
 # --- KOMENDA RANKING ---
 @client.tree.command(name="ranking", description="Najlepsze dropy tygodnia")
-async def ranking_cmd(interaction: discord.Interaction):
+@app_commands.describe(liczba="Ile miejsc pokazać (domyślnie 3)", strona="Numer strony rankingu")
+async def ranking_cmd(
+    interaction: discord.Interaction,
+    liczba: app_commands.Range[int, 1, 25] = 3,
+    strona: app_commands.Range[int, 1, 100] = 1,
+):
     if interaction.channel_id != SHOP_CHANNEL_ID:
         await interaction.response.send_message(
             "⛔ Ta komenda działa tylko na kanale sklepu.", ephemeral=True
         )
         return
-    users = load_users()
+    board = get_weekly_board()
     week, year = current_week_info()
-    entries = []
-    for uid, udata in users.items():
-        ensure_user_fields(udata)
-        best = udata.get("weekly_best")
-        if best and best.get("week") == week and best.get("year") == year:
-            entries.append((uid, best.get("price", 0), best.get("name", "")))
-    top3 = sorted(entries, key=lambda x: x[1], reverse=True)[:3]
+    offset = (strona - 1) * liczba
+    entries = board.top("drops", week, year, liczba, offset)
     lines = [
-        f"{idx+1}. <@{uid}> - {name} ({format_bc(usd_to_bc(price))})"
-        for idx, (uid, price, name) in enumerate(top3)
+        f"{offset + idx + 1}. <@{uid}> - {name} ({format_bc(usd_to_bc(price))})"
+        for idx, (uid, price, name) in enumerate(entries)
     ]
-    community = []
-    for uid, data in users.items():
-        wc = data.get("weekly_community")
-        if wc and wc.get("week") == week and wc.get("year") == year:
-            community.append((uid, wc.get("score", 0)))
-    community.sort(key=lambda x: x[1], reverse=True)
-    if community:
-        best_uid, best_score = community[0]
+    community = board.top("community", week, year, 1)
+    if community and strona == 1:
+        best_uid, best_score, _ = community[0]
         lines.append("")
         lines.append(f"🏅 Nagroda społeczności: <@{best_uid}> ({best_score} 👍)")
     if not lines:
         lines = ["Brak danych"]
-    embed = create_embed(title="TOP 3 dropy tygodnia", description="\n".join(lines), color=discord.Color.purple())
+    title = f"TOP {liczba} dropy tygodnia"
+    pages = -(-board.count("drops", week, year) // liczba)
+    if pages > 1:
+        title += f" (strona {strona}/{pages})"
+    embed = create_embed(title=title, description="\n".join(lines), color=discord.Color.purple())
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# --- RANKINGI OGÓLNE ---
+# Kategoria /top -> (nazwa, format wyniku)
+TOP_CATEGORIES = {
+    "wartosc": ("💰 Wartość kolekcji", lambda v: format_bc(usd_to_bc(v))),
+    "karty": ("🃏 Unikalne karty", lambda v: f"{int(v)} kart"),
+    "mastersety": ("🏅 Master sety", lambda v: f"{int(v)} setów"),
+    "boostery": ("🎁 Otwarte boostery", lambda v: f"{int(v)} boosterów"),
+}
+TOP_PAGE_SIZE = 10
+# Co ile sekund przeliczać migawki rankingów
+TOP_REFRESH_INTERVAL = int(os.environ.get("TOP_REFRESH_INTERVAL", "600"))
+STANDINGS = Standings()
+
+
+async def refresh_standings():
+    """Przelicz migawki rankingów ogólnych z liczników graczy."""
+    users = await aload_users()
+    catalog = get_card_catalog()
+    scores = {key: {} for key in TOP_CATEGORIES}
+    for i, (uid, user) in enumerate(users.items()):
+        stats = valuation(user, catalog, 0)
+        scores["wartosc"][uid] = stats["usd"]
+        scores["karty"][uid] = stats["distinct"]
+        scores["mastersety"][uid] = sum(code.startswith("master:") for code in user.get("achievements", []))
+        scores["boostery"][uid] = user.get("boosters_opened", 0)
+        if i % 500 == 499:
+            # Nie blokuj pętli przy dużej liczbie kont
+            await asyncio.sleep(0)
+    STANDINGS.rebuild(scores)
+
+
+async def snapshot_collection_values():
+    """Dopisz migawkę wartości kolekcji wszystkich graczy do historii."""
+    users = await aload_users()
+    catalog = get_card_catalog()
+    values = {}
+    for i, (uid, user) in enumerate(users.items()):
+        values[uid] = valuation(user, catalog, 0)["usd"]
+        if i % 500 == 499:
+            await asyncio.sleep(0)
+    VALUE_HISTORY.snapshot(values)
+    await run_io_write(VALUE_HISTORY.save, VALUE_HISTORY.export())
+
+
+@client.tree.command(name="top", description="Rankingi ogólne graczy")
+@app_commands.describe(kategoria="Rodzaj rankingu", strona="Numer strony rankingu")
+@app_commands.choices(
+    kategoria=[app_commands.Choice(name=name, value=key) for key, (name, _) in TOP_CATEGORIES.items()]
+)
+async def top_cmd(
+    interaction: discord.Interaction,
+    kategoria: app_commands.Choice[str],
+    strona: app_commands.Range[int, 1, 1000] = 1,
+):
+    if not STANDINGS.updated:
+        await interaction.response.send_message("⏳ Rankingi są jeszcze przeliczane, spróbuj za chwilę.", ephemeral=True)
+        return
+    key = kategoria.value
+    name, fmt = TOP_CATEGORIES[key]
+    offset = (strona - 1) * TOP_PAGE_SIZE
+    lines = [
+        f"{offset + idx + 1}. <@{uid}> — {fmt(score)}"
+        for idx, (uid, score) in enumerate(STANDINGS.top(key, TOP_PAGE_SIZE, offset))
+    ]
+    if not lines:
+        lines = ["Brak danych"]
+    pages = max(1, -(-STANDINGS.count(key) // TOP_PAGE_SIZE))
+    own = STANDINGS.rank(key, str(interaction.user.id))
+    lines.append("")
+    lines.append(f"Twoje miejsce: **#{own[0]}** ({fmt(own[1])})" if own else "Nie jesteś jeszcze w tym rankingu.")
+    lines.append(f"Aktualizacja: <t:{int(STANDINGS.updated)}:R>")
+    embed = create_embed(title=f"{name} (strona {strona}/{pages})", description="\n".join(lines), color=discord.Color.purple())
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # --- KOMENDA HELP ---
@@ -2553,6 +2892,7 @@ async def help_cmd(interaction: discord.Interaction):
         ("/otworz", "Otwórz posiadane boostery"),
         ("/osiagniecia", "Lista zdobytych osiągnięć"),
         ("/ranking", "Najlepsze dropy tygodnia"),
+        ("/top", "Rankingi ogólne graczy"),
     ]
     desc = "\n".join(f"**{cmd}** — {txt}" for cmd, txt in commands)
     embed = create_embed(title="Dostępne komendy", description=desc, color=EMBED_COLOR)
@@ -2613,9 +2953,10 @@ class EventModal(Modal, title="🗓️ Nowy Event"):
         except Exception:
             await interaction.response.send_message("❌ Niepoprawny format daty.", ephemeral=True)
             return
-        events = load_events()
-        events.append({"start": st, "end": et, "type": self.event_type, "announced": False})
-        save_events(events)
+        async with EVENTS_LOCK:
+            events = await aload_events()
+            events.append({"start": st, "end": et, "type": self.event_type, "announced": False})
+            await asave_events(events)
         await interaction.response.send_message("✅ Event utworzony!", ephemeral=True)
         now_ts = time.time()
         if st <= now_ts <= et:
@@ -2666,13 +3007,13 @@ class EventTypeView(View):
 class RewardSetupView(View):
     PAGE_SIZE = 25
 
-    def __init__(self):
+    def __init__(self, all_sets):
         super().__init__(timeout=60)
         self.target_user: discord.Member | None = None
         self.reward_type = "booster"
         self.booster_id: str | None = None
 
-        self.all_sets = get_all_sets()
+        self.all_sets = all_sets
         self.page = 0
 
         self.user_select = discord.ui.UserSelect(placeholder="Wybierz użytkownika")
@@ -2773,19 +3114,16 @@ class RewardModal(Modal, title="🎁 Nagroda"):
             qty = max(1, int(self.amount.value))
         except ValueError:
             qty = 1
-        users = load_users()
         uid = str(self.user.id)
-        user = users.get(uid, {"username": self.user.name})
-        ensure_user_fields(user)
-        if self.reward_type == "booster" and self.booster_id:
-            user["boosters"].extend([self.booster_id] * qty)
-            reward_desc = f"{qty}x booster `{self.booster_id}`"
-        else:
-            user["money"] = user.get("money", 0) + qty
-            user["money_events"] = user.get("money_events", 0) + qty
-            reward_desc = format_bc(qty)
-        users[uid] = user
-        save_users(users)
+        await create_user(uid, ensure_user_fields({"username": self.user.name}))
+        async with edit_user(uid) as user:
+            if self.reward_type == "booster" and self.booster_id:
+                user["boosters"].extend([self.booster_id] * qty)
+                reward_desc = f"{qty}x booster `{self.booster_id}`"
+            else:
+                user["money"] = user.get("money", 0) + qty
+                user["money_events"] = user.get("money_events", 0) + qty
+                reward_desc = format_bc(qty)
         note = self.message.value.strip()
         dm = f"🎁 Otrzymujesz {reward_desc}!"
         if note:
@@ -2810,7 +3148,31 @@ async def reward_command(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("🚫 Tylko administrator może przyznawać nagrody!", ephemeral=True)
         return
-    await interaction.response.send_message("Wybierz użytkownika i nagrodę:", view=RewardSetupView(), ephemeral=True)
+    await interaction.response.send_message("Wybierz użytkownika i nagrodę:", view=RewardSetupView(await aget_all_sets()), ephemeral=True)
+
+
+@client.tree.command(name="kolejka", description="Statystyki kolejki otwierania boosterów")
+async def queue_stats_command(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Tylko administrator może sprawdzać kolejkę!", ephemeral=True)
+        return
+    stats = BOOSTER_QUEUE.stats()
+    embed = create_embed(title="Kolejka boosterów")
+    embed.add_field(name="Oczekujące", value=str(stats["depth"]))
+    embed.add_field(name="W trakcie", value=str(stats["in_flight"]))
+    embed.add_field(name="Obsłużone / błędy", value=f"{stats['processed']} / {stats['failed']}")
+    embed.add_field(name="Odrzucone / zwrócone", value=f"{stats['rejected']} / {stats['expired']}")
+    embed.add_field(
+        name="Czas oczekiwania",
+        value=f"śr. {stats['wait_avg']:.1f} s | p95 {stats['wait_p95']:.1f} s | max {stats['wait_max']:.1f} s",
+        inline=False,
+    )
+    embed.add_field(
+        name=f"Workery ({len(stats['shard_depths'])})",
+        value=" ".join(str(d) for d in stats["shard_depths"]),
+        inline=False,
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # --- Integracja StartIT booster + boost ---
 @client.event
@@ -2825,8 +3187,8 @@ async def on_message(message):
                 view=QuickBonusView(amount=amount)
             )
         else:
-            sets = get_all_sets()
-            chosen = weighted_random_set(sets)
+            prices, sets = await load_pricing()
+            chosen = weighted_random_set(sets, prices)
             name = chosen.get("name", chosen.get("id")) if chosen else "booster"
             sid = chosen.get("id") if chosen else None
             await message.channel.send(
@@ -2846,7 +3208,6 @@ async def on_message(message):
     if message.author.id != STARTIT_BOT_ID:
         return
     if "kupił booster" in message.content:
-        users = load_users()
         parts = message.content.split("kupił booster")
         if len(parts) != 2:
             return
@@ -2855,44 +3216,28 @@ async def on_message(message):
         if not match:
             return
         ptcgo_code = match.group(1).upper()
-        set_id, set_name = get_set_id_by_ptcgo_code(ptcgo_code)
+        set_id, set_name = await get_set_id_by_ptcgo_code(ptcgo_code)
         if not set_id:
             await message.channel.send(f"⚠️ Nieznany booster `{ptcgo_code}` – nie został dodany do profilu.")
             return
-        found_user = None
-        for uid, data in users.items():
-            if username.lower() in data["username"].lower():
-                found_user = (uid, data)
-                break
-        if found_user:
-            user_id, _ = found_user
-            ensure_user_fields(users[user_id])
-            users[user_id]["boosters"].append(set_id)
-            save_users(users)
+        user_id = await afind_user_by_name(username)
+        if user_id:
+            await update_user(user_id, lambda u: u["boosters"].append(set_id))
             class BoosterButtonsView(View):
                 @discord.ui.button(label="Otwórz booster", style=discord.ButtonStyle.success)
                 async def otworz(self, interaction: discord.Interaction, button: Button):
                     if str(interaction.user.id) != user_id:
                         await interaction.response.send_message("To nie jest Twój booster!", ephemeral=True)
                         return
-                    users = load_users()
-                    if set_id in users[user_id]["boosters"]:
-                        users[user_id]["boosters"].remove(set_id)
-                        save_users(users)
-                        await interaction.response.defer(thinking=True, ephemeral=True)
-                        await interaction.followup.send(
-                            "⏳ Dodano do kolejki otwierania boostera...",
-                            ephemeral=True,
-                        )
-                        await BOOSTER_QUEUE.put((interaction, set_id))
-                    else:
-                        await interaction.response.send_message("Nie znaleziono boostera do otwarcia.", ephemeral=True)
+                    await interaction.response.defer(thinking=True, ephemeral=True)
+                    if not await enqueue_booster(interaction, set_id):
+                        await interaction.followup.send("Nie znaleziono boostera do otwarcia.", ephemeral=True)
                 @discord.ui.button(label="Pokaż boostery", style=discord.ButtonStyle.primary)
                 async def pokaz(self, interaction: discord.Interaction, button: Button):
-                    all_sets = get_all_sets()
-                    user = users[user_id]
+                    all_sets = await aget_all_sets()
+                    user = ensure_user_fields(await aload_user(user_id))
                     boosters_counter = Counter(user["boosters"])
-                    view = CollectionMainView(user, boosters_counter, all_sets)
+                    view = CollectionMainView(user, boosters_counter, all_sets, user_id)
                     embed = await view.build_summary_embed()
                     file = discord.File(GRAPHIC_DIR / "kolekcja.png", filename="kolekcja.png")
                     await interaction.response.send_message(embed=embed, view=view, ephemeral=True, file=file)
@@ -2902,33 +3247,24 @@ async def on_message(message):
             )
         return
     if "kupił boost" in message.content or "kupił lucky boost" in message.content:
-        users = load_users()
         if "kupił boost" in message.content:
             username = message.content.split("kupił boost")[0].strip()
         else:
             username = message.content.split("kupił lucky boost")[0].strip()
-        found_user = None
-        for uid, data in users.items():
-            if username.lower() in data["username"].lower():
-                found_user = (uid, data)
-                break
-        if found_user:
-            user_id, _ = found_user
-            ensure_user_fields(users[user_id])
-            users[user_id]["rare_boost"] = users[user_id].get("rare_boost", 0) + 1
-            save_users(users)
+        user_id = await afind_user_by_name(username)
+        if user_id:
+            await update_user(user_id, lambda u: u.update(rare_boost=u.get("rare_boost", 0) + 1))
             await message.channel.send(
                 f"🟣 Boost rare został dodany do konta użytkownika **{username}**!\n"
                 f"Aktywuje się automatycznie przy następnym otwieraniu boostera."
             )
 
 # --- LOSOWANIE KART ---
-def get_set_id_by_ptcgo_code(ptcgo_code):
-    sets = get_all_sets()
-    for s in sets:
-        if s.get("ptcgoCode", "").upper() == ptcgo_code.upper():
-            return s["id"], s["name"]
-    return None, None
+async def get_set_id_by_ptcgo_code(ptcgo_code):
+    s = (await aget_all_sets()).by_ptcgo(ptcgo_code)
+    if s is None:
+        return None, None
+    return s["id"], s["name"]
 
 RARITY_POOL = [
     ("Common", 6, 1.00),
@@ -2942,118 +3278,21 @@ RARITY_POOL = [
 ]
 RAREST_TYPES = ["Ultra Rare", "Illustration Rare", "Special Illustration Rare", "Hyper Rare"]
 
-async def fetch_cards_from_set(set_id: str, user_id: str = None):
-    headers = {"X-Api-Key": POKETCG_API_KEY}
-    users = load_users()
-    boost_active = False
-    event_boost = "drop" in active_event_types()
-    if user_id and user_id in users:
-        ensure_user_fields(users[user_id])
-        if users[user_id].get("rare_boost", 0) > 0:
-            boost_active = True
-            users[user_id]["rare_boost"] -= 1
-            save_users(users)
-    boost_active = boost_active or event_boost
-    result = []
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async def get_cards_by_rarity(rarity, count):
-            set_cache = CARD_CACHE.setdefault(set_id, {})
-            if rarity not in set_cache:
-                url = (
-                    f"https://api.pokemontcg.io/v2/cards?q=set.id:{set_id} AND rarity:\"{rarity}\""
-                )
-                async with session.get(url) as resp:
-                    data = await resp.json()
-                    set_cache[rarity] = data.get("data", [])
-                    save_card_cache()
-            found = set_cache.get(rarity, [])
-            return random.sample(found, min(count, len(found)))
-
-        async def get_most_expensive_card():
-            set_cache = CARD_CACHE.setdefault(set_id, {})
-            if not set_cache:
-                await fetch_all_cards_for_set(session, set_id)
-            max_card = None
-            max_price = 0.0
-            for cards in set_cache.values():
-                for card in cards:
-                    price = card_price_usd(card) or 0
-                    if price > max_price:
-                        max_price = price
-                        max_card = card
-            return max_card
-
-        if random.random() < GOD_PACK_CHANCE:
-            rare_pool = [
-                "Hyper Rare",
-                "Special Illustration Rare",
-                "Illustration Rare",
-                "Ultra Rare",
-                "Double Rare",
-            ]
-            for _ in range(10):
-                for r in rare_pool:
-                    card = await get_cards_by_rarity(r, 1)
-                    if card:
-                        result += card
-                        break
-            return result[:10]
-
-        extra_best = 0
-        if boost_active and random.random() < 0.30:
-            best = await get_most_expensive_card()
-            if best:
-                result.append(best)
-                extra_best = 1
-
-        result += await get_cards_by_rarity("Common", 4)
-        result += await get_cards_by_rarity("Uncommon", 3)
-        rare_pools = [
-            ("Ultra Rare", 0.12),
-            ("Double Rare", 0.25),
-            ("Rare", 0.75),
-        ]
-        rare_iterations = 2 + (1 if boost_active else 0)
-        for _ in range(rare_iterations):
-            got_card = False
-            for rarity, base_prob in rare_pools:
-                prob = min(1.0, base_prob * 2) if boost_active else base_prob
-                if random.random() < prob:
-                    card = await get_cards_by_rarity(rarity, 1)
-                    if card:
-                        result += card
-                        got_card = True
-                        break
-            if not got_card:
-                card = await get_cards_by_rarity("Common", 1)
-                if card:
-                    result += card
-        ir_slots = [
-            ("Hyper Rare", 0.01),
-            ("Special Illustration Rare", 0.02),
-            ("Illustration Rare", 0.07)
-        ]
-        ir_iterations = 1 + (1 if boost_active else 0)
-        for _ in range(ir_iterations):
-            got_card = False
-            for rarity, base_prob in ir_slots:
-                prob = min(1.0, base_prob * 2) if boost_active else base_prob
-                if random.random() < prob:
-                    card = await get_cards_by_rarity(rarity, 1)
-                    if card:
-                        result += card
-                        got_card = True
-                        break
-            if not got_card:
-                card = await get_cards_by_rarity("Common", 1)
-                if card:
-                    result += card
-    commons = [c for c in result if c.get("rarity") in ["Common", "Uncommon"]]
-    rares = [c for c in result if c.get("rarity") not in ["Common", "Uncommon"]]
-    random.shuffle(commons)
-    cards_result = commons + rares
-    extra_slots = (rare_iterations - 2) + (ir_iterations - 1) + extra_best
-    limit = 10 + max(0, extra_slots)
-    return cards_result[:limit]
+def consume_rare_boosts(user, count):
+    """Zużyj do ``count`` Rare Boostów gracza i zwróć ile zużyto."""
+    used = min(user.get("rare_boost", 0), count)
+    user["rare_boost"] = user.get("rare_boost", 0) - used
+    return used
+
+async def fetch_cards_from_set(set_id: str, user_id: str = None, boost: bool = False):
+    """Wylosuj paczkę; ``boost`` to Rare Boost zużyty już przy zabraniu boostera."""
+    boost_active = boost or "drop" in await aactive_event_types()
+    # Losowanie odbywa się lokalnie; brakujący set dociąga kolejka w tle
+    open_id, rng = OPEN_LOG.stream()
+    cards = await BOOSTER_ENGINE.open(set_id, boost=boost_active, rng=rng)
+    if cards:
+        entry = OPEN_LOG.entry_for_draw(open_id, user_id, set_id, boost_active, cards)
+        await run_io_write(OPEN_LOG.append, [entry])
+    return cards
 
 client.run(os.environ["BOT_TOKEN"])
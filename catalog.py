@@ -0,0 +1,352 @@
+"""Shared card catalog and the compact card ownership helpers.
+
+A user keeps only ``user["cards"] = {card_id: count}``. Everything that
+describes a card (name, price, image, rarity) is stored once in the
+:class:`CardCatalog`, keyed by card id, instead of being copied into every
+physical card a player owns.
+
+The catalog also indexes the Pokemon TCG API card cache: cards by id, by set
+and rarity, and the most expensive card of every set.
+"""
+
+import re
+import secrets
+from collections import Counter
+from pathlib import Path
+
+from storage import atomic_write_json, read_json
+
+UNKNOWN_CARD = {"name": "", "price_usd": 0, "img_url": "", "rarity": ""}
+# Price changes kept for incremental revaluation of collections
+PRICE_LOG_MAX = 50000
+# Plain collector numbers ("23", "023"); prefixed ones such as "TG05" are not matched
+CARD_NUMBER_RE = re.compile(r"\d+")
+
+
+def card_set_id(card_id: str) -> str:
+    """Return the set id part of a card id (``"sv1-23"`` -> ``"sv1"``)."""
+    return card_id.split("-")[0]
+
+
+def card_number(card_id: str) -> int | None:
+    """Return the collector number of a card id (``"sv1-23"`` -> 23).
+
+    ``None`` for numbers that are not plain digits (e.g. ``"g1-RC1"``,
+    ``"swsh12-TG05"`` or ``"cel25c-15_A"``): those cards are printed outside
+    the numbered ``1..total`` run of the set.
+    """
+    _, _, number = card_id.partition("-")
+    return int(number) if CARD_NUMBER_RE.fullmatch(number) else None
+
+
+def card_price_usd(card: dict) -> float | None:
+    """Return the market price of an API card in USD, if known."""
+    if "tcgplayer" in card and "prices" in card["tcgplayer"]:
+        for ver in card["tcgplayer"]["prices"].values():
+            if "market" in ver and ver["market"]:
+                return ver["market"]
+    return None
+
+
+def card_image_url(card: dict) -> str:
+    images = card.get("images", {})
+    return images.get("small") or images.get("large") or ""
+
+
+def card_meta(card: dict) -> dict:
+    """Catalog entry for an API card."""
+    return {
+        "name": card["name"],
+        "price_usd": card_price_usd(card) or 0,
+        "img_url": card_image_url(card),
+        "rarity": card.get("rarity", ""),
+    }
+
+
+def read_card_cache(directory: Path) -> dict:
+    """Load the per-set API card cache files (``<set_id>.json``) from ``directory``."""
+    return {path.stem: read_json(path, {}) for path in sorted(Path(directory).glob("*.json"))}
+
+
+class CardCatalog:
+    """Metadata of every card known to the bot.
+
+    ``cards`` holds the entries of owned cards and is persisted to one JSON
+    file. ``by_set`` is the API card cache ``{set_id: {rarity: [cards]}}``;
+    it is indexed in memory by :meth:`index_set` and saved separately.
+    """
+
+    def __init__(self, path: Path, *, backups: int = 2):
+        self.path = Path(path)
+        self.backups = backups
+        self.cards = read_json(self.path, {}, backups=backups)
+        self.dirty = False
+        self.by_set = {}
+        self.by_id = {}
+        self.max_card = {}
+        # Bumped whenever the cached cards of a set change
+        self.versions = {}
+        # Identifies the current prices; the epoch makes it unique across restarts
+        self._price_epoch = secrets.token_hex(4)
+        self._price_changes = 0
+        # (card_id, old, new) of the latest price changes, from change number _price_log_start
+        self._price_log = []
+        self._price_log_start = 0
+
+    def __contains__(self, card_id: str) -> bool:
+        return card_id in self.cards
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    @property
+    def price_version(self) -> str:
+        """Token that changes whenever the price of any card changes."""
+        return f"{self._price_epoch}:{self._price_changes}"
+
+    def _price_changed(self, card_id: str, old: float, new: float):
+        self._price_log.append((card_id, old, new))
+        self._price_changes += 1
+        if len(self._price_log) > PRICE_LOG_MAX:
+            drop = len(self._price_log) // 2
+            del self._price_log[:drop]
+            self._price_log_start += drop
+
+    def price_changes_since(self, version: str | None) -> list | None:
+        """``[(card_id, old, new)]`` made after ``version`` in order.
+
+        ``None`` when they are no longer known (another process or a trimmed
+        log); the caller then has to revalue from scratch.
+        """
+        epoch, _, number = str(version or "").partition(":")
+        if epoch != self._price_epoch or not number.isdigit():
+            return None
+        number = int(number)
+        if not self._price_log_start <= number <= self._price_changes:
+            return None
+        return self._price_log[number - self._price_log_start :]
+
+    def _cache_prices(self, set_id: str) -> dict:
+        """Prices of the cached cards of a set that come from the cache (not registered)."""
+        return {
+            card["id"]: card_price_usd(card) or 0
+            for cards in self.by_set.get(set_id, {}).values()
+            for card in cards
+            if card["id"] not in self.cards
+        }
+
+    def _note_prices(self, set_id: str, before: dict):
+        after = self._cache_prices(set_id)
+        for cid in before.keys() | after.keys():
+            old, new = before.get(cid, 0), after.get(cid, 0)
+            if old != new:
+                self._price_changed(cid, old, new)
+
+    def _entry(self, card_id: str) -> dict | None:
+        entry = self.cards.get(card_id)
+        if entry is None:
+            card = self.by_id.get(card_id)
+            if card is not None:
+                entry = card_meta(card)
+        return entry
+
+    def info(self, card_id: str) -> dict:
+        """Return ``{"id", "name", "price_usd", "img_url", "rarity"}`` for a card."""
+        entry = self._entry(card_id)
+        if entry is None:
+            return {"id": card_id, **UNKNOWN_CARD, "name": card_id}
+        return {"id": card_id, **entry}
+
+    def price(self, card_id: str) -> float:
+        return (self._entry(card_id) or UNKNOWN_CARD).get("price_usd") or 0
+
+    def rarity(self, card_id: str) -> str:
+        return (self._entry(card_id) or UNKNOWN_CARD).get("rarity") or ""
+
+    def card(self, card_id: str) -> dict | None:
+        """Return the full API card for ``card_id`` if its set is cached."""
+        return self.by_id.get(card_id)
+
+    def has_set(self, set_id: str) -> bool:
+        return bool(self.by_set.get(set_id))
+
+    def cards_of(self, set_id: str, rarity: str) -> list:
+        """Cached API cards of one rarity in a set (empty when unknown)."""
+        return self.by_set.get(set_id, {}).get(rarity, [])
+
+    def has_rarity(self, set_id: str, rarity: str) -> bool:
+        return rarity in self.by_set.get(set_id, {})
+
+    def most_expensive(self, set_id: str) -> dict | None:
+        """Precomputed most expensive cached card of a set."""
+        return self.max_card.get(set_id)
+
+    def load_cache(self, cache: dict):
+        """Replace the API card cache and rebuild every index."""
+        self.by_set = {}
+        self.by_id = {}
+        self.max_card = {}
+        for set_id, rarities in cache.items():
+            self._index_set(set_id, rarities)
+        # Every price may differ - start a new epoch instead of logging them all
+        self._price_epoch = secrets.token_hex(4)
+        self._price_changes = 0
+        self._price_log = []
+        self._price_log_start = 0
+
+    def index_set(self, set_id: str, rarities: dict):
+        """Store and index ``{rarity: [cards]}`` of one set, replacing the old data."""
+        before = self._cache_prices(set_id)
+        self._index_set(set_id, rarities)
+        self._note_prices(set_id, before)
+
+    def index_rarity(self, set_id: str, rarity: str, cards: list):
+        """Store and index the cards of a single rarity of a set."""
+        before = self._cache_prices(set_id)
+        self._index_rarity(set_id, rarity, cards)
+        self._note_prices(set_id, before)
+
+    def _index_set(self, set_id: str, rarities: dict):
+        for cards in self.by_set.get(set_id, {}).values():
+            for card in cards:
+                self.by_id.pop(card["id"], None)
+        self.by_set[set_id] = {}
+        self.versions[set_id] = self.versions.get(set_id, 0) + 1
+        self.max_card.pop(set_id, None)
+        for rarity, cards in rarities.items():
+            self._index_rarity(set_id, rarity, cards)
+
+    def _index_rarity(self, set_id: str, rarity: str, cards: list):
+        rarities = self.by_set.setdefault(set_id, {})
+        if rarity in rarities:
+            # Replacing cards can lower the maximum - rebuild the whole set
+            self._index_set(set_id, {**rarities, rarity: cards})
+            return
+        rarities[rarity] = cards
+        self.versions[set_id] = self.versions.get(set_id, 0) + 1
+        best = self.max_card.get(set_id)
+        best_price = (card_price_usd(best) or 0) if best else 0
+        for card in cards:
+            self.by_id[card["id"]] = card
+            price = card_price_usd(card) or 0
+            if price > best_price:
+                best, best_price = card, price
+        if best is not None:
+            self.max_card[set_id] = best
+
+    def register(self, card: dict):
+        """Add an API card to the persisted entries (done when a player gets it)."""
+        self.add(card["id"], **card_meta(card))
+
+    def update_prices(self, cards) -> int:
+        """Refresh the registered entries from fresh API ``cards``; returns how many prices changed."""
+        changed = 0
+        for card in cards:
+            if card["id"] in self.cards:
+                before = self.price(card["id"])
+                self.register(card)
+                changed += self.price(card["id"]) != before
+        return changed
+
+    def add(self, card_id: str, *, name: str, price_usd: float = 0, img_url: str = "", rarity: str = ""):
+        """Register or refresh a card. Marks the catalog dirty only on change."""
+        entry = {"name": name, "price_usd": price_usd or 0, "img_url": img_url or "", "rarity": rarity or ""}
+        if self.cards.get(card_id) != entry:
+            old = self.price(card_id)
+            if old != entry["price_usd"]:
+                self._price_changed(card_id, old, entry["price_usd"])
+            self.cards[card_id] = entry
+            self.dirty = True
+
+    def snapshot(self) -> dict | None:
+        """Return a copy to persist and clear the dirty flag, or ``None`` if clean."""
+        if not self.dirty:
+            return None
+        self.dirty = False
+        # Entries are replaced, never mutated, so a shallow copy is enough
+        return dict(self.cards)
+
+    def save(self, data: dict | None = None):
+        atomic_write_json(
+            self.path,
+            self.cards if data is None else data,
+            indent=None,
+            backups=self.backups,
+        )
+
+
+def migrate_cards(user: dict, catalog: CardCatalog) -> bool:
+    """Convert a legacy per-copy card list to ``{card_id: count}`` in place.
+
+    The metadata of each card is moved to ``catalog``. Returns True when the
+    user was converted.
+    """
+    cards = user.get("cards")
+    if not isinstance(cards, list):
+        return False
+    counts = Counter()
+    for card in cards:
+        if isinstance(card, str):
+            counts[card] += 1
+            continue
+        cid = card["id"]
+        counts[cid] += card.get("count", 1)
+        if cid not in catalog or card.get("price_usd"):
+            catalog.add(
+                cid,
+                name=card.get("name") or cid,
+                price_usd=card.get("price_usd", 0),
+                img_url=card.get("img_url", ""),
+                rarity=card.get("rarity", ""),
+            )
+    user["cards"] = dict(counts)
+    # Running counters of the old list are rebuilt on first use
+    user.pop("stats", None)
+    return True
+
+
+def migrate_users(users: dict, catalog: CardCatalog) -> dict:
+    """Migrate every user in ``users`` and return ``{uid: user}`` of the changed ones."""
+    return {uid: user for uid, user in users.items() if migrate_cards(user, catalog)}
+
+
+def count_cards(user: dict) -> int:
+    """Number of physical cards the user owns."""
+    return sum(user["cards"].values())
+
+
+def add_card(user: dict, card_id: str, count: int = 1):
+    cards = user["cards"]
+    cards[card_id] = cards.get(card_id, 0) + count
+
+
+def remove_card(user: dict, card_id: str, count: int = 1) -> int:
+    """Remove up to ``count`` copies and return how many were removed."""
+    cards = user["cards"]
+    owned = cards.get(card_id, 0)
+    removed = min(owned, count)
+    if removed == owned:
+        cards.pop(card_id, None)
+    else:
+        cards[card_id] = owned - removed
+    return removed
+
+
+def set_cards(user: dict, set_id: str) -> dict:
+    """Return ``{card_id: count}`` of the cards owned from one set."""
+    return {cid: n for cid, n in user["cards"].items() if card_set_id(cid) == set_id}
+
+
+def owned_cards(user: dict, catalog: CardCatalog, set_id: str | None = None) -> list[dict]:
+    """Compatibility accessor: one metadata dict (with ``count``) per distinct card."""
+    cards = user["cards"] if set_id is None else set_cards(user, set_id)
+    return [{**catalog.info(cid), "count": n} for cid, n in cards.items()]
+
+
+def expand_cards(user: dict, catalog: CardCatalog) -> list[dict]:
+    """Compatibility accessor returning the legacy list with one dict per copy."""
+    result = []
+    for cid, n in user["cards"].items():
+        info = catalog.info(cid)
+        result.extend(dict(info) for _ in range(n))
+    return result
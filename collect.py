@@ -1,6 +1,7 @@
 import argparse
 import math
-from poke_utils import load_users, ensure_user_fields
+from catalog import owned_cards
+from poke_utils import load_users, ensure_user_fields, get_card_catalog
 
 PAGE_SIZE = 10
 
@@ -36,8 +37,8 @@ def main():
         print("User not found")
         return
     user = ensure_user_fields(users[uid])
-    cards = user.get("cards", [])
-    entries = [f"{c['id']} - {c.get('name', '')} ({c.get('price_usd',0)} USD)" for c in cards]
+    cards = owned_cards(user, get_card_catalog())
+    entries = [f"{c['id']} - {c['name']} x{c['count']} ({c['price_usd']} USD)" for c in cards]
     if not entries:
         print("No cards")
         return
@@ -3,9 +3,9 @@ import random
 from datetime import datetime, timezone, timedelta
 from discord.ui import Modal, View, TextInput, Button
 from poke_utils import (
-    load_users,
-    save_users,
-    get_all_sets,
+    create_user,
+    update_user,
+    aget_all_sets,
     EMBED_COLOR,
     create_embed,
     load_channels,
@@ -39,8 +39,7 @@ class GiveawayModal(Modal, title="🎉 Nowy Giveaway"):
             liczba = int(self.liczba_boosterow.value)
             zwyciezcy = int(self.liczba_zwyciezcow.value)
             ptcgo_input = self.booster_id.value.upper()
-            sets = get_all_sets()
-            matched_set = next((s for s in sets if s.get("ptcgoCode", "").upper() == ptcgo_input), None)
+            matched_set = (await aget_all_sets()).by_ptcgo(ptcgo_input)
 
             if matched_set:
                 booster_id = matched_set["id"]
@@ -148,20 +147,15 @@ class GiveawayView(View):
             return
         random.shuffle(entries)
         chosen = entries[: min(self.winners, len(entries))]
-        users = load_users()
         for uid in chosen:
-            uid_str = str(uid)
             member = None
             if self.message and self.message.guild:
                 try:
                     member = await self.message.guild.fetch_member(uid)
                 except Exception:
                     member = None
-            user = users.get(uid_str, {"username": member.name if member else str(uid)})
-            ensure_user_fields(user)
-            user["boosters"].extend([self.booster_id] * self.ilosc)
-            users[uid_str] = user
-        save_users(users)
+            await create_user(uid, ensure_user_fields({"username": member.name if member else str(uid)}))
+            await update_user(uid, lambda u: u["boosters"].extend([self.booster_id] * self.ilosc))
         await self.finalize_embed()
         mentions = ", ".join(f"<@{uid}>" for uid in chosen)
         await self.message.channel.send(f"🏆 Gratulacje! Giveaway wygrywają: {mentions}")
@@ -0,0 +1,187 @@
+"""Card price history and collection value snapshots.
+
+Card prices (tcgplayer market, USD) are appended to ``card_prices.jsonl``
+whenever a cached set is stored, one line per observation and only for the
+cards whose price changed since the last one::
+
+    {"t": 1718000000, "p": {"sv1-5": 1.23, "sv1-17": 0.1}}
+
+:class:`ValueHistory` snapshots the collection value of every player at a
+fixed interval into a columnar store (``value_history.json``): one array of
+snapshot times and one value array per player aligned with it, ``None`` where
+the player did not exist yet::
+
+    {"t": [1718000000, 1718086400], "v": {"123": [10.5, 12.0], "456": [null, 3.2]}}
+
+Run ``python3 history.py card <card_id>`` or ``python3 history.py user <uid>``
+to print a series.
+"""
+
+import argparse
+import json
+import math
+import time
+from array import array
+from pathlib import Path
+
+from catalog import card_price_usd
+from storage import atomic_write_json, read_json
+
+BASE_DIR = Path(__file__).resolve().parent
+CARD_PRICES_FILE = BASE_DIR / "card_prices.jsonl"
+VALUE_HISTORY_FILE = BASE_DIR / "value_history.json"
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+class PriceHistory:
+    """Append-only time series of card prices, indexed in memory per card."""
+
+    def __init__(self, path: Path = CARD_PRICES_FILE):
+        self.path = Path(path)
+        self.times = {}
+        self.prices = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        continue
+                    self._apply(entry["t"], entry["p"])
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def _apply(self, t: int, prices: dict):
+        for cid, price in prices.items():
+            if cid not in self.times:
+                self.times[cid] = array("q")
+                self.prices[cid] = array("d")
+            self.times[cid].append(t)
+            self.prices[cid].append(price)
+
+    def last(self, card_id: str) -> float | None:
+        series = self.prices.get(card_id)
+        return series[-1] if series else None
+
+    def observe(self, cards, t: int | None = None) -> dict | None:
+        """Record the prices of API ``cards``; returns the entry to append or ``None``."""
+        changed = {}
+        for card in cards:
+            price = card_price_usd(card)
+            if price is not None and price != self.last(card["id"]):
+                changed[card["id"]] = price
+        if not changed:
+            return None
+        entry = {"t": int(time.time()) if t is None else t, "p": changed}
+        self._apply(entry["t"], changed)
+        return entry
+
+    def append(self, entry: dict):
+        """Append an entry from :meth:`observe` (run on the writer thread)."""
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def series(self, card_id: str, since: int = 0) -> list[tuple[int, float]]:
+        times = self.times.get(card_id, ())
+        return [(t, p) for t, p in zip(times, self.prices.get(card_id, ())) if t >= since]
+
+
+class ValueHistory:
+    """Columnar snapshots of every player's collection value."""
+
+    def __init__(self, path: Path = VALUE_HISTORY_FILE, *, keep: int = 365, backups: int = 2):
+        self.path = Path(path)
+        self.keep = keep
+        self.backups = backups
+        data = read_json(self.path, {}, backups=backups)
+        self.times = array("q", data.get("t", []))
+        self.values = {
+            uid: array("d", (math.nan if v is None else v for v in column))
+            for uid, column in data.get("v", {}).items()
+        }
+
+    @property
+    def last_time(self) -> int:
+        return self.times[-1] if self.times else 0
+
+    def snapshot(self, values: dict, t: int | None = None):
+        """Add one row ``{uid: usd}``; players missing from ``values`` get no value."""
+        n = len(self.times)
+        self.times.append(int(time.time()) if t is None else t)
+        for uid, usd in values.items():
+            column = self.values.get(uid)
+            if column is None:
+                column = self.values[uid] = array("d", [math.nan] * n)
+            column.append(round(usd, 2))
+        for column in self.values.values():
+            if len(column) == n:
+                column.append(math.nan)
+        if len(self.times) > self.keep:
+            drop = len(self.times) - self.keep
+            del self.times[:drop]
+            for column in self.values.values():
+                del column[:drop]
+            self.values = {uid: c for uid, c in self.values.items() if any(not math.isnan(v) for v in c)}
+
+    def series(self, uid: str, last: int | None = None) -> list[tuple[int, float]]:
+        """``[(time, usd)]`` of the player's snapshots, optionally only the ``last`` ones."""
+        column = self.values.get(uid, ())
+        points = [(t, v) for t, v in zip(self.times, column) if not math.isnan(v)]
+        return points if last is None else points[-last:]
+
+    def change(self, uid: str) -> float | None:
+        """Value change between the player's two latest snapshots."""
+        points = self.series(uid, 2)
+        return points[1][1] - points[0][1] if len(points) == 2 else None
+
+    def trend(self, uid: str, since: int) -> float | None:
+        """Value change from the first snapshot at or after ``since`` to the latest one."""
+        points = [p for p in self.series(uid) if p[0] >= since]
+        return points[-1][1] - points[0][1] if len(points) >= 2 else None
+
+    def export(self) -> dict:
+        """JSON-ready copy of the store (taken on the event loop)."""
+        return {
+            "t": list(self.times),
+            "v": {uid: [None if math.isnan(v) else v for v in c] for uid, c in self.values.items()},
+        }
+
+    def save(self, data: dict):
+        atomic_write_json(self.path, data, indent=None, backups=self.backups)
+
+
+def sparkline(values: list[float]) -> str:
+    """Unicode chart of ``values`` (``"▁▃▅█"``)."""
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = high - low
+    if span <= 0:
+        return SPARK[len(SPARK) // 2] * len(values)
+    return "".join(SPARK[round((v - low) / span * (len(SPARK) - 1))] for v in values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print card price or collection value history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    card_cmd = sub.add_parser("card", help="Price series of one card")
+    card_cmd.add_argument("card_id")
+    user_cmd = sub.add_parser("user", help="Collection value series of one player")
+    user_cmd.add_argument("uid")
+    args = parser.parse_args()
+
+    if args.command == "card":
+        points = PriceHistory().series(args.card_id)
+    else:
+        points = ValueHistory().series(args.uid)
+    for t, value in points:
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(t))}  {value:10.2f} USD")
+    print(sparkline([v for _, v in points]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Sharded worker pool for booster openings.
+
+Jobs are routed to one of ``workers`` shards by a key (the user id), so the
+jobs of one user run one after another in order while different users are
+served in parallel. The pool keeps queue depth and wait-time metrics.
+
+Admission is bounded: each shard holds at most ``max_depth`` waiting jobs
+and each key at most ``per_key`` queued or running jobs; :meth:`ShardedQueue.put`
+raises :class:`QueueFull` with an ETA otherwise. Jobs still waiting after
+``deadline`` seconds are handed to ``on_expired`` instead of the handler,
+either when a worker reaches them or by a sweep over every shard run every
+``sweep_interval`` seconds, so a job stuck behind a slow shard expires on time.
+"""
+
+import asyncio
+import logging
+import time
+import zlib
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The job was not admitted; ``eta`` estimates when a slot frees up (seconds)."""
+
+    def __init__(self, reason: str, eta: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.eta = eta
+
+
+class _Job:
+    __slots__ = ("key", "item", "enqueued")
+
+    def __init__(self, key: str, item):
+        self.key = key
+        self.item = item
+        self.enqueued = time.monotonic()
+
+
+class ShardedQueue:
+    """Run ``await handler(item)`` for queued items on a pool of shard workers."""
+
+    def __init__(
+        self,
+        handler,
+        *,
+        workers: int = 4,
+        max_depth: int | None = None,
+        per_key: int | None = None,
+        deadline: float | None = None,
+        on_expired=None,
+        sweep_interval: float | None = None,
+        wait_samples: int = 500,
+    ):
+        self.handler = handler
+        self.shards = [deque() for _ in range(max(1, workers))]
+        self._wakeups = [asyncio.Event() for _ in self.shards]
+        self._busy = [None] * len(self.shards)
+        self.max_depth = max_depth
+        self.per_key = per_key
+        self.deadline = deadline
+        self.on_expired = on_expired
+        if sweep_interval is None and deadline is not None:
+            sweep_interval = max(1.0, deadline / 10)
+        self.sweep_interval = sweep_interval
+        self._per_key = {}
+        self.waits = deque(maxlen=wait_samples)
+        self.service_times = deque(maxlen=wait_samples)
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def shard_of(self, key: str) -> int:
+        return zlib.crc32(str(key).encode()) % len(self.shards)
+
+    def position(self, key: str) -> int:
+        """Number of jobs that will run in ``key``'s shard before a new job of ``key``."""
+        shard = self.shard_of(key)
+        return len(self.shards[shard]) + (self._busy[shard] is not None)
+
+    def service_time(self) -> float:
+        """Average time a job takes once started (1 s until measured)."""
+        if not self.service_times:
+            return 1.0
+        return sum(self.service_times) / len(self.service_times)
+
+    def eta(self, key: str) -> float:
+        """Estimated seconds until a new job of ``key`` would start."""
+        return self.position(key) * self.service_time()
+
+    def put(self, key: str, item) -> int:
+        """Queue ``item`` for ``key`` and return its 1-based position in the shard.
+
+        Raises :class:`QueueFull` when the shard or the key is at its limit.
+        """
+        key = str(key)
+        shard = self.shard_of(key)
+        if self.max_depth is not None and len(self.shards[shard]) >= self.max_depth:
+            self.rejected += 1
+            raise QueueFull("queue", self.eta(key))
+        if self.per_key is not None and self._per_key.get(key, 0) >= self.per_key:
+            self.rejected += 1
+            # The key's own oldest job has to finish first
+            raise QueueFull("user", self.eta(key))
+        position = self.position(key) + 1
+        self.shards[shard].append(_Job(key, item))
+        self._per_key[key] = self._per_key.get(key, 0) + 1
+        self._wakeups[shard].set()
+        return position
+
+    def _release(self, key: str):
+        left = self._per_key.get(key, 0) - 1
+        if left > 0:
+            self._per_key[key] = left
+        else:
+            self._per_key.pop(key, None)
+
+    def _is_expired(self, job: _Job, now: float) -> bool:
+        return self.deadline is not None and now - job.enqueued > self.deadline
+
+    async def _expire(self, job: _Job):
+        self.expired += 1
+        try:
+            if self.on_expired is not None:
+                await self.on_expired(job.item)
+        except Exception:
+            self.failed += 1
+            log.exception("Expiring queued job of %s failed", job.key)
+
+    async def sweep(self) -> int:
+        """Expire every waiting job past the deadline; returns how many expired."""
+        now = time.monotonic()
+        expired = []
+        for queue in self.shards:
+            if any(self._is_expired(job, now) for job in queue):
+                kept = []
+                for job in queue:
+                    (expired if self._is_expired(job, now) else kept).append(job)
+                queue.clear()
+                queue.extend(kept)
+        for job in expired:
+            self._release(job.key)
+            self.waits.append(now - job.enqueued)
+            self.processed += 1
+            await self._expire(job)
+        return len(expired)
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.sweep()
+
+    def depth(self) -> int:
+        return sum(len(q) for q in self.shards)
+
+    def in_flight(self) -> int:
+        return sum(job is not None for job in self._busy)
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "depth": self.depth(),
+            "shard_depths": [len(q) for q in self.shards],
+            "in_flight": self.in_flight(),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "service_avg": self.service_time(),
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+    async def _worker(self, shard: int):
+        queue = self.shards[shard]
+        wakeup = self._wakeups[shard]
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            job = queue.popleft()
+            started = time.monotonic()
+            self._busy[shard] = job
+            self.waits.append(started - job.enqueued)
+            try:
+                if self._is_expired(job, started):
+                    await self._expire(job)
+                else:
+                    await self.handler(job.item)
+                    self.service_times.append(time.monotonic() - started)
+            except Exception:
+                self.failed += 1
+                log.exception("Queued job of %s failed", job.key)
+            finally:
+                self._busy[shard] = None
+                self._release(job.key)
+                self.processed += 1
+
+    async def run(self):
+        """Run every shard worker (and the deadline sweep) until cancelled."""
+        tasks = [self._worker(i) for i in range(len(self.shards))]
+        if self.deadline is not None and self.sweep_interval:
+            tasks.append(self._sweeper())
+        await asyncio.gather(*tasks)
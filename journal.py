@@ -0,0 +1,179 @@
+"""Durable journal of booster-opening jobs.
+
+A queued booster has already left the player's inventory, so every job is
+recorded in an append-only JSONL file as it moves through its life cycle::
+
+    {"j": "9f2c...", "e": "enqueued", "u": "123", "s": "sv1"}
+    {"j": "9f2c...", "e": "drawn", "c": ["sv1-5", "sv1-17", ...]}
+    {"j": "9f2c...", "e": "credited"}      # or "refunded"
+
+A batched open of several boosters (``/otworz_szybko``) is one job with the
+number of packs ``n`` and of used Rare Boosts ``r``; its ``drawn`` entry holds
+``{card_id: copies}`` instead of a list::
+
+    {"j": "51ab...", "e": "enqueued", "u": "123", "s": "sv1", "n": 40, "r": 2}
+    {"j": "51ab...", "e": "drawn", "c": {"sv1-5": 3, ...}}
+
+After a restart :meth:`JobJournal.load` returns the jobs that never reached
+``credited``/``refunded`` so the bot can credit their drawn cards or give the
+booster back. Entries are group-committed: everything logged while a write is
+in progress goes to disk in the next single append + fsync.
+"""
+
+import asyncio
+import json
+import os
+import secrets
+from pathlib import Path
+
+DONE_EVENTS = ("credited", "refunded")
+
+
+class JobJournal:
+    """Append-only, group-committed journal of booster jobs.
+
+    ``write(fn, *args)`` runs a blocking function off the event loop (the
+    bot's single writer thread) and ``barrier()`` is awaited before every
+    batch, so user changes made before an entry are on disk before it.
+    """
+
+    def __init__(self, path: Path, *, write, barrier=None, compact_after: int = 10000):
+        self.path = Path(path)
+        self.write = write
+        self.barrier = barrier
+        self.compact_after = compact_after
+        self.jobs = {}
+        # Jobs taken by claim() whose settled entry is not written yet
+        self.claimed = {}
+        self._pending = []
+        self._flusher = None
+        self._lines = 0
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_hex(8)
+
+    def load(self) -> dict:
+        """Read the journal (blocking) and return ``{job_id: job}`` of unfinished jobs."""
+        jobs = {}
+        lines = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        continue
+                    job_id, event = entry.get("j"), entry.get("e")
+                    if event == "enqueued":
+                        jobs[job_id] = self._job(entry)
+                    elif event == "drawn" and job_id in jobs:
+                        jobs[job_id]["c"] = entry["c"]
+                    elif event in DONE_EVENTS:
+                        jobs.pop(job_id, None)
+        except FileNotFoundError:
+            pass
+        self.jobs = jobs
+        self._lines = lines
+        return dict(jobs)
+
+    @staticmethod
+    def _job(entry: dict) -> dict:
+        job = {"u": entry["u"], "s": entry["s"]}
+        for key in ("n", "r"):
+            if key in entry:
+                job[key] = entry[key]
+        return job
+
+    @staticmethod
+    def _enqueued_entry(job_id: str, job: dict) -> dict:
+        return {"j": job_id, "e": "enqueued", **job}
+
+    def claim(self, job_id: str | None) -> dict | None:
+        """Take ownership of an unfinished job; ``None`` if it was already settled."""
+        if job_id is None:
+            return None
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            self.claimed[job_id] = job
+        return job
+
+    async def enqueued(self, job_id: str, user_id: str, set_id: str, count: int = 1, boosts: int = 0):
+        """Record a job for ``count`` boosters that used ``boosts`` Rare Boosts."""
+        job = {"u": user_id, "s": set_id}
+        if count != 1:
+            job["n"] = count
+        if boosts:
+            job["r"] = boosts
+        self.jobs[job_id] = job
+        await self._log(self._enqueued_entry(job_id, job))
+
+    async def drawn(self, job_id: str, cards):
+        """Record the drawn card ids (a list) or ``{card_id: copies}`` of a batch."""
+        cards = dict(cards) if isinstance(cards, dict) else list(cards)
+        if job_id in self.jobs:
+            self.jobs[job_id]["c"] = cards
+        await self._log({"j": job_id, "e": "drawn", "c": cards})
+
+    async def settled(self, job_id: str, event: str):
+        """Record that a claimed job was ``"credited"`` or ``"refunded"``."""
+        self.jobs.pop(job_id, None)
+        await self._log({"j": job_id, "e": event})
+        self.claimed.pop(job_id, None)
+
+    async def _log(self, entry: dict):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((entry, fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+        await fut
+
+    async def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            # A claimed job is only resolved once its settled entry is on disk
+            settling = {entry["j"] for entry, _ in batch if entry["e"] in DONE_EVENTS}
+            unsettled = self.jobs or self.claimed.keys() - settling
+            truncate = not unsettled and self._lines + len(batch) >= self.compact_after
+            try:
+                if self.barrier is not None:
+                    await self.barrier()
+                await self.write(self._append, [entry for entry, _ in batch], truncate)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self._lines = 0 if truncate else self._lines + len(batch)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_result(None)
+
+    def _append(self, entries: list, truncate: bool = False):
+        # With no unfinished jobs left every line is resolved and can go
+        mode = "w" if truncate else "a"
+        with open(self.path, mode) as f:
+            if not truncate:
+                for entry in entries:
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, jobs: dict):
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "w") as f:
+            for job_id, job in jobs.items():
+                f.write(json.dumps(self._enqueued_entry(job_id, self._job(job))) + "\n")
+                if "c" in job:
+                    f.write(json.dumps({"j": job_id, "e": "drawn", "c": job["c"]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    async def compact(self):
+        """Rewrite the journal with only the unfinished jobs."""
+        jobs = {job_id: dict(job) for job_id, job in {**self.claimed, **self.jobs}.items()}
+        await self.write(self._rewrite, jobs)
+        self._lines = sum(1 + ("c" in job) for job in jobs.values())
@@ -0,0 +1,148 @@
+"""Incrementally maintained weekly leaderboards and server-wide standings.
+
+Every board (``"drops"`` - best card of the week, ``"community"`` - votes
+for drops) keeps only the ``size`` best players of each ISO week::
+
+    {"2026-W42": {"drops": {"123": [48.5, "Charizard ex"], ...},
+                  "community": {"456": [7, ""], ...}}}
+
+Scores within a week only grow and are always offered as the player's
+current total, so a player who fell off a full board re-enters with the
+right score and the kept entries are the exact top ``size``. Reading a
+ranking costs O(size) instead of a scan over every user.
+
+:class:`Standings` holds all-time rankings (collection value, unique cards,
+...) as snapshots rebuilt periodically from the per-user counters.
+"""
+
+import bisect
+import time
+from pathlib import Path
+
+from storage import atomic_write_json, read_json
+
+BOARDS = ("drops", "community")
+
+
+def week_key(week: int, year: int) -> str:
+    return f"{year}-W{week:02d}"
+
+
+class WeeklyBoard:
+    """Bounded top-K scores per ISO week, persisted to one JSON file."""
+
+    def __init__(self, path: Path, *, size: int = 100, keep_weeks: int = 8, backups: int = 2):
+        self.path = Path(path)
+        self.size = size
+        self.keep_weeks = keep_weeks
+        self.backups = backups
+        self.exists = self.path.exists()
+        self.weeks = read_json(self.path, {}, backups=backups)
+        self.dirty = False
+
+    def _board(self, board: str, week: int, year: int, create: bool = False) -> dict | None:
+        key = week_key(week, year)
+        boards = self.weeks.get(key)
+        if boards is None:
+            if not create:
+                return None
+            boards = self.weeks[key] = {name: {} for name in BOARDS}
+            # Keys sort chronologically; drop the oldest weeks
+            for old in sorted(self.weeks)[: -self.keep_weeks]:
+                del self.weeks[old]
+        return boards.setdefault(board, {}) if create else boards.get(board)
+
+    def offer(self, board: str, week: int, year: int, uid: str, score: float, label: str = "") -> bool:
+        """Record ``uid``'s current ``score``; returns True when the board changed."""
+        if score <= 0:
+            return False
+        entries = self._board(board, week, year, create=True)
+        current = entries.get(uid)
+        if current is not None:
+            if current == [score, label]:
+                return False
+        elif len(entries) >= self.size:
+            worst = min(entries, key=lambda u: entries[u][0])
+            if score <= entries[worst][0]:
+                return False
+            del entries[worst]
+        entries[uid] = [score, label]
+        self.dirty = True
+        return True
+
+    def count(self, board: str, week: int, year: int) -> int:
+        return len(self._board(board, week, year) or {})
+
+    def top(self, board: str, week: int, year: int, k: int | None = None, offset: int = 0) -> list:
+        """Ranked ``[(uid, score, label)]`` from ``offset``, at most ``k`` entries."""
+        entries = self._board(board, week, year) or {}
+        ranked = sorted(entries.items(), key=lambda e: e[1][0], reverse=True)
+        end = None if k is None else offset + k
+        return [(uid, score, label) for uid, (score, label) in ranked[offset:end]]
+
+    def rebuild(self, users: dict):
+        """Fill the boards from the ``weekly_best`` / ``weekly_community`` of every user."""
+        self.weeks = {}
+        for uid, user in users.items():
+            best = user.get("weekly_best") or {}
+            if best.get("week"):
+                self.offer("drops", best["week"], best["year"], uid, best.get("price", 0), best.get("name", ""))
+            wc = user.get("weekly_community") or {}
+            if wc.get("week"):
+                self.offer("community", wc["week"], wc["year"], uid, wc.get("score", 0))
+        self.exists = True
+        self.dirty = True
+
+    def snapshot(self) -> dict | None:
+        """Return a copy to persist and clear the dirty flag, or ``None`` if clean."""
+        if not self.dirty:
+            return None
+        self.dirty = False
+        return {
+            key: {name: {uid: list(entry) for uid, entry in entries.items()} for name, entries in boards.items()}
+            for key, boards in self.weeks.items()
+        }
+
+    def save(self, data: dict | None = None):
+        atomic_write_json(self.path, self.weeks if data is None else data, indent=None, backups=self.backups)
+
+
+class Standings:
+    """Server-wide rankings rebuilt from snapshots of per-user scores.
+
+    Each metric keeps the players sorted by score plus an ascending list of
+    the scores, so a player's rank is one binary search.
+    """
+
+    def __init__(self):
+        self.boards = {}
+        self.updated = 0.0
+
+    def rebuild(self, scores: dict):
+        """Replace the snapshot with ``{metric: {uid: score}}``; zero scores are not ranked."""
+        boards = {}
+        for metric, by_user in scores.items():
+            ranked = sorted(((uid, score) for uid, score in by_user.items() if score > 0), key=lambda e: (-e[1], e[0]))
+            ascending = [score for _, score in reversed(ranked)]
+            boards[metric] = (ranked, ascending, by_user)
+        self.boards = boards
+        self.updated = time.time()
+
+    def count(self, metric: str) -> int:
+        return len(self.boards[metric][0]) if metric in self.boards else 0
+
+    def top(self, metric: str, k: int, offset: int = 0) -> list:
+        """``[(uid, score)]`` of places ``offset + 1`` to ``offset + k``."""
+        if metric not in self.boards:
+            return []
+        return self.boards[metric][0][offset : offset + k]
+
+    def rank(self, metric: str, uid: str) -> tuple[int, float] | None:
+        """``(place, score)`` of ``uid``; players with equal scores share a place."""
+        if metric not in self.boards:
+            return None
+        _, ascending, by_user = self.boards[metric]
+        score = by_user.get(uid, 0)
+        if score <= 0:
+            return None
+        return len(ascending) - bisect.bisect_right(ascending, score) + 1, score
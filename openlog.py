@@ -0,0 +1,198 @@
+"""Seedable RNG streams for pack opening and the open log.
+
+Every booster open gets its own ``random.Random`` derived from a server seed
+and a monotonically increasing open id, so the pack can be regenerated later
+from one log line. The log (``opens.jsonl``) stores one compact JSON object
+per open::
+
+    {"id": 42, "t": 1718000000, "u": "123", "s": "sv1", "k": "draw", "b": 1, "c": ["sv1-5", ...]}
+
+``k`` is ``"draw"`` for a single pack (``b`` = boost flag, ``c`` = card ids)
+or ``"bulk"`` for a batched open (``n`` packs, ``b`` boosted packs, ``h`` =
+digest of the resulting counts).
+
+Run ``python3 openlog.py replay <id>`` to regenerate a logged pack from the
+local card cache, or ``python3 openlog.py bench`` to time fixed-seed draws.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import secrets
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+OPEN_LOG_FILE = BASE_DIR / "opens.jsonl"
+OPEN_SEED_FILE = BASE_DIR / "open_seed.txt"
+CARD_CACHE_DIR = BASE_DIR / "card_cache"
+
+
+def stream(seed: str, open_id: int) -> random.Random:
+    """Independent RNG for one open, fully determined by ``seed`` and ``open_id``."""
+    digest = hashlib.sha256(f"{seed}:{open_id}".encode()).digest()
+    return random.Random(int.from_bytes(digest[:16], "big"))
+
+
+def counts_digest(counts: dict) -> str:
+    """Short stable digest of ``{card_id: copies}``."""
+    data = json.dumps(sorted(counts.items()), separators=(",", ":"))
+    return hashlib.sha1(data.encode()).hexdigest()[:16]
+
+
+def load_seed(path: Path = OPEN_SEED_FILE) -> str:
+    """Return ``$OPEN_SEED`` or the seed stored in ``path``, creating it once."""
+    seed = os.environ.get("OPEN_SEED")
+    if seed:
+        return seed
+    try:
+        return Path(path).read_text().strip()
+    except FileNotFoundError:
+        seed = secrets.token_hex(16)
+        Path(path).write_text(seed + "\n")
+        return seed
+
+
+def _last_id(path: Path) -> int:
+    """Highest open id in the tail of the log, without scanning the whole file.
+
+    Ids are reserved before the pack is drawn, and a draw may wait for a
+    refill, so lines are not in id order; the maximum over the tail covers
+    every open that was still in flight when a later one was logged.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 65536))
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return 0
+    last = 0
+    for line in lines:
+        try:
+            last = max(last, json.loads(line)["id"])
+        except (ValueError, KeyError, TypeError):
+            # The first line of the window may be cut in half
+            continue
+    return last
+
+
+def read_entry(path: Path, open_id: int) -> dict | None:
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("id") == open_id:
+                return entry
+    return None
+
+
+class OpenLog:
+    """Hand out per-open RNG streams and append the opens to a JSONL log."""
+
+    def __init__(self, path: Path = OPEN_LOG_FILE, seed: str | None = None):
+        self.path = Path(path)
+        self.seed = seed if seed is not None else load_seed()
+        self.next_id = _last_id(self.path) + 1
+
+    def stream(self) -> tuple[int, random.Random]:
+        """Reserve the next open id and return it with its RNG."""
+        open_id = self.next_id
+        self.next_id += 1
+        return open_id, stream(self.seed, open_id)
+
+    def entry_for_draw(self, open_id: int, user_id: str, set_id: str, boost: bool, cards: list) -> dict:
+        return {
+            "id": open_id,
+            "t": int(time.time()),
+            "u": user_id,
+            "s": set_id,
+            "k": "draw",
+            "b": int(boost),
+            "c": [c["id"] for c in cards],
+        }
+
+    def entry_for_bulk(self, open_id: int, user_id: str, set_id: str, count: int, boosted: int, counts: dict) -> dict:
+        return {
+            "id": open_id,
+            "t": int(time.time()),
+            "u": user_id,
+            "s": set_id,
+            "k": "bulk",
+            "n": count,
+            "b": boosted,
+            "h": counts_digest(counts),
+        }
+
+    def append(self, entries: list):
+        """Append entries to the log (run on the writer thread)."""
+        with open(self.path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def replay(entry: dict, engine, seed: str):
+    """Regenerate a logged open. Returns ``(result, matches)``."""
+    rng = stream(seed, entry["id"])
+    if entry["k"] == "draw":
+        cards = engine.draw(entry["s"], boost=bool(entry["b"]), rng=rng) or []
+        ids = [c["id"] for c in cards]
+        return ids, ids == entry["c"]
+    counts = engine.draw_bulk(entry["s"], entry["n"], boosted=entry["b"], rng=rng) or {}
+    return dict(counts), counts_digest(counts) == entry["h"]
+
+
+def _engine(cache_dir: Path):
+    from booster import BoosterEngine
+    from catalog import CardCatalog, read_card_cache
+
+    catalog = CardCatalog(BASE_DIR / "card_catalog.json")
+    catalog.load_cache(read_card_cache(cache_dir))
+    return BoosterEngine(catalog)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged booster opens from the local card cache")
+    parser.add_argument("--log", default=OPEN_LOG_FILE, type=Path)
+    parser.add_argument("--cache", default=CARD_CACHE_DIR, type=Path)
+    parser.add_argument("--seed", help="Server seed (defaults to $OPEN_SEED / open_seed.txt)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay_cmd = sub.add_parser("replay", help="Regenerate one logged open")
+    replay_cmd.add_argument("open_id", type=int)
+    bench_cmd = sub.add_parser("bench", help="Time fixed-seed pack draws")
+    bench_cmd.add_argument("--set", dest="set_id", required=True)
+    bench_cmd.add_argument("--packs", type=int, default=10000)
+    bench_cmd.add_argument("--boost", action="store_true")
+    args = parser.parse_args()
+
+    seed = args.seed or load_seed()
+    engine = _engine(args.cache)
+    if args.command == "replay":
+        entry = read_entry(args.log, args.open_id)
+        if entry is None:
+            parser.error(f"open {args.open_id} not found in {args.log}")
+        result, matches = replay(entry, engine, seed)
+        print(json.dumps(result, indent=2))
+        print("OK - matches the log" if matches else "MISMATCH - card cache or seed differs from the logged open")
+        return
+
+    start = time.perf_counter()
+    counts = {}
+    for open_id in range(1, args.packs + 1):
+        for card in engine.draw(args.set_id, boost=args.boost, rng=stream(seed, open_id)) or []:
+            counts[card["id"]] = counts.get(card["id"], 0) + 1
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    bulk = engine.draw_bulk(args.set_id, args.packs, boosted=args.packs if args.boost else 0, rng=stream(seed, 0))
+    batched = time.perf_counter() - start
+    print(f"draw: {single / args.packs * 1e6:.1f} us/pack, digest {counts_digest(counts)}")
+    print(f"draw_bulk: {batched / args.packs * 1e6:.1f} us/pack, digest {counts_digest(bulk or {})}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,45 @@
+import asyncio
+import atexit
 import json
+import os
 import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 import discord
+from catalog import CardCatalog, migrate_cards, migrate_users
+from leaderboard import WeeklyBoard
+from registry import SetRegistry
+from storage import UserCache, atomic_write_json, open_user_store, read_json
 
 BASE_DIR = Path(__file__).resolve().parent
 USERS_FILE = BASE_DIR / "users.json"
+USERS_DB_FILE = BASE_DIR / "users.db"
 SETS_FILE = BASE_DIR / "sets.json"
 PRICE_FILE = BASE_DIR / "price.json"
 DATA_FILE = BASE_DIR / "data.json"
 EVENTS_FILE = BASE_DIR / "events.json"
 CHANNELS_FILE = BASE_DIR / "channels.json"
+CARD_CATALOG_FILE = BASE_DIR / "card_catalog.json"
+WEEKLY_BOARD_FILE = BASE_DIR / "weekly_board.json"
+
+# User storage backend: "sqlite" (default) or "json"
+USER_STORE_BACKEND = os.getenv("USER_STORE", "sqlite")
+_user_store = None
+_user_cache = None
+_card_catalog = None
+_weekly_board = None
+_set_registry = None
+# Write-behind flush cadence of the user cache
+USER_FLUSH_INTERVAL_MS = int(os.getenv("USER_FLUSH_INTERVAL_MS", 2000))
+USER_FLUSH_MAX_PENDING = int(os.getenv("USER_FLUSH_MAX_PENDING", 100))
+# Number of rotated backups (<file>.1, <file>.2, ...) kept for each JSON store
+JSON_BACKUPS = int(os.getenv("JSON_BACKUPS", 2))
+# One lock per user id, dropped automatically once nobody holds it
+_user_locks = weakref.WeakValueDictionary()
+# Every disk write goes through this single thread so writes stay ordered
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="poke-writer")
 
 # Default color for embeds used across the bot
 EMBED_COLOR = discord.Color.dark_teal()
@@ -20,33 +50,286 @@ def create_embed(title: str, description: str | None = None, *, color: discord.C
         color = EMBED_COLOR
     return discord.Embed(title=title, description=description, color=color)
 
+async def run_io_read(fn, *args):
+    """Run a blocking read in the default thread pool."""
+    return await asyncio.to_thread(fn, *args)
+
+async def run_io_write(fn, *args):
+    """Run a blocking write on the single writer thread."""
+    return await asyncio.get_running_loop().run_in_executor(_writer, fn, *args)
+
+def _snapshot(data):
+    # Deep copy taken on the event loop so later mutations cannot race the writer
+    return json.loads(json.dumps(data))
+
+def get_card_catalog():
+    """Return the shared card metadata catalog, loading it on first use."""
+    global _card_catalog
+    if _card_catalog is None:
+        _card_catalog = CardCatalog(CARD_CATALOG_FILE, backups=JSON_BACKUPS)
+    return _card_catalog
+
+def save_card_catalog():
+    data = get_card_catalog().snapshot()
+    if data is not None:
+        get_card_catalog().save(data)
+
+async def asave_card_catalog():
+    """Persist new catalog entries; queued before any later user flush."""
+    data = get_card_catalog().snapshot()
+    if data is not None:
+        await run_io_write(get_card_catalog().save, data)
+
+def get_weekly_board():
+    """Return the weekly leaderboards, loading them on first use."""
+    global _weekly_board
+    if _weekly_board is None:
+        _weekly_board = WeeklyBoard(WEEKLY_BOARD_FILE, backups=JSON_BACKUPS)
+    return _weekly_board
+
+def save_weekly_board():
+    data = get_weekly_board().snapshot()
+    if data is not None:
+        get_weekly_board().save(data)
+
+async def asave_weekly_board():
+    data = get_weekly_board().snapshot()
+    if data is not None:
+        await run_io_write(get_weekly_board().save, data)
+
+def _migrate_user_cards(users):
+    # Catalog is written first so migrated ids always resolve to metadata
+    changed = migrate_users(users, get_card_catalog())
+    save_card_catalog()
+    return changed
+
+def get_user_store():
+    """Return the configured user storage backend, opening it on first use."""
+    global _user_store
+    if _user_store is None:
+        store = open_user_store(
+            USER_STORE_BACKEND, USERS_FILE, USERS_DB_FILE, prepare=_migrate_user_cards
+        )
+        if store.has_legacy_cards():
+            changed = _migrate_user_cards(store.load_all())
+            if changed:
+                store.save_many(changed)
+                print(f"♻️ Przeniesiono karty {len(changed)} graczy do katalogu kart")
+            store.drop_legacy_cards()
+        _user_store = store
+    return _user_store
+
+def get_user_cache():
+    """Return the in-memory user cache in front of the storage backend."""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserCache(
+            get_user_store(),
+            flush_interval=USER_FLUSH_INTERVAL_MS / 1000,
+            max_pending=USER_FLUSH_MAX_PENDING,
+            executor=_writer,
+            prepare=ensure_user_fields,
+        )
+        atexit.register(flush_users)
+    return _user_cache
+
 def load_users():
-    try:
-        with open(USERS_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except json.JSONDecodeError:
-        return {}
+    return get_user_cache().all()
 
 def save_users(data):
-    with open(USERS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    get_user_cache().replace_all(data)
 
-def get_all_sets():
+async def aload_users():
+    return await get_user_cache().aall()
+
+async def asave_users(data):
+    await get_user_cache().areplace_all(data)
+
+def load_user(uid):
+    """Return a single user dictionary or ``None`` when the account is missing.
+
+    The returned dict is shared with the cache; modify users through
+    :func:`edit_user` or :func:`update_user` instead of mutating it directly.
+    """
+    return get_user_cache().get(str(uid))
+
+async def aload_user(uid):
+    """Async :func:`load_user`; a cache miss is read in a worker thread."""
+    return await get_user_cache().aget(str(uid))
+
+def save_user(uid, user):
+    """Store a single user; written to disk by the next cache flush."""
+    get_user_cache().put(str(uid), user)
+
+def find_user_by_name(fragment):
+    """Return the id of the first user whose name contains ``fragment``."""
+    return get_user_cache().find_user_by_name(fragment)
+
+async def afind_user_by_name(fragment):
+    return await get_user_cache().afind_user_by_name(fragment)
+
+def flush_users():
+    """Checkpoint: write every pending user change to disk right away."""
+    if _card_catalog is not None:
+        save_card_catalog()
+    if _weekly_board is not None:
+        save_weekly_board()
+    if _user_cache is not None:
+        return _user_cache.checkpoint()
+    return 0
+
+async def aflush_users():
+    if _card_catalog is not None:
+        await asave_card_catalog()
+    if _weekly_board is not None:
+        await asave_weekly_board()
+    if _user_cache is not None:
+        return await _user_cache.aflush()
+    return 0
+
+async def abarrier_users():
+    """Wait until the user changes made so far are on disk.
+
+    Unlike :func:`aflush_users` this only waits for the users already dirty
+    and shares the background flusher's next batch with other callers.
+    """
+    if _card_catalog is not None:
+        # Card ids stored in the users must resolve in the catalog
+        await asave_card_catalog()
+    if _user_cache is not None:
+        await _user_cache.barrier()
+
+async def _asave_user_companions():
+    # The weekly board is persisted with the users instead of on every change
+    if _weekly_board is not None:
+        await asave_weekly_board()
+
+async def run_user_flusher():
+    """Background task flushing the user cache until cancelled."""
+    await get_user_cache().run(before_flush=_asave_user_companions)
+
+def user_lock(uid):
+    """Return the asyncio lock serializing mutations of a single user."""
+    uid = str(uid)
+    lock = _user_locks.get(uid)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[uid] = lock
+    return lock
+
+def _drop_failed_edit(uid):
+    # Accounts are edited in place; a user without pending writes is simply
+    # re-read from disk, otherwise the partial edit stays in memory
+    if not get_user_cache().discard(uid):
+        print(f"⚠️ Nieudana edycja gracza {uid} - częściowe zmiany zostały w pamięci")
+
+@asynccontextmanager
+async def edit_users(*uids):
+    """Lock, load and yield ``{uid: user}`` for the given ids, saving them on exit.
+
+    Missing accounts map to ``None``. Locks are taken in sorted order so two
+    tasks editing the same pair of users cannot deadlock. The yielded dicts
+    are the cached accounts, so an edit costs O(1) regardless of collection
+    size and every existing user is marked for the next flush. If the block
+    raises, the edit is dropped (see :func:`_drop_failed_edit`).
+    """
+    ids = sorted({str(uid) for uid in uids})
+    locks = [user_lock(uid) for uid in ids]
+    for lock in locks:
+        await lock.acquire()
     try:
-        with open(SETS_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        return []
+        users = {uid: await aload_user(uid) for uid in ids}
+        try:
+            yield users
+        except BaseException:
+            for uid, user in users.items():
+                if user is not None:
+                    _drop_failed_edit(uid)
+            raise
+        for uid, user in users.items():
+            if user is not None:
+                save_user(uid, user)
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+@asynccontextmanager
+async def edit_user(uid):
+    """Lock, load and yield one user (``None`` if missing), saving changes on exit."""
+    uid = str(uid)
+    async with edit_users(uid) as users:
+        yield users[uid]
+
+async def update_user(uid, fn):
+    """Apply ``fn(user)`` under the user's lock and persist only that user.
+
+    Returns whatever ``fn`` returns, or ``None`` when the account does not
+    exist. A ``fn`` returning ``False`` changed nothing, so the user is not
+    written.
+    """
+    uid = str(uid)
+    async with user_lock(uid):
+        user = await aload_user(uid)
+        if user is None:
+            return None
+        try:
+            result = fn(user)
+        except BaseException:
+            _drop_failed_edit(uid)
+            raise
+        if result is not False:
+            save_user(uid, user)
+        return result
+
+async def create_user(uid, user):
+    """Store a new account unless one already exists. Returns True when created."""
+    uid = str(uid)
+    async with user_lock(uid):
+        if await aload_user(uid) is not None:
+            return False
+        save_user(uid, ensure_user_fields(user))
+        return True
+
+def get_all_sets():
+    """Return the :class:`SetRegistry` (a sequence of set dicts), reloading it if sets.json changed."""
+    global _set_registry
+    if _set_registry is None:
+        _set_registry = SetRegistry(SETS_FILE, backups=JSON_BACKUPS)
+        _set_registry.load()
+    elif _set_registry.stale():
+        _set_registry.load()
+    return _set_registry
+
+def _write_sets(data):
+    atomic_write_json(SETS_FILE, data, backups=JSON_BACKUPS)
+
+def save_sets(data):
+    _write_sets(data)
+    if _set_registry is not None:
+        _set_registry.replace(data)
+
+async def aget_all_sets():
+    global _set_registry
+    if _set_registry is None:
+        _set_registry = SetRegistry(SETS_FILE, backups=JSON_BACKUPS)
+    elif not _set_registry.stale():
+        return _set_registry
+    _set_registry.adopt(*await run_io_read(_set_registry.read))
+    return _set_registry
+
+async def asave_sets(data):
+    data = _snapshot(data)
+    await run_io_write(_write_sets, data)
+    if _set_registry is not None:
+        _set_registry.replace(data)
 
 
 def ensure_user_fields(user):
     """Ensure that a user dictionary contains all expected keys."""
     user.setdefault("boosters", [])
-    user.setdefault("cards", [])
+    user.setdefault("cards", {})
+    if isinstance(user["cards"], list):
+        migrate_cards(user, get_card_catalog())
     user.setdefault("rare_boost", 0)
     user.setdefault("double_daily_until", 0)
     user.setdefault("streak_freeze", 0)
@@ -65,62 +348,107 @@ def ensure_user_fields(user):
     return user
 
 
+def _read_prices():
+    return read_json(PRICE_FILE, None, backups=JSON_BACKUPS)
+
+
 def load_prices():
-    try:
-        with open(PRICE_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        sets = get_all_sets()
-        prices = {}
-        for s in sets:
-            try:
-                year = int(s.get("releaseDate", "2000/01/01").split("-")[0])
-            except Exception:
-                year = 2000
-            age = max(0, 2025 - year)
-            usd = round(4.0 + age * 0.1, 2)
-            price = int(usd * 25)
-            prices[s["id"]] = price
-        with open(PRICE_FILE, "w") as f:
-            json.dump(prices, f, indent=4)
+    prices = _read_prices()
+    if prices is not None:
         return prices
+    sets = get_all_sets()
+    prices = {}
+    for s in sets:
+        try:
+            year = int(s.get("releaseDate", "2000/01/01").split("-")[0])
+        except Exception:
+            year = 2000
+        age = max(0, 2025 - year)
+        usd = round(4.0 + age * 0.1, 2)
+        price = int(usd * 25)
+        prices[s["id"]] = price
+    save_prices(prices)
+    return prices
 
 
 def save_prices(data):
-    with open(PRICE_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    atomic_write_json(PRICE_FILE, data, backups=JSON_BACKUPS)
 
 
-def load_data():
+_prices = None
+_prices_mtime = None
+
+
+def _prices_stat():
     try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+        return os.stat(PRICE_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+async def aload_prices():
+    """Return the price list, re-reading price.json only when it changed.
+
+    The same dict is returned until the file changes, so callers must not
+    mutate it (build a copy and pass it to :func:`asave_prices` instead).
+    """
+    global _prices, _prices_mtime
+    mtime = _prices_stat()
+    if _prices is not None and mtime == _prices_mtime:
+        return _prices
+    prices = await run_io_read(_read_prices)
+    if prices is None:
+        # Generating the default price list writes price.json
+        prices = await run_io_write(load_prices)
+        mtime = _prices_stat()
+    _prices, _prices_mtime = prices, mtime
+    return prices
+
+
+async def asave_prices(data):
+    global _prices, _prices_mtime
+    data = _snapshot(data)
+    await run_io_write(save_prices, data)
+    _prices, _prices_mtime = data, _prices_stat()
+
+
+def load_data():
+    return read_json(DATA_FILE, {}, backups=JSON_BACKUPS)
 
 
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    atomic_write_json(DATA_FILE, data, backups=JSON_BACKUPS)
+
+
+async def aload_data():
+    return await run_io_read(load_data)
+
+
+async def asave_data(data):
+    await run_io_write(save_data, _snapshot(data))
 
 
 def load_events():
-    try:
-        with open(EVENTS_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    return read_json(EVENTS_FILE, [], backups=JSON_BACKUPS)
 
 
 def save_events(data):
-    with open(EVENTS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    atomic_write_json(EVENTS_FILE, data, backups=JSON_BACKUPS)
+
+
+async def aload_events():
+    return await run_io_read(load_events)
 
 
-def active_event_types(now=None):
+async def asave_events(data):
+    await run_io_write(save_events, _snapshot(data))
+
+
+def active_event_types(now=None, events=None):
     if now is None:
         now = time.time()
-    events = load_events()
+    if events is None:
+        events = load_events()
     types = set()
     for ev in events:
         if ev.get("start", 0) <= now <= ev.get("end", 0):
@@ -128,14 +456,21 @@ def active_event_types(now=None):
     return types
 
 
+async def aactive_event_types(now=None):
+    return active_event_types(now, await aload_events())
+
+
 def load_channels():
-    try:
-        with open(CHANNELS_FILE, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    return read_json(CHANNELS_FILE, {}, backups=JSON_BACKUPS)
 
 
 def save_channels(data):
-    with open(CHANNELS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    atomic_write_json(CHANNELS_FILE, data, backups=JSON_BACKUPS)
+
+
+async def aload_channels():
+    return await run_io_read(load_channels)
+
+
+async def asave_channels(data):
+    await run_io_write(save_channels, _snapshot(data))
@@ -0,0 +1,155 @@
+"""Concurrent, rate-limited downloads from the Pokemon TCG API.
+
+Every request goes through a shared :class:`TokenBucket` so the bot stays
+within the API quota, and transient failures (timeouts, 429, 5xx) are retried
+with jittered exponential backoff. :class:`CardPrefetcher` downloads whole
+sets with bounded concurrency and hands each finished set to a callback so
+it can be persisted right away.
+"""
+
+import asyncio
+import random
+import time
+
+import aiohttp
+
+API_URL = "https://api.pokemontcg.io/v2"
+PAGE_SIZE = 250
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ApiError(Exception):
+    """The API answered with an error status."""
+
+
+class TokenBucket:
+    """Allow ``rate`` acquisitions per second with bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def get_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    *,
+    limiter: TokenBucket | None = None,
+    retries: int = 4,
+    backoff: float = 1.0,
+):
+    """GET ``url`` and return the decoded JSON, retrying transient failures."""
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            await limiter.acquire()
+        retry_after = None
+        try:
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                if resp.status not in RETRY_STATUSES:
+                    raise ApiError(f"HTTP {resp.status} for {url}")
+                retry_after = resp.headers.get("Retry-After")
+                error = ApiError(f"HTTP {resp.status} for {url}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+        if attempt == retries:
+            raise error
+        delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+        await asyncio.sleep(delay)
+
+
+async def fetch_set_cards(session: aiohttp.ClientSession, set_id: str, *, limiter: TokenBucket | None = None) -> list:
+    """Return every card of a set; pages after the first are fetched concurrently."""
+    url = f"{API_URL}/cards?q=set.id:{set_id}&page={{}}&pageSize={PAGE_SIZE}"
+    first = await get_json(session, url.format(1), limiter=limiter)
+    cards = list(first.get("data", []))
+    total = first.get("totalCount", len(cards))
+    pages = -(-total // PAGE_SIZE)
+    if pages > 1:
+        rest = await asyncio.gather(
+            *(get_json(session, url.format(page), limiter=limiter) for page in range(2, pages + 1))
+        )
+        for data in rest:
+            cards.extend(data.get("data", []))
+    return cards
+
+
+def group_by_rarity(cards: list) -> dict:
+    """Group API cards into ``{rarity: [cards]}``."""
+    rarities = {}
+    for card in cards:
+        rarities.setdefault(card.get("rarity", "Unknown"), []).append(card)
+    return rarities
+
+
+class CardPrefetcher:
+    """Download the cards of many sets with at most ``concurrency`` sets in flight.
+
+    ``on_set(set_id, rarities)`` is awaited for every finished set, so a
+    restart only has to fetch the sets that were not stored yet.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        limiter: TokenBucket | None = None,
+        concurrency: int = 4,
+        on_set=None,
+        progress_every: int = 10,
+    ):
+        self.session = session
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.on_set = on_set
+        self.progress_every = progress_every
+        self.done = 0
+        self.failed = []
+        self.total = 0
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            try:
+                set_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                cards = await fetch_set_cards(self.session, set_id, limiter=self.limiter)
+                if self.on_set is not None:
+                    await self.on_set(set_id, group_by_rarity(cards))
+                self.done += 1
+            except Exception as e:
+                self.failed.append(set_id)
+                print(f"❌ Nie udało się pobrać kart setu {set_id}: {e}")
+            finished = self.done + len(self.failed)
+            if finished % self.progress_every == 0 or finished == self.total:
+                print(f"📥 Pobieranie kart: {finished}/{self.total} setów")
+
+    async def run(self, set_ids) -> list:
+        """Fetch ``set_ids`` and return the ids that failed."""
+        queue = asyncio.Queue()
+        for set_id in set_ids:
+            queue.put_nowait(set_id)
+        self.total = queue.qsize()
+        if not self.total:
+            return []
+        workers = min(self.concurrency, self.total)
+        await asyncio.gather(*(self._worker(queue) for _ in range(workers)))
+        return self.failed
@@ -0,0 +1,110 @@
+"""In-memory registry of the sets stored in ``sets.json``.
+
+The registry is a read-only sequence of set dicts (so it can be passed
+wherever the plain list returned by ``get_all_sets`` used to go) with O(1)
+lookups by set id and by ptcgoCode and a precomputed series grouping. The file
+is parsed once and only re-read when its modification time changes.
+"""
+
+import os
+import re
+import time
+from collections.abc import Sequence
+from pathlib import Path
+
+from storage import read_json
+
+# Trainer/Galarian galleries, Shining Fates' shiny vault and the Celebrations
+# classic collection share the ptcgoCode of their main set
+SUBSET_ID_RE = re.compile(r"(tg|gg|sv|c)$")
+
+
+def _main_set_key(s: dict) -> tuple:
+    """Sort key choosing the main set among sets sharing a ptcgoCode."""
+    return bool(SUBSET_ID_RE.search(s["id"])), s["id"]
+
+
+class SetRegistry(Sequence):
+    """Sets from ``sets.json`` indexed by id, ptcgoCode and series."""
+
+    def __init__(self, path: Path, *, backups: int = 0, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.backups = backups
+        self.check_interval = check_interval
+        self.mtime = None
+        self._checked = 0.0
+        self._index([])
+
+    def __getitem__(self, index):
+        return self.sets[index]
+
+    def __len__(self) -> int:
+        return len(self.sets)
+
+    def __contains__(self, set_id) -> bool:
+        return set_id in self.by_id
+
+    def _index(self, sets: list):
+        self.sets = list(sets)
+        self.by_id = {s["id"]: s for s in self.sets}
+        self.by_code = {}
+        self.series = {}
+        for s in self.sets:
+            # The choice must not depend on file order, which follows the
+            # API's order for sets released on the same day
+            code = (s.get("ptcgoCode") or "").upper()
+            if code:
+                current = self.by_code.get(code)
+                if current is None or _main_set_key(s) < _main_set_key(current):
+                    self.by_code[code] = s
+            self.series.setdefault(s.get("series", ""), []).append(s)
+
+    def _stat(self) -> float | None:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def read(self) -> tuple[list, float | None]:
+        """Read the file without touching the registry (safe in a worker thread)."""
+        mtime = self._stat()
+        return read_json(self.path, [], backups=self.backups), mtime
+
+    def adopt(self, sets: list, mtime: float | None):
+        """Rebuild every index from ``sets`` read at ``mtime``."""
+        self._index(sets)
+        self.mtime = mtime
+        self._checked = time.monotonic()
+
+    def load(self):
+        self.adopt(*self.read())
+
+    def replace(self, sets: list):
+        """Adopt a list that was just written to the file."""
+        self.adopt(sets, self._stat())
+
+    def stale(self) -> bool:
+        """True when the file changed on disk; checked at most every ``check_interval``."""
+        now = time.monotonic()
+        if self.mtime is not None and now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        return self._stat() != self.mtime
+
+    def get(self, set_id: str) -> dict | None:
+        return self.by_id.get(set_id)
+
+    def by_ptcgo(self, code: str) -> dict | None:
+        return self.by_code.get(code.upper())
+
+    def name(self, set_id: str) -> str:
+        s = self.by_id.get(set_id)
+        return s["name"] if s else set_id
+
+    def ptcgo_code(self, set_id: str, default: str = "-") -> str:
+        s = self.by_id.get(set_id)
+        return s.get("ptcgoCode", default) if s else default
+
+    def logo(self, set_id: str) -> str | None:
+        s = self.by_id.get(set_id)
+        return s.get("images", {}).get("logo") if s else None
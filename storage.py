@@ -0,0 +1,663 @@
+"""Pluggable storage backends for user accounts.
+
+``poke_utils`` talks to the active backend through the small :class:`UserStore`
+interface. ``JsonUserStore`` keeps the historical ``users.json`` layout while
+``SqliteUserStore`` keeps one row per user plus a normalized cards table so a
+single account can be read or written without touching anybody else.
+:class:`UserCache` sits in front of a backend and batches writes.
+:func:`atomic_write_json` and :func:`read_json` are the crash-safe file
+helpers shared by every JSON store of the bot.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+
+
+def _backup_path(path: Path, n: int) -> Path:
+    return path.with_name(f"{path.name}.{n}")
+
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path: Path, data, *, indent: int | None = 4, backups: int = 0):
+    """Write JSON through a fsynced temp file and ``os.replace``.
+
+    A crash leaves either the old or the new file, never a truncated one.
+    With ``backups`` > 0 the previous versions are kept as ``<name>.1`` to
+    ``<name>.<backups>`` (``.1`` being the newest).
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        if backups > 0 and path.exists():
+            for n in range(backups - 1, 0, -1):
+                older = _backup_path(path, n)
+                if older.exists():
+                    os.replace(older, _backup_path(path, n + 1))
+            os.replace(path, _backup_path(path, 1))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def read_json(path: Path, default=None, *, backups: int = 0):
+    """Load JSON from ``path``, falling back to the newest readable backup.
+
+    Returns ``default`` only when neither the file nor any backup can be read.
+    """
+    path = Path(path)
+    candidates = [path] + [_backup_path(path, n) for n in range(1, backups + 1)]
+    for candidate in candidates:
+        try:
+            with open(candidate, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            continue
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            print(f"⚠️ Uszkodzony plik {candidate.name}, próbuję kopii zapasowej")
+            continue
+        if candidate != path:
+            print(f"♻️ Wczytano {path.name} z kopii {candidate.name}")
+        return data
+    return default
+
+
+class UserStore:
+    """Interface implemented by every user storage backend."""
+
+    def load_all(self) -> dict:
+        raise NotImplementedError
+
+    def save_all(self, data: dict):
+        raise NotImplementedError
+
+    def load_user(self, uid: str) -> dict | None:
+        raise NotImplementedError
+
+    def save_user(self, uid: str, user: dict):
+        raise NotImplementedError
+
+    def save_many(self, users: dict):
+        """Persist several users at once."""
+        for uid, user in users.items():
+            self.save_user(uid, user)
+
+    def find_user_by_name(self, fragment: str) -> str | None:
+        """Return the id of the first user whose name contains ``fragment``."""
+        fragment = fragment.lower()
+        for uid, user in self.load_all().items():
+            if fragment in user.get("username", "").lower():
+                return uid
+        return None
+
+    def has_legacy_cards(self) -> bool:
+        """Whether users may still hold the old per-copy card list."""
+        return True
+
+    def drop_legacy_cards(self):
+        """Forget the legacy card layout once every user has been migrated."""
+
+    def close(self):
+        pass
+
+
+class JsonUserStore(UserStore):
+    """Whole-file JSON storage used before the SQLite backend existed."""
+
+    def __init__(self, path: Path, *, backups: int = 3):
+        self.path = Path(path)
+        self.backups = backups
+
+    def load_all(self) -> dict:
+        return read_json(self.path, {}, backups=self.backups)
+
+    def save_all(self, data: dict):
+        atomic_write_json(self.path, data, backups=self.backups)
+
+    def load_user(self, uid: str) -> dict | None:
+        return self.load_all().get(uid)
+
+    def save_user(self, uid: str, user: dict):
+        self.save_many({uid: user})
+
+    def save_many(self, users: dict):
+        data = self.load_all()
+        data.update(users)
+        self.save_all(data)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    username TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_cards (
+    uid TEXT NOT NULL,
+    card_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (uid, card_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS user_cards_card_id ON user_cards (card_id);
+"""
+
+
+class SqliteUserStore(UserStore):
+    """SQLite storage in WAL mode with one row per user and per owned card id.
+
+    Databases created before the compact card schema keep their per-copy
+    ``cards`` table until :meth:`drop_legacy_cards`; users found only there
+    are returned with the old card list so they can be migrated.
+
+    The card counts last read or written for each user are remembered, so a
+    save only touches the ``user_cards`` rows that changed and skips the
+    table entirely when the collection did not change.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._saved_cards = {}
+        self.legacy_cards = (
+            self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cards'"
+            ).fetchone()
+            is not None
+        )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def has_legacy_cards(self) -> bool:
+        return self.legacy_cards
+
+    def drop_legacy_cards(self):
+        with self._lock:
+            if not self.legacy_cards:
+                return
+            if self._conn.execute("SELECT 1 FROM cards LIMIT 1").fetchone() is None:
+                self._conn.execute("DROP TABLE cards")
+                self.legacy_cards = False
+
+    @staticmethod
+    def _card_from_row(row) -> dict:
+        card_id, name, price_usd, img_url, rarity = row
+        card = {"id": card_id, "name": name, "price_usd": price_usd, "img_url": img_url}
+        if rarity is not None:
+            card["rarity"] = rarity
+        return card
+
+    def _write_user(self, uid: str, user: dict):
+        fields = {k: v for k, v in user.items() if k != "cards"}
+        self._conn.execute(
+            "INSERT INTO users (uid, username, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET username = excluded.username, data = excluded.data",
+            (uid, user.get("username", ""), json.dumps(fields)),
+        )
+        cards = user.get("cards", {})
+        if isinstance(cards, list):
+            # Legacy list; its metadata is expected to be in the card catalog already
+            cards = Counter(c["id"] if isinstance(c, dict) else c for c in cards)
+        cards = {card_id: count for card_id, count in cards.items() if count > 0}
+        saved = self._saved_cards.get(uid)
+        if saved is None:
+            saved = dict(self._conn.execute("SELECT card_id, count FROM user_cards WHERE uid = ?", (uid,)))
+        if cards != saved:
+            self._conn.executemany(
+                "INSERT INTO user_cards (uid, card_id, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(uid, card_id) DO UPDATE SET count = excluded.count",
+                ((uid, card_id, count) for card_id, count in cards.items() if saved.get(card_id) != count),
+            )
+            self._conn.executemany(
+                "DELETE FROM user_cards WHERE uid = ? AND card_id = ?",
+                ((uid, card_id) for card_id in saved.keys() - cards.keys()),
+            )
+        if self.legacy_cards:
+            self._conn.execute("DELETE FROM cards WHERE uid = ?", (uid,))
+        return cards
+
+    def _legacy_cards_of(self, uid: str) -> list:
+        rows = self._conn.execute(
+            "SELECT card_id, name, price_usd, img_url, rarity FROM cards WHERE uid = ? ORDER BY pos",
+            (uid,),
+        )
+        return [self._card_from_row(r) for r in rows]
+
+    def load_all(self) -> dict:
+        with self._lock:
+            users = {}
+            for uid, data in self._conn.execute("SELECT uid, data FROM users ORDER BY rowid"):
+                user = json.loads(data)
+                user["cards"] = {}
+                users[uid] = user
+            for uid, card_id, count in self._conn.execute("SELECT uid, card_id, count FROM user_cards"):
+                if uid in users:
+                    users[uid]["cards"][card_id] = count
+            self._saved_cards = {uid: dict(user["cards"]) for uid, user in users.items()}
+            if self.legacy_cards:
+                legacy = {uid for (uid,) in self._conn.execute("SELECT DISTINCT uid FROM cards")}
+                for uid in legacy & users.keys():
+                    users[uid]["cards"] = self._legacy_cards_of(uid)
+            return users
+
+    def save_all(self, data: dict):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = {uid for (uid,) in self._conn.execute("SELECT uid FROM users")}
+                for uid in existing - set(data):
+                    self._conn.execute("DELETE FROM users WHERE uid = ?", (uid,))
+                    self._conn.execute("DELETE FROM user_cards WHERE uid = ?", (uid,))
+                    if self.legacy_cards:
+                        self._conn.execute("DELETE FROM cards WHERE uid = ?", (uid,))
+                written = {uid: self._write_user(uid, user) for uid, user in data.items()}
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._saved_cards = written
+
+    def load_user(self, uid: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM users WHERE uid = ?", (uid,)).fetchone()
+            if row is None:
+                return None
+            user = json.loads(row[0])
+            rows = self._conn.execute("SELECT card_id, count FROM user_cards WHERE uid = ?", (uid,))
+            user["cards"] = dict(rows.fetchall())
+            self._saved_cards[uid] = dict(user["cards"])
+            if self.legacy_cards and not user["cards"]:
+                user["cards"] = self._legacy_cards_of(uid)
+            return user
+
+    def save_user(self, uid: str, user: dict):
+        self.save_many({uid: user})
+
+    def save_many(self, users: dict):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                written = {uid: self._write_user(uid, user) for uid, user in users.items()}
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Only remembered once committed, so a failed batch is diffed again
+            self._saved_cards.update(written)
+
+    def find_user_by_name(self, fragment: str) -> str | None:
+        fragment = fragment.lower()
+        with self._lock:
+            rows = self._conn.execute("SELECT uid, username FROM users ORDER BY rowid").fetchall()
+        for uid, username in rows:
+            if fragment in username.lower():
+                return uid
+        return None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class UserCache:
+    """Authoritative in-memory copy of the user store with write-behind flushing.
+
+    Until :meth:`run` is started every write goes straight to the backend.
+    While it runs, writes only mark users dirty and the flusher persists them
+    in one batch every ``flush_interval`` seconds or after ``max_pending``
+    mutations, whichever comes first. Backend writes are submitted to
+    ``executor`` (a single writer thread) so they never block the event loop
+    and are applied in order. :meth:`barrier` waits for the changes made so
+    far to reach the backend, sharing the flusher's next batch with every
+    other waiter.
+    """
+
+    def __init__(
+        self,
+        store: UserStore,
+        *,
+        flush_interval: float = 2.0,
+        max_pending: int = 100,
+        executor=None,
+        prepare=None,
+    ):
+        self.store = store
+        # Applied once to every account read from the backend
+        self.prepare = prepare
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.executor = executor
+        self.users = {}
+        self.dirty = set()
+        # Users taken by flushes whose write has not finished yet (uid -> flushes)
+        self.inflight = Counter()
+        self.pending = 0
+        self.complete = False
+        self.write_behind = False
+        self._wakeup = None
+        # Number of put() calls so far and how many of them are on disk
+        self._seq = 0
+        self._durable = 0
+        self._flushed = None
+        self._flush_error = None
+
+    def _adopt(self, uid: str, user: dict) -> dict:
+        # A concurrent put() while we were reading wins over disk data
+        if uid not in self.users:
+            if self.prepare is not None:
+                self.prepare(user)
+            self.users[uid] = user
+        return self.users[uid]
+
+    def get(self, uid: str) -> dict | None:
+        user = self.users.get(uid)
+        if user is None and not self.complete:
+            user = self.store.load_user(uid)
+            if user is not None:
+                user = self._adopt(uid, user)
+        return user
+
+    async def aget(self, uid: str) -> dict | None:
+        user = self.users.get(uid)
+        if user is None and not self.complete:
+            loaded = await asyncio.to_thread(self.store.load_user, uid)
+            if loaded is not None:
+                user = self._adopt(uid, loaded)
+        return user
+
+    def all(self) -> dict:
+        if not self.complete:
+            for uid, user in self.store.load_all().items():
+                self._adopt(uid, user)
+            self.complete = True
+        return dict(self.users)
+
+    async def aall(self) -> dict:
+        if not self.complete:
+            data = await asyncio.to_thread(self.store.load_all)
+            for uid, user in data.items():
+                self._adopt(uid, user)
+            self.complete = True
+        return dict(self.users)
+
+    def discard(self, uid: str) -> bool:
+        """Drop an unsaved in-memory edit by re-reading the user from the backend.
+
+        Only possible while the user has no pending or in-flight writes;
+        returns False (keeping the cached copy) otherwise.
+        """
+        if uid in self.dirty or self.inflight[uid]:
+            return False
+        if self.users.pop(uid, None) is not None:
+            self.complete = False
+        return True
+
+    def put(self, uid: str, user: dict):
+        self.users[uid] = user
+        self.dirty.add(uid)
+        self.pending += 1
+        self._seq += 1
+        if not self.write_behind:
+            self.checkpoint()
+        elif self.pending >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def replace_all(self, data: dict):
+        """Replace every account at once; written through immediately."""
+        self.users = dict(data)
+        self.dirty.clear()
+        self.pending = 0
+        self.complete = True
+        seq = self._seq
+        self._in_writer(self.store.save_all, data)
+        self._durable = max(self._durable, seq)
+
+    async def areplace_all(self, data: dict):
+        self.users = dict(data)
+        self.dirty.clear()
+        self.pending = 0
+        self.complete = True
+        seq = self._seq
+        await self._ain_writer(self.store.save_all, self._snapshot(data))
+        self._durable = max(self._durable, seq)
+
+    def find_user_by_name(self, fragment: str) -> str | None:
+        if not self.complete:
+            self.checkpoint()
+            return self.store.find_user_by_name(fragment)
+        return self._find_cached(fragment)
+
+    async def afind_user_by_name(self, fragment: str) -> str | None:
+        if not self.complete:
+            await self.aflush()
+            return await asyncio.to_thread(self.store.find_user_by_name, fragment)
+        return self._find_cached(fragment)
+
+    def _find_cached(self, fragment: str) -> str | None:
+        fragment = fragment.lower()
+        for uid, user in self.users.items():
+            if fragment in user.get("username", "").lower():
+                return uid
+        return None
+
+    @staticmethod
+    def _snapshot(users: dict) -> dict:
+        # Deep copy so the writer thread never sees dicts mutated on the loop;
+        # card counts are ints, so a flat copy of the large cards map is enough
+        copies = {}
+        for uid, user in users.items():
+            cards = user.get("cards")
+            if isinstance(cards, dict):
+                copy = json.loads(json.dumps({k: v for k, v in user.items() if k != "cards"}))
+                copy["cards"] = dict(cards)
+            else:
+                copy = json.loads(json.dumps(user))
+            copies[uid] = copy
+        return copies
+
+    def _take_batch(self) -> dict:
+        batch = {uid: self.users[uid] for uid in self.dirty}
+        self.dirty = set()
+        self.pending = 0
+        return batch
+
+    def _in_writer(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        try:
+            return self.executor.submit(fn, *args).result()
+        except RuntimeError:
+            # Executor already shut down (interpreter exit)
+            return fn(*args)
+
+    async def _ain_writer(self, fn, *args):
+        if self.executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def flush(self) -> int:
+        """Write all dirty users to the backend and return how many were saved."""
+        if not self.dirty:
+            return 0
+        seq = self._seq
+        batch = self._take_batch()
+        try:
+            self.store.save_many(batch)
+        except Exception:
+            self.dirty |= batch.keys()
+            raise
+        self._durable = max(self._durable, seq)
+        return len(batch)
+
+    def checkpoint(self) -> int:
+        """Flush synchronously, queued behind any in-flight background write."""
+        return self._in_writer(self.flush)
+
+    async def aflush(self) -> int:
+        """Flush dirty users on the writer thread without blocking the loop."""
+        if not self.dirty:
+            return 0
+        seq = self._seq
+        batch = self._snapshot(self._take_batch())
+        self.inflight.update(batch.keys())
+        try:
+            await self._ain_writer(self.store.save_many, batch)
+        except Exception as e:
+            self.dirty |= batch.keys()
+            self._notify_flushed(e)
+            raise
+        finally:
+            self.inflight.subtract(batch.keys())
+            self.inflight = +self.inflight
+        self._durable = max(self._durable, seq)
+        self._notify_flushed(None)
+        return len(batch)
+
+    def _notify_flushed(self, error):
+        self._flush_error = error
+        if self._flushed is not None:
+            self._flushed.set()
+            self._flushed = None
+
+    async def barrier(self):
+        """Wait until every user change made so far is written to the backend.
+
+        While the flusher runs it is woken up instead of writing here, so
+        concurrent callers are served by one batch; users changed after the
+        call are not waited for.
+        """
+        target = self._seq
+        while self._durable < target:
+            if not self.write_behind:
+                if self.dirty:
+                    await self.aflush()
+                    continue
+            elif self._wakeup is not None:
+                self._wakeup.set()
+            if self._flushed is None:
+                self._flushed = asyncio.Event()
+            await self._flushed.wait()
+            if self._flush_error is not None and self._durable < target:
+                raise self._flush_error
+
+    async def run(self, before_flush=None):
+        """Flush dirty users in the background until cancelled.
+
+        ``before_flush()`` is awaited before every batch, so stores kept
+        alongside the users (catalog, leaderboards) are persisted with them.
+        """
+        self._wakeup = asyncio.Event()
+        self.write_behind = True
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    if before_flush is not None:
+                        await before_flush()
+                    await self.aflush()
+                except Exception as e:
+                    print(f"❌ Błąd zapisu użytkowników: {e}")
+        finally:
+            self.write_behind = False
+            self._wakeup = None
+            self.checkpoint()
+            self._notify_flushed(None)
+
+
+USER_STORE_BACKENDS = {
+    "json": JsonUserStore,
+    "sqlite": SqliteUserStore,
+}
+
+
+def migrate_json_to_sqlite(json_path: Path, db_path: Path, *, force: bool = False, prepare=None) -> int:
+    """Copy all accounts from ``json_path`` into the SQLite database.
+
+    Does nothing when the database already holds users unless ``force`` is set.
+    ``prepare(users)`` may convert the loaded accounts before they are written.
+    Returns the number of migrated accounts.
+    """
+    store = SqliteUserStore(db_path)
+    try:
+        if not force and not store.is_empty():
+            return 0
+        data = JsonUserStore(json_path).load_all()
+        if data:
+            if prepare is not None:
+                prepare(data)
+            store.save_all(data)
+        return len(data)
+    finally:
+        store.close()
+
+
+def open_user_store(backend: str, json_path: Path, db_path: Path, *, prepare=None) -> UserStore:
+    """Create the configured backend, migrating JSON data on first SQLite use."""
+    if backend not in USER_STORE_BACKENDS:
+        raise ValueError(f"Unknown user store backend: {backend}")
+    if backend == "json":
+        return JsonUserStore(json_path)
+    if Path(json_path).exists():
+        migrate_json_to_sqlite(json_path, db_path, prepare=prepare)
+    return SqliteUserStore(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate users.json into the SQLite user store")
+    parser.add_argument("--json", default=Path(__file__).resolve().parent / "users.json", type=Path)
+    parser.add_argument("--db", default=Path(__file__).resolve().parent / "users.db", type=Path)
+    parser.add_argument("--catalog", default=Path(__file__).resolve().parent / "card_catalog.json", type=Path)
+    parser.add_argument("--force", action="store_true", help="Overwrite accounts already in the database")
+    args = parser.parse_args()
+    from catalog import CardCatalog, migrate_users
+
+    catalog = CardCatalog(args.catalog)
+
+    def prepare(users):
+        # Card metadata goes to the shared catalog before users are written
+        migrate_users(users, catalog)
+        if catalog.dirty:
+            catalog.save()
+
+    count = migrate_json_to_sqlite(args.json, args.db, force=args.force, prepare=prepare)
+    print(f"Migrated {count} users")
+
+
+if __name__ == "__main__":
+    main()
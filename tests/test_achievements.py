@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from achievements import add_cards, missing_numbers, owned_numbers, remove_cards, set_owned
+from catalog import CardCatalog, card_number
+
+
+def make_user(catalog, card_ids):
+    user = {"cards": {}}
+    for card_id in card_ids:
+        add_cards(user, catalog, card_id)
+    return user
+
+
+def test_prefixed_numbers_are_not_plain_numbers():
+    assert card_number("sv1-023") == 23
+    assert card_number("swsh12tg-TG05") is None
+    assert card_number("swsh12pt5gg-GG01") is None
+    assert card_number("g1-RC1") is None
+
+
+def test_trainer_gallery_set_counts_every_card(tmp_path):
+    catalog = CardCatalog(tmp_path / "catalog.json")
+    user = make_user(catalog, [f"swsh12tg-TG{n:02d}" for n in range(1, 31)] + ["swsh12tg-TG05"])
+
+    assert set_owned(user, catalog, "swsh12tg") == 30
+    assert owned_numbers(user, catalog, "swsh12tg") == []
+
+
+def test_prefixed_cards_do_not_collide_with_plain_numbers(tmp_path):
+    catalog = CardCatalog(tmp_path / "catalog.json")
+    user = make_user(catalog, ["g1-1", "g1-2", "g1-RC1", "g1-RC2", "swsh12pt5gg-GG01"])
+
+    assert set_owned(user, catalog, "g1") == 4
+    assert owned_numbers(user, catalog, "g1") == [1, 2]
+    assert missing_numbers(user, catalog, "g1", 4) == [3, 4]
+    assert set_owned(user, catalog, "swsh12pt5gg") == 1
+
+    remove_cards(user, catalog, "g1-RC1")
+    assert set_owned(user, catalog, "g1") == 3
+    assert owned_numbers(user, catalog, "g1") == [1, 2]
@@ -0,0 +1,115 @@
+import math
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from alias import AliasTable
+from booster import IR_SLOTS, RARE_SLOTS, BoosterEngine
+from catalog import CardCatalog
+
+PACKS = 20000
+RARITY_SIZES = {
+    "Common": 12,
+    "Uncommon": 8,
+    "Rare": 5,
+    "Double Rare": 3,
+    "Ultra Rare": 2,
+    "Illustration Rare": 3,
+    "Special Illustration Rare": 2,
+    "Hyper Rare": 1,
+}
+
+
+def make_engine(tmp_path):
+    catalog = CardCatalog(tmp_path / "card_catalog.json")
+    rarities = {}
+    n = 0
+    for rarity, size in RARITY_SIZES.items():
+        cards = []
+        for _ in range(size):
+            n += 1
+            cards.append({"id": f"t1-{n}", "name": f"Card {n}", "rarity": rarity,
+                          "tcgplayer": {"prices": {"normal": {"market": n / 10}}}})
+        rarities[rarity] = cards
+    catalog.index_set("t1", rarities)
+    return BoosterEngine(catalog), catalog
+
+
+def assert_close(observed: float, expected: float, trials: int, sigmas: float = 5.0):
+    """``observed`` and ``expected`` are frequencies per trial."""
+    sd = math.sqrt(max(expected * (1 - min(expected, 1)), 1e-9) / trials)
+    assert abs(observed - expected) <= sigmas * sd + 1e-9, (observed, expected)
+
+
+def assert_same_rate(a: float, b: float, trials: int, sigmas: float = 6.0):
+    """Mean copies per pack ``a`` and ``b`` from two independent runs agree."""
+    # Poisson bound on the variance of the difference of two means
+    sd = math.sqrt((a + b) / trials)
+    assert abs(a - b) <= sigmas * sd + 1e-9, (a, b)
+
+
+def test_alias_table_matches_weights():
+    weights = [0.5, 0.3, 0.15, 0.05, 0.0]
+    table = AliasTable("abcde", weights)
+    rng = random.Random(7)
+    many = Counter(table.sample_many(100000, rng))
+    single = Counter(table.sample(rng) for _ in range(100000))
+    for item, weight in zip("abcde", weights):
+        assert_close(many[item] / 100000, weight, 100000)
+        assert_close(single[item] / 100000, weight, 100000)
+    assert many["e"] == single["e"] == 0
+
+
+def test_alias_table_rejects_empty_weights():
+    with pytest.raises(ValueError):
+        AliasTable("ab", [0, 0])
+    with pytest.raises(ValueError):
+        AliasTable("ab", [1])
+
+
+def test_slot_sampler_matches_slot_outcomes(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    for slots in (RARE_SLOTS, IR_SLOTS):
+        for boost in (False, True):
+            rarities, weights = engine.slot_outcomes("t1", slots, boost)
+            assert sum(weights) == pytest.approx(1.0)
+            drawn = Counter(engine.sampler("t1", slots, boost).sample_many(50000, random.Random(3)))
+            for rarity, weight in zip(rarities, weights):
+                assert_close(drawn[rarity] / 50000, weight, 50000)
+
+
+@pytest.mark.parametrize("boost", [False, True])
+def test_draw_bulk_matches_per_pack_draw(tmp_path, boost):
+    engine, catalog = make_engine(tmp_path)
+    rng = random.Random(11)
+    single = Counter()
+    for _ in range(PACKS):
+        single.update(c["id"] for c in engine.draw("t1", boost=boost, rng=rng))
+    bulk = engine.draw_bulk("t1", PACKS, boosted=PACKS if boost else 0, rng=random.Random(12))
+
+    assert abs(sum(bulk.values()) - sum(single.values())) / PACKS < 0.05
+    by_rarity = {}
+    for counts in (single, bulk):
+        totals = Counter()
+        for cid, n in counts.items():
+            totals[catalog.rarity(cid)] += n
+        by_rarity[counts is bulk] = totals
+    for rarity in RARITY_SIZES:
+        assert_same_rate(by_rarity[True][rarity] / PACKS, by_rarity[False][rarity] / PACKS, PACKS)
+    # Cards of one rarity are equally likely in both paths
+    for cid in ("t1-1", "t1-13", "t1-21", "t1-36"):
+        assert_same_rate(bulk[cid] / PACKS, single[cid] / PACKS, PACKS)
+
+
+def test_draw_is_reproducible_from_the_seed(tmp_path):
+    engine, _ = make_engine(tmp_path)
+    first = [c["id"] for c in engine.draw("t1", rng=random.Random(5))]
+    again = [c["id"] for c in engine.draw("t1", rng=random.Random(5))]
+    assert first == again
+    assert engine.draw("missing", rng=random.Random(5)) is None
+    assert engine.draw_bulk("missing", 3) is None
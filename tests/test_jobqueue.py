@@ -0,0 +1,97 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jobqueue import QueueFull, ShardedQueue
+
+
+async def noop(item):
+    pass
+
+
+def test_queue_full_per_shard_and_per_user():
+    async def run():
+        queue = ShardedQueue(noop, workers=1, max_depth=3, per_key=2)
+        assert queue.put("a", 1) == 1
+        assert queue.put("a", 2) == 2
+        with pytest.raises(QueueFull) as user_full:
+            queue.put("a", 3)
+        assert user_full.value.reason == "user"
+        assert queue.put("b", 4) == 3
+        with pytest.raises(QueueFull) as queue_full:
+            queue.put("c", 5)
+        assert queue_full.value.reason == "queue"
+        assert queue.rejected == 2
+
+    asyncio.run(run())
+
+
+def test_eta_counts_jobs_ahead_in_the_shard():
+    async def run():
+        queue = ShardedQueue(noop, workers=1, max_depth=2)
+        assert queue.eta("a") == 0
+        queue.put("a", 1)
+        queue.put("b", 2)
+        queue.service_times.extend([2.0, 4.0])
+        with pytest.raises(QueueFull) as full:
+            queue.put("c", 3)
+        assert full.value.eta == pytest.approx(6.0)
+
+    asyncio.run(run())
+
+
+def test_sweep_expires_jobs_behind_a_slow_shard():
+    async def run():
+        expired = []
+        done = []
+        release = asyncio.Event()
+
+        async def handler(item):
+            if item == "slow":
+                await release.wait()
+            done.append(item)
+
+        async def on_expired(item):
+            expired.append(item)
+
+        queue = ShardedQueue(handler, workers=1, deadline=0.05, sweep_interval=0.01, on_expired=on_expired)
+        runner = asyncio.create_task(queue.run())
+        queue.put("a", "slow")
+        await asyncio.sleep(0.01)
+        queue.put("b", "waiting")
+        await asyncio.sleep(0.15)
+        # Expired while the worker was still busy with the slow job
+        assert expired == ["waiting"]
+        assert queue.depth() == 0
+        assert queue.put("b", "again") == 2
+        release.set()
+        await asyncio.sleep(0.02)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        assert done == ["slow", "again"]
+        assert queue.expired == 1
+
+    asyncio.run(run())
+
+
+def test_failed_jobs_are_logged(caplog):
+    async def run():
+        async def handler(item):
+            raise RuntimeError("boom")
+
+        queue = ShardedQueue(handler, workers=1)
+        runner = asyncio.create_task(queue.run())
+        queue.put("a", 1)
+        await asyncio.sleep(0.01)
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.failed == 1
+    assert "Queued job of a failed" in caplog.text
+    assert "boom" in caplog.text
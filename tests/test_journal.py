@@ -0,0 +1,108 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from journal import JobJournal
+
+
+def make_journal(path, **kwargs):
+    writes = []
+
+    async def write(fn, *args):
+        writes.append(fn.__name__)
+        return fn(*args)
+
+    return JobJournal(path, write=write, **kwargs), writes
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_load_replays_unfinished_jobs(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+
+    async def run():
+        journal, _ = make_journal(path)
+        await journal.enqueued("a", "1", "sv1")
+        await journal.drawn("a", ["sv1-5", "sv1-17"])
+        await journal.enqueued("b", "2", "sv2", count=40, boosts=2)
+        await journal.drawn("b", {"sv2-1": 3})
+        await journal.enqueued("c", "3", "sv3")
+        journal.claim("c")
+        await journal.settled("c", "refunded")
+        await journal.enqueued("d", "4", "sv4")
+
+    asyncio.run(run())
+    with path.open("a") as f:
+        f.write('{"j": "d", "e": "cred')  # torn last line
+
+    journal, _ = make_journal(path)
+    assert journal.load() == {
+        "a": {"u": "1", "s": "sv1", "c": ["sv1-5", "sv1-17"]},
+        "b": {"u": "2", "s": "sv2", "n": 40, "r": 2, "c": {"sv2-1": 3}},
+        "d": {"u": "4", "s": "sv4"},
+    }
+
+
+def test_entries_logged_together_share_one_write(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    barriers = []
+
+    async def barrier():
+        barriers.append(1)
+
+    async def run():
+        journal, writes = make_journal(path, barrier=barrier)
+        await asyncio.gather(*(journal.enqueued(f"j{n}", "1", "sv1") for n in range(20)))
+        return writes
+
+    writes = asyncio.run(run())
+    assert writes == ["_append"]
+    assert len(barriers) == 1
+    assert [e["j"] for e in read_lines(path)] == [f"j{n}" for n in range(20)]
+
+
+def test_no_truncation_while_a_claimed_job_is_unsettled(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+
+    async def run():
+        journal, _ = make_journal(path, compact_after=3)
+        await journal.enqueued("a", "1", "sv1")
+        await journal.drawn("a", ["sv1-5"])
+        job = journal.claim("a")
+        assert job == {"u": "1", "s": "sv1", "c": ["sv1-5"]}
+        assert journal.claim("a") is None
+        # Another job settles past the threshold while "a" is still claimed
+        await journal.enqueued("b", "2", "sv2")
+        journal.claim("b")
+        await journal.settled("b", "refunded")
+        assert JobJournal(path, write=None).load() == {"a": job}
+
+        await journal.compact()
+        assert JobJournal(path, write=None).load() == {"a": job}
+
+        await journal.settled("a", "credited")
+        assert journal.claimed == {}
+
+    asyncio.run(run())
+    assert path.read_text() == ""
+
+
+def test_compact_keeps_only_unfinished_jobs(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+
+    async def run():
+        journal, _ = make_journal(path)
+        for n in range(5):
+            await journal.enqueued(f"j{n}", "1", "sv1")
+            journal.claim(f"j{n}")
+            await journal.settled(f"j{n}", "credited")
+        await journal.enqueued("open", "1", "sv1", boosts=1)
+        await journal.compact()
+
+    asyncio.run(run())
+    assert read_lines(path) == [{"j": "open", "e": "enqueued", "u": "1", "s": "sv1", "r": 1}]
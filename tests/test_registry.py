@@ -0,0 +1,51 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from registry import SetRegistry
+
+
+def test_duplicated_ptcgo_code_keeps_main_set(tmp_path):
+    path = tmp_path / "sets.json"
+    sets = [
+        {"id": "swsh12pt5", "name": "Crown Zenith", "ptcgoCode": "CRZ", "series": "Sword & Shield"},
+        {"id": "swsh12pt5gg", "name": "Crown Zenith Galarian Gallery", "ptcgoCode": "CRZ", "series": "Sword & Shield"},
+    ]
+    path.write_text(json.dumps(sets))
+    registry = SetRegistry(path)
+    registry.load()
+
+    assert registry.by_ptcgo("crz")["id"] == "swsh12pt5"
+    assert registry.get("swsh12pt5gg")["name"] == "Crown Zenith Galarian Gallery"
+    assert len(registry.series["Sword & Shield"]) == 2
+
+
+def test_shared_ptcgo_codes_ignore_file_order(tmp_path):
+    path = tmp_path / "sets.json"
+    sets = [
+        {"id": "swsh12pt5gg", "ptcgoCode": "CRZ"},
+        {"id": "swsh12pt5", "ptcgoCode": "CRZ"},
+        {"id": "swsh12tg", "ptcgoCode": "SIT"},
+        {"id": "swsh12", "ptcgoCode": "SIT"},
+        {"id": "cel25c", "ptcgoCode": "CEL"},
+        {"id": "cel25", "ptcgoCode": "CEL"},
+        {"id": "swsh45sv", "ptcgoCode": "SHF", "printedTotal": 122},
+        {"id": "swsh45", "ptcgoCode": "SHF", "printedTotal": 72},
+        {"id": "sma", "ptcgoCode": "HIF", "printedTotal": 94},
+        {"id": "sm115", "ptcgoCode": "HIF", "printedTotal": 68},
+    ]
+    expected = {"CRZ": "swsh12pt5", "SIT": "swsh12", "CEL": "cel25", "SHF": "swsh45", "HIF": "sm115"}
+    for order in (sets, sets[::-1]):
+        path.write_text(json.dumps(order))
+        registry = SetRegistry(path)
+        registry.load()
+        assert {code: registry.by_ptcgo(code)["id"] for code in expected} == expected
+
+
+def test_real_sets_file_main_sets():
+    registry = SetRegistry(Path(__file__).resolve().parent.parent / "sets.json")
+    registry.load()
+    for code, set_id in {"CRZ": "swsh12pt5", "LOR": "swsh11", "ASR": "swsh10", "BRS": "swsh9"}.items():
+        assert registry.by_ptcgo(code)["id"] == set_id
@@ -0,0 +1,101 @@
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import CardCatalog, migrate_users
+from storage import SqliteUserStore, migrate_json_to_sqlite
+
+
+def card_rows(path, uid):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT card_id, count FROM user_cards WHERE uid = ?", (uid,)))
+
+
+def card_writes(store):
+    writes = []
+    store._conn.set_trace_callback(
+        lambda sql: writes.append(sql) if "user_cards" in sql and not sql.startswith("SELECT") else None
+    )
+    return writes
+
+
+def test_only_changed_card_rows_are_written(tmp_path):
+    db = tmp_path / "users.db"
+    store = SqliteUserStore(db)
+    user = {"username": "ash", "money": 10, "cards": {"sv1-1": 1, "sv1-2": 2, "sv1-3": 1}}
+    store.save_user("1", user)
+    writes = card_writes(store)
+
+    user["money"] = 11
+    store.save_user("1", user)
+    assert writes == []
+
+    user["cards"]["sv1-2"] = 3  # changed
+    user["cards"]["sv1-4"] = 1  # added
+    del user["cards"]["sv1-1"]  # removed
+    user["cards"]["sv1-3"] = 0  # zero counts are not stored
+    store.save_user("1", user)
+    assert len(writes) == 4
+    assert card_rows(db, "1") == {"sv1-2": 3, "sv1-4": 1}
+    store.close()
+
+    reopened = SqliteUserStore(db)
+    loaded = reopened.load_user("1")
+    assert loaded["money"] == 11
+    assert loaded["cards"] == {"sv1-2": 3, "sv1-4": 1}
+    reopened.close()
+
+
+def test_save_after_reopen_diffs_against_the_database(tmp_path):
+    db = tmp_path / "users.db"
+    store = SqliteUserStore(db)
+    store.save_many({"1": {"cards": {"sv1-1": 1}}, "2": {"cards": {"sv2-1": 5}}})
+    store.close()
+
+    store = SqliteUserStore(db)
+    writes = card_writes(store)
+    store.save_many({"1": {"cards": {"sv1-1": 1, "sv1-9": 2}}, "2": {"cards": {}}})
+    assert len(writes) == 2
+    assert card_rows(db, "1") == {"sv1-1": 1, "sv1-9": 2}
+    assert card_rows(db, "2") == {}
+
+    store.save_all({"1": {"cards": {"sv1-9": 2}}})
+    assert store.load_all() == {"1": {"cards": {"sv1-9": 2}}}
+    assert card_rows(db, "2") == {}
+    store.close()
+
+
+def test_json_to_sqlite_migration_round_trip(tmp_path):
+    users = {
+        "1": {
+            "username": "ash",
+            "money": 120,
+            "cards": [
+                {"id": "sv1-5", "name": "Pikachu", "price_usd": 1.5, "img_url": "p.png", "rarity": "Common"},
+                {"id": "sv1-5", "name": "Pikachu", "price_usd": 1.5, "img_url": "p.png", "rarity": "Common"},
+                {"id": "swsh12tg-TG05", "name": "Gardevoir", "price_usd": 20.0},
+            ],
+        },
+        "2": {"username": "misty", "cards": {"sv2-1": 3}},
+    }
+    json_path = tmp_path / "users.json"
+    json_path.write_text(json.dumps(users))
+    catalog = CardCatalog(tmp_path / "card_catalog.json")
+
+    count = migrate_json_to_sqlite(json_path, tmp_path / "users.db", prepare=lambda data: migrate_users(data, catalog))
+    assert count == 2
+    # An existing database is left alone unless forced
+    assert migrate_json_to_sqlite(json_path, tmp_path / "users.db") == 0
+
+    store = SqliteUserStore(tmp_path / "users.db")
+    loaded = store.load_all()
+    store.close()
+    assert loaded["1"]["username"] == "ash"
+    assert loaded["1"]["money"] == 120
+    assert loaded["1"]["cards"] == {"sv1-5": 2, "swsh12tg-TG05": 1}
+    assert loaded["2"]["cards"] == {"sv2-1": 3}
+    assert catalog.info("sv1-5")["name"] == "Pikachu"
+    assert catalog.price("swsh12tg-TG05") == 20.0